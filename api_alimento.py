@@ -1,10 +1,37 @@
+import asyncio
+import codecs
+import contextvars
+import csv
+import hashlib
+import hmac
+import math
+import orjson
 import sqlite3
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
-import requests
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Header, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
+from starlette.requests import ClientDisconnect
+from typing import Callable, Dict, Iterator, List, Optional
+from datetime import date, datetime
+import httpx
+from jose import JWTError, jwt
 import os
+from controller.API.metricas import (
+    BUCKETS_LATENCIA, TIPO_CONTENIDO as TIPO_CONTENIDO_METRICAS,
+    MetricasHTTP, MiddlewareMetricas, RegistroMetricas, registrar_consulta_db,
+)
+# La tabla sin conexión y la API comparten la misma clave normalizada de cada alimento
+from tabla_composicion import TablaComposicion, normalizar_nombre
 from dotenv import load_dotenv
 
 # --- Configuración Inicial ---
@@ -12,65 +39,1264 @@ load_dotenv()
 app = FastAPI(
     title="API Persistente de Alimentos",
     description="Gestiona alimentos personalizados y el registro de consumo diario de forma persistente.",
-    version="4.0.0"
+    version="4.0.0",
+    # orjson serializa listas grandes (historial, catálogo) varias veces más rápido que json
+    default_response_class=ORJSONResponse,
 )
 
 # --- Constantes ---
 DB_FILE = "alimentos_app.db" # Renombramos para mayor claridad
 EDAMAM_APP_ID = os.getenv("EDAMAM_APP_ID")  
 EDAMAM_APP_KEY = os.getenv("EDAMAM_APP_KEY")
+EDAMAM_URL = os.getenv("EDAMAM_URL", "https://api.edamam.com/api/food-database/v2/parser")
+EDAMAM_MAX_CONCURRENTES = int(os.getenv("EDAMAM_MAX_CONCURRENTES", "8"))  # Consultas simultáneas a Edamam
+EDAMAM_TIMEOUT = float(os.getenv("EDAMAM_TIMEOUT", "5"))  # Tiempo máximo por consulta (s)
+EDAMAM_ESPERA_MAX = float(os.getenv("EDAMAM_ESPERA_MAX", "2"))  # Espera máxima por un cupo libre (s)
+DB_POOL_SIZE = int(os.getenv("ALIMENTOS_DB_POOL_SIZE", "16"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("ALIMENTOS_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHED_STATEMENTS = 256  # Sentencias preparadas que SQLite mantiene por conexión
+ESCRITURA_VENTANA_MS = float(os.getenv("ALIMENTOS_ESCRITURA_VENTANA_MS", "2"))  # Espera para juntar escrituras en un mismo COMMIT
+ESCRITURA_MAX_GRUPO = 256  # Escrituras máximas por transacción del escritor
+MAX_CONSUMOS_POR_LOTE = 1000
+MAX_ALIMENTOS_POR_CONSULTA = 200
+SQLITE_MAX_PARAMETROS = 500  # Tamaño de cada tramo en las consultas con IN (...)
+BUSQUEDA_LIMITE_MAX = 100
+HISTORIAL_LIMITE_MAX = 5000
+HISTORIAL_FILAS_POR_LECTURA = 500  # Filas que se leen del cursor en cada vuelta del streaming
+ESTADISTICAS_MAX_DIAS = 3660  # Rango máximo de /estadisticas (~10 años)
+GZIP_TAMANO_MINIMO = int(os.getenv("ALIMENTOS_GZIP_TAMANO_MINIMO", "1024"))  # Bytes; las respuestas menores van sin comprimir
+GZIP_NIVEL = 5  # El 9 por defecto de GZipMiddleware reduce apenas un 5% más y tarda ~4 veces más
+# Importación masiva de consumos
+IMPORTACION_TAMANO_LOTE = int(os.getenv("ALIMENTOS_IMPORTACION_TAMANO_LOTE", "2000"))  # Filas por transacción
+IMPORTACION_TAMANO_LOTE_MAX = 50000
+IMPORTACION_MAX_ERRORES = 1000  # Errores por fila que se detallan; del resto solo se cuenta cuántos hubo
+IMPORTACION_MAX_REGISTRO = 64 * 1024  # Caracteres máximos de una línea / registro
+IMPORTACIONES_RECORDADAS = 50  # Importaciones cuyo progreso se puede seguir consultando
+# Flujo de eventos de cambio (/eventos)
+EVENTOS_KEEPALIVE = 15  # Segundos sin eventos tras los que se envía un comentario para mantener viva la conexión
+EVENTOS_COLA_MAX = 256  # Eventos pendientes por cliente antes de pedirle que se resincronice
+EVENTOS_RECIENTES = 1000  # Eventos que se guardan para reenviar a quien se reconecta
+EVENTOS_REINTENTO_MS = 3000  # Espera que el navegador / cliente SSE usa antes de reconectar
+# Identidad de quien registra consumos: los tokens de la API de usuarios se firman con esta clave
+# (sin valor por defecto: la API no arranca si falta, ver startup_event)
+JWT_SECRET_KEY = os.getenv("Key_JWT")
+JWT_ALGORITHM = "HS256"
+# Token para los endpoints /admin (encabezado X-Admin-Token); sin él esos endpoints quedan deshabilitados
+ADMIN_TOKEN = os.getenv("ALIMENTOS_ADMIN_TOKEN")
+# Dueño de los consumos anteriores a la columna `usuario`; si hay alguno y no está definido, la API no arranca
+USUARIO_LEGADO = os.getenv("ALIMENTOS_USUARIO_LEGADO", "")
+# Tabla de composición sin conexión (se genera con `python tabla_composicion.py importar ...`)
+TABLA_COMPOSICION_FILE = os.getenv("ALIMENTOS_TABLA_COMPOSICION", "composicion_alimentos.bin")
+# Caché persistente de Edamam (segundos)
+EDAMAM_CACHE_TTL_ACIERTO = int(os.getenv("EDAMAM_CACHE_TTL_ACIERTO", str(7 * 24 * 3600)))
+EDAMAM_CACHE_TTL_FALLO = int(os.getenv("EDAMAM_CACHE_TTL_FALLO", str(3600)))
+EDAMAM_CACHE_VENTANA_STALE = int(os.getenv("EDAMAM_CACHE_VENTANA_STALE", str(24 * 3600)))
+
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_TAMANO_MINIMO, compresslevel=GZIP_NIVEL)
+
+# --- Métricas (Prometheus, en /metrics) ---
+registro_metricas = RegistroMetricas()
+metricas_http = MetricasHTTP(registro_metricas)
+# Se agrega después de GZip para quedar por fuera: la latencia incluye la compresión
+app.add_middleware(MiddlewareMetricas, metricas=metricas_http)
+metrica_edamam_duracion = registro_metricas.histograma(
+    "edamam_request_duration_seconds", "Duración de las consultas a Edamam, por resultado.",
+    ("resultado",), BUCKETS_LATENCIA)
+metrica_edamam_errores = registro_metricas.contador(
+    "edamam_errors_total", "Consultas a Edamam fallidas, por tipo de error.", ("tipo",))
+registro_metricas.indicador(
+    "db_pool_connections_in_use", "Conexiones SQLite prestadas en este momento.",
+    lambda: gestor_db.estadisticas()["en_uso"])
+registro_metricas.indicador(
+    "db_write_queue_depth", "Escrituras esperando al escritor de la base.",
+    lambda: escritor_db.pendientes())
+metrica_grupo_escritura = registro_metricas.histograma(
+    "db_write_group_size", "Escrituras confirmadas en cada COMMIT del escritor.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+registro_metricas.indicador(
+    "edamam_requests_in_flight", "Consultas a Edamam en curso (ya agrupadas).",
+    lambda: len(cliente_edamam._en_vuelo))
+metrica_composicion = registro_metricas.contador(
+    "composicion_lookups_total", "Búsquedas en la tabla de composición sin conexión, por resultado.", ("resultado",))
+registro_metricas.indicador(
+    "composicion_alimentos", "Alimentos en la tabla de composición cargada (0 si no hay).",
+    lambda: len(tabla_composicion) if tabla_composicion is not None else 0)
+registro_metricas.indicador(
+    "eventos_conexiones", "Clientes conectados a /eventos.",
+    lambda: canal_eventos.estadisticas()["conexiones"])
+
+# --- Gestor de Conexiones SQLite ---
+class ConexionMedida(sqlite3.Connection):
+    """
+    Conexión que mide cada execute/executemany para las métricas por request.
+    El tiempo cubre la ejecución de la sentencia (en las agregaciones, todo el
+    cálculo); no la lectura posterior de filas con fetch*.
+    """
+    def execute(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            registrar_consulta_db(time.perf_counter() - inicio)
+
+    def executemany(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            registrar_consulta_db(time.perf_counter() - inicio)
+
+class GestorConexiones:
+    """
+    Pool de conexiones SQLite reutilizables para alimentos_app.db.
+
+    Cada conexión se abre una sola vez (modo WAL, busy_timeout y caché de
+    sentencias preparadas) y se presta a un único request a la vez. FastAPI
+    puede ejecutar la apertura y el cierre de una dependencia en hilos
+    distintos del threadpool, por eso las conexiones se piden y devuelven
+    al pool en vez de quedar atadas a un threading.local.
+    """
+    def __init__(self, db_file: str, tamano: int = DB_POOL_SIZE, busy_timeout_ms: int = DB_BUSY_TIMEOUT_MS):
+        self.db_file = db_file
+        self.tamano = tamano
+        self.busy_timeout_ms = busy_timeout_ms
+        # LIFO: la conexión devuelta más recientemente es la siguiente en usarse
+        self._libres: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._creadas = 0
+        self._en_uso = 0
+        self._stats = {
+            "prestamos": 0,
+            "reutilizaciones": 0,
+            "esperas_pool": 0,
+            "espera_pool_total_ms": 0.0,
+            "transacciones": 0,
+            "esperas_bloqueo": 0,
+            "espera_bloqueo_total_ms": 0.0,
+            "espera_bloqueo_max_ms": 0.0,
+            "bloqueos_agotados": 0,
+        }
+
+    def _abrir(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,  # Las transacciones se abren explícitamente en transaccion()
+            check_same_thread=False,  # Cada conexión la usa un solo request a la vez
+            cached_statements=DB_CACHED_STATEMENTS,
+            factory=ConexionMedida,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def obtener(self) -> sqlite3.Connection:
+        """Presta una conexión del pool, abriendo una nueva si aún no se llega al tamaño máximo."""
+        crear = False
+        with self._lock:
+            self._stats["prestamos"] += 1
+            try:
+                conn = self._libres.get_nowait()
+                self._stats["reutilizaciones"] += 1
+            except queue.Empty:
+                conn = None
+                if self._creadas < self.tamano:
+                    self._creadas += 1
+                    crear = True
+            if conn is not None or crear:
+                self._en_uso += 1
+
+        if conn is not None:
+            return conn
+        if crear:
+            try:
+                return self._abrir()
+            except Exception:
+                with self._lock:
+                    self._creadas -= 1
+                    self._en_uso -= 1
+                raise
+
+        # Pool agotado: esperamos a que otro request devuelva su conexión
+        inicio = time.perf_counter()
+        try:
+            conn = self._libres.get(timeout=self.busy_timeout_ms / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError("No hay conexiones libres en el pool de la base de datos.")
+        espera_ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self._en_uso += 1
+            self._stats["reutilizaciones"] += 1
+            self._stats["esperas_pool"] += 1
+            self._stats["espera_pool_total_ms"] += espera_ms
+        return conn
+
+    def devolver(self, conn: sqlite3.Connection):
+        """Devuelve la conexión al pool, descartando cualquier transacción que haya quedado abierta."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._en_uso -= 1
+        self._libres.put(conn)
+
+    @contextmanager
+    def conexion(self) -> Iterator[sqlite3.Connection]:
+        """Uso fuera de los endpoints: `with gestor_db.conexion() as conn: ...`"""
+        conn = self.obtener()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    @contextmanager
+    def transaccion(self, conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+        """
+        Abre una transacción de escritura con BEGIN IMMEDIATE y mide cuánto se
+        esperó por el bloqueo de escritura. Hace COMMIT al salir o ROLLBACK si hubo error.
+        """
+        inicio = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            self._registrar_bloqueo((time.perf_counter() - inicio) * 1000, agotado=True)
+            raise
+        self._registrar_bloqueo((time.perf_counter() - inicio) * 1000)
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def _registrar_bloqueo(self, espera_ms: float, agotado: bool = False):
+        with self._lock:
+            self._stats["transacciones"] += 1
+            if agotado:
+                self._stats["bloqueos_agotados"] += 1
+            # Adquirir un bloqueo libre cuesta microsegundos; más de 1 ms implica que hubo espera
+            if espera_ms >= 1.0:
+                self._stats["esperas_bloqueo"] += 1
+                self._stats["espera_bloqueo_total_ms"] += espera_ms
+                self._stats["espera_bloqueo_max_ms"] = max(self._stats["espera_bloqueo_max_ms"], espera_ms)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "tamano_max": self.tamano,
+                "conexiones_abiertas": self._creadas,
+                "en_uso": self._en_uso,
+                "libres": self._libres.qsize(),
+            })
+        for clave in ("espera_pool_total_ms", "espera_bloqueo_total_ms", "espera_bloqueo_max_ms"):
+            stats[clave] = round(stats[clave], 3)
+        return stats
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres (se llama al apagar la API)."""
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._creadas -= 1
+
+gestor_db = GestorConexiones(DB_FILE)
+
+# Dependencia de FastAPI que presta una conexión durante el request
+def get_db() -> Iterator[sqlite3.Connection]:
+    conn = gestor_db.obtener()
+    try:
+        yield conn
+    finally:
+        gestor_db.devolver(conn)
+
+async def ejecutar_en_db(funcion: Callable, *args):
+    """
+    Para endpoints async: ejecuta `funcion(conn, *args)` en el threadpool con una
+    conexión del pool, sin bloquear el event loop ni retener la conexión mientras
+    se espera a servicios externos.
+    """
+    def _tarea():
+        with gestor_db.conexion() as conn:
+            return funcion(conn, *args)
+    return await run_in_threadpool(_tarea)
+
+# --- Escritor único con commit agrupado ---
+class EscritorDB:
+    """
+    Hilo dedicado por el que pasan todas las escrituras de la API, con su propia conexión.
+
+    Varios hilos escribiendo cada uno con su conexión compiten por el único bloqueo de
+    escritura de SQLite (y terminan en "database is locked"), y cada uno paga su COMMIT.
+    Aquí las escrituras se encolan: el hilo toma las que llegan dentro de una ventana de
+    unos milisegundos y las ejecuta en una sola transacción, cada una dentro de su
+    SAVEPOINT para que el error de una no deshaga las demás. Cada llamador recibe su
+    propio resultado (o excepción) una vez confirmado el COMMIT del grupo.
+
+    Las lecturas siguen usando las conexiones del pool en paralelo (WAL). Con varios
+    procesos de uvicorn cada uno tiene su escritor; entre procesos sigue mediando busy_timeout.
+    """
+    _FIN = object()
+
+    def __init__(self, gestor: GestorConexiones, ventana_ms: float = ESCRITURA_VENTANA_MS,
+                 max_grupo: int = ESCRITURA_MAX_GRUPO):
+        self.gestor = gestor
+        self.ventana = ventana_ms / 1000
+        self.max_grupo = max_grupo
+        self._cola: "queue.Queue" = queue.Queue()
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {"escrituras": 0, "errores": 0, "grupos": 0, "grupo_max": 0, "commits_fallidos": 0}
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="escritor-db", daemon=True)
+                self._hilo.start()
+
+    def detener(self, timeout: float = 10):
+        """Termina lo que ya está encolado y detiene el hilo."""
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+        if hilo is not None:
+            self._cola.put(self._FIN)
+            hilo.join(timeout)
+
+    def enviar(self, funcion: Callable, *args) -> Future:
+        """
+        Encola `funcion(conn, *args)`, que corre dentro de la transacción del grupo (no debe
+        abrir ni cerrar transacciones). Corre con el contexto del llamador, así sus
+        consultas cuentan en las métricas del request.
+        """
+        hilo = self._hilo
+        if hilo is None or not hilo.is_alive():
+            self.iniciar()
+        futuro = Future()
+        self._cola.put((futuro, contextvars.copy_context(), funcion, args))
+        return futuro
+
+    def ejecutar(self, funcion: Callable, *args):
+        """Para código síncrono (endpoints en el threadpool): espera el resultado de la escritura."""
+        return self.enviar(funcion, *args).result()
+
+    async def ejecutar_async(self, funcion: Callable, *args):
+        """Para endpoints async: espera la escritura sin bloquear el event loop."""
+        return await asyncio.wrap_future(self.enviar(funcion, *args))
+
+    def _tomar_grupo(self, primera) -> tuple:
+        """Junta las escrituras que llegan hasta `ventana` después de la primera. Devuelve (grupo, fin)."""
+        grupo = [primera]
+        limite = time.perf_counter() + self.ventana
+        while len(grupo) < self.max_grupo:
+            restante = limite - time.perf_counter()
+            try:
+                tarea = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if tarea is self._FIN:
+                return grupo, True
+            grupo.append(tarea)
+        return grupo, False
+
+    def _bucle(self):
+        conn = self.gestor._abrir()
+        try:
+            fin = False
+            while not fin:
+                primera = self._cola.get()
+                if primera is self._FIN:
+                    break
+                grupo, fin = self._tomar_grupo(primera)
+                self._ejecutar_grupo(conn, grupo)
+        finally:
+            conn.close()
+
+    def _ejecutar_grupo(self, conn: sqlite3.Connection, grupo: list):
+        resultados = []
+        try:
+            with self.gestor.transaccion(conn):
+                for futuro, contexto, funcion, args in grupo:
+                    if not futuro.set_running_or_notify_cancel():
+                        resultados.append(None)
+                        continue
+                    conn.execute("SAVEPOINT escritura")
+                    try:
+                        resultado = (True, contexto.run(funcion, conn, *args))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO escritura")
+                        resultado = (False, e)
+                    conn.execute("RELEASE escritura")
+                    resultados.append(resultado)
+        except Exception as e:
+            # Falló BEGIN o COMMIT: nada del grupo quedó guardado
+            with self._lock:
+                self._stats["commits_fallidos"] += 1
+            for futuro, *_ in grupo:
+                if futuro.running() or futuro.set_running_or_notify_cancel():
+                    futuro.set_exception(e)
+            return
+
+        errores = 0
+        for (futuro, *_), resultado in zip(grupo, resultados):
+            if resultado is None:
+                continue
+            if resultado[0]:
+                futuro.set_result(resultado[1])
+            else:
+                errores += 1
+                futuro.set_exception(resultado[1])
+        metrica_grupo_escritura.observar(len(grupo))
+        with self._lock:
+            self._stats["escrituras"] += len(grupo)
+            self._stats["errores"] += errores
+            self._stats["grupos"] += 1
+            self._stats["grupo_max"] = max(self._stats["grupo_max"], len(grupo))
+
+    def pendientes(self) -> int:
+        return self._cola.qsize()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["en_cola"] = self.pendientes()
+        stats["escrituras_por_commit"] = round(stats["escrituras"] / stats["grupos"], 2) if stats["grupos"] else 0.0
+        stats["ventana_ms"] = self.ventana * 1000
+        return stats
+
+escritor_db = EscritorDB(gestor_db)
+
+# --- Identidad de quien llama ---
+def usuario_actual(authorization: Optional[str] = Header(None)) -> str:
+    """
+    Usuario dueño de los consumos que se leen o escriben en la petición: el `sub` del
+    JWT emitido por la API de usuarios (misma clave de firma), enviado como
+    `Authorization: Bearer <token>`. Sin token, o con uno inválido o vencido, responde 401.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Se requiere un token de acceso.",
+                            headers={"WWW-Authenticate": "Bearer"})
+    esquema, _, token = authorization.partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Encabezado Authorization inválido.",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        usuario = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM]).get("sub")
+    except JWTError:
+        usuario = None
+    if not usuario:
+        raise HTTPException(status_code=401, detail="No se pudieron validar las credenciales.",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return usuario
+
+def requerir_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Protege los endpoints /admin (purgar o precalentar la caché de Edamam, reconstruir
+    resúmenes, estadísticas internas): exigen el encabezado X-Admin-Token igual a
+    ALIMENTOS_ADMIN_TOKEN. Si la variable no está definida responden 403 siempre.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Los endpoints de administración están deshabilitados (falta ALIMENTOS_ADMIN_TOKEN).")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Token de administración inválido.")
 
 # --- Lógica de Base de Datos del Servidor ---
 def init_db():
-    """Inicializa ambas tablas en la base de datos."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    # Tabla para alimentos personalizados
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS alimentos_personalizados (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nombre TEXT NOT NULL UNIQUE,
-        calorias_100gr REAL,
-        calorias_porcion REAL
+    """Inicializa ambas tablas en la base de datos y aplica las migraciones pendientes."""
+    with gestor_db.conexion() as conn, gestor_db.transaccion(conn):
+        cursor = conn.cursor()
+        # Tabla para alimentos personalizados
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS alimentos_personalizados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL UNIQUE,
+            calorias_100gr REAL,
+            calorias_porcion REAL,
+            nombre_norm TEXT
+        )
+        """)
+        # ¡NUEVO! Tabla para el consumo diario
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS consumo_diario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            fecha TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            cantidad REAL NOT NULL,
+            total_cal REAL NOT NULL,
+            usuario TEXT NOT NULL DEFAULT ''
+        )
+        """)
+        migrar_nombre_normalizado(conn)
+        crear_indice_busqueda(conn)
+        crear_sellos_cambio(conn)
+        migrar_columna_usuario(conn)
+        crear_resumen_diario(conn)
+        cache_edamam.crear_tabla(conn)
+
+def migrar_columna_usuario(conn: sqlite3.Connection):
+    """
+    Separa los consumos por usuario. En bases anteriores agrega la columna `usuario`,
+    asigna los consumos existentes a USUARIO_LEGADO y descarta los sellos por día
+    sin usuario. El índice (usuario, fecha, hora, id, ...) cubre las columnas que leen
+    el historial y el resumen, así que esas consultas no tocan la tabla.
+
+    Un consumo sin dueño (usuario '') no lo puede leer nadie, porque la identidad sale
+    del `sub` del JWT. Si hay alguno y ALIMENTOS_USUARIO_LEGADO no está definida, la API
+    no arranca (y la transacción deshace la columna agregada) en vez de esconderlos.
+    """
+    columnas = {fila["name"] for fila in conn.execute("PRAGMA table_info(consumo_diario)")}
+    if "usuario" not in columnas:
+        conn.execute("ALTER TABLE consumo_diario ADD COLUMN usuario TEXT NOT NULL DEFAULT ''")
+        conn.execute("DELETE FROM sellos_cambio WHERE clave LIKE 'dia:%'")
+    # También los que una versión anterior de esta migración dejó con usuario ''
+    fechas = [fila[0] for fila in conn.execute("SELECT DISTINCT fecha FROM consumo_diario WHERE usuario = ''")]
+    if fechas:
+        if not USUARIO_LEGADO:
+            raise RuntimeError(
+                "Hay consumos registrados antes de separarlos por usuario. Defina ALIMENTOS_USUARIO_LEGADO "
+                "con el nombre del usuario al que pertenecen y vuelva a iniciar la API."
+            )
+        conn.execute("UPDATE consumo_diario SET usuario = ? WHERE usuario = ''", (USUARIO_LEGADO,))
+        if "usuario" in columnas:
+            # resumen_diario ya está separado por usuario: se pasan esos días al dueño
+            conn.execute("DELETE FROM resumen_diario WHERE usuario = ''")
+            reconstruir_resumen_dias(conn, USUARIO_LEGADO, fechas)
+    conn.execute("DROP INDEX IF EXISTS idx_consumo_fecha_hora")
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_consumo_usuario_fecha_hora
+    ON consumo_diario (usuario, fecha, hora, id, nombre, cantidad, total_cal)
+    """)
+
+def migrar_nombre_normalizado(conn: sqlite3.Connection):
+    """
+    Agrega y rellena la columna `nombre_norm` en bases creadas antes de que existiera.
+    Si dos alimentos antiguos colisionan al normalizarse (p. ej. 'Plátano' y 'platano'),
+    solo el más antiguo recibe la clave; el resto queda en NULL y se informa por consola.
+    """
+    columnas = {fila["name"] for fila in conn.execute("PRAGMA table_info(alimentos_personalizados)")}
+    if "nombre_norm" not in columnas:
+        conn.execute("ALTER TABLE alimentos_personalizados ADD COLUMN nombre_norm TEXT")
+
+    usadas = {fila[0] for fila in conn.execute(
+        "SELECT nombre_norm FROM alimentos_personalizados WHERE nombre_norm IS NOT NULL"
+    )}
+    pendientes = conn.execute(
+        "SELECT id, nombre FROM alimentos_personalizados WHERE nombre_norm IS NULL ORDER BY id"
+    ).fetchall()
+    actualizaciones = []
+    for fila in pendientes:
+        clave = normalizar_nombre(fila["nombre"])
+        if clave in usadas:
+            print(f"ADVERTENCIA: '{fila['nombre']}' (id {fila['id']}) duplica a otro alimento al normalizarse; se omite.")
+            continue
+        usadas.add(clave)
+        actualizaciones.append((clave, fila["id"]))
+    conn.executemany("UPDATE alimentos_personalizados SET nombre_norm = ? WHERE id = ?", actualizaciones)
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_alimentos_nombre_norm ON alimentos_personalizados (nombre_norm)"
     )
+
+# Se desactiva si el SQLite instalado no trae FTS5; la búsqueda cae entonces a LIKE
+busqueda_fts_disponible = True
+
+def crear_indice_busqueda(conn: sqlite3.Connection):
+    """
+    Crea el índice FTS5 (tokenizador trigram) sobre `nombre_norm` y los triggers que
+    lo mantienen sincronizado con alimentos_personalizados. Si el índice no existía,
+    se reconstruye a partir de los alimentos ya guardados.
+    """
+    global busqueda_fts_disponible
+    existia = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alimentos_fts'"
+    ).fetchone() is not None
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS alimentos_fts USING fts5(
+            nombre_norm,
+            content='alimentos_personalizados',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        busqueda_fts_disponible = False
+        print(f"ADVERTENCIA: FTS5/trigram no disponible ({e}); la búsqueda usará LIKE.")
+        return
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS alimentos_fts_ai AFTER INSERT ON alimentos_personalizados BEGIN
+        INSERT INTO alimentos_fts (rowid, nombre_norm) VALUES (new.id, new.nombre_norm);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS alimentos_fts_ad AFTER DELETE ON alimentos_personalizados BEGIN
+        INSERT INTO alimentos_fts (alimentos_fts, rowid, nombre_norm) VALUES ('delete', old.id, old.nombre_norm);
+    END
     """)
-    # ¡NUEVO! Tabla para el consumo diario
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS consumo_diario (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nombre TEXT NOT NULL,
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS alimentos_fts_au AFTER UPDATE OF nombre_norm ON alimentos_personalizados BEGIN
+        INSERT INTO alimentos_fts (alimentos_fts, rowid, nombre_norm) VALUES ('delete', old.id, old.nombre_norm);
+        INSERT INTO alimentos_fts (rowid, nombre_norm) VALUES (new.id, new.nombre_norm);
+    END
+    """)
+    if not existia:
+        conn.execute("INSERT INTO alimentos_fts (alimentos_fts) VALUES ('rebuild')")
+
+def buscar_alimentos_por_texto(conn: sqlite3.Connection, texto: str, limite: int) -> List[dict]:
+    """
+    Búsqueda para autocompletar. Ordena exacta > prefijo > infijo y nunca devuelve
+    más de `limite` filas. Exactas y prefijos salen del índice único de `nombre_norm`
+    (rango ordenado); los infijos, del índice trigram, que requiere al menos 3 caracteres.
+    Así el costo por tecla depende del límite y no del tamaño del catálogo.
+    """
+    q = normalizar_nombre(texto)
+    if not q:
+        return []
+
+    # 1) Exacta y prefijos: rango [q, q + U+FFFF) sobre el índice; la exacta es la menor del rango
+    resultados = []
+    cursor = conn.execute(
+        "SELECT id, nombre, nombre_norm, calorias_100gr, calorias_porcion FROM alimentos_personalizados "
+        "WHERE nombre_norm >= ? AND nombre_norm < ? ORDER BY nombre_norm LIMIT ?",
+        (q, q + "\uffff", limite)
+    )
+    for fila in cursor:
+        resultados.append((fila, "exacta" if fila["nombre_norm"] == q else "prefijo"))
+
+    # 2) Infijos, solo si aún queda espacio
+    faltan = limite - len(resultados)
+    if faltan > 0 and len(q) >= 3:
+        vistos = {fila["id"] for fila, _ in resultados}
+        # Pedimos algunos candidatos extra para poder ordenarlos por cercanía al inicio
+        candidatos_max = faltan * 4 + len(vistos)
+        if busqueda_fts_disponible:
+            frase = '"' + q.replace('"', '""') + '"'
+            cursor = conn.execute(
+                "SELECT a.id, a.nombre, a.nombre_norm, a.calorias_100gr, a.calorias_porcion "
+                "FROM alimentos_fts JOIN alimentos_personalizados a ON a.id = alimentos_fts.rowid "
+                "WHERE alimentos_fts MATCH ? LIMIT ?",
+                (frase, candidatos_max)
+            )
+        else:
+            patron = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            cursor = conn.execute(
+                "SELECT id, nombre, nombre_norm, calorias_100gr, calorias_porcion FROM alimentos_personalizados "
+                "WHERE nombre_norm LIKE ? ESCAPE '\\' LIMIT ?",
+                (patron, candidatos_max)
+            )
+        infijos = [fila for fila in cursor if fila["id"] not in vistos]
+        infijos.sort(key=lambda fila: (fila["nombre_norm"].find(q), len(fila["nombre_norm"]), fila["nombre_norm"]))
+        resultados.extend((fila, "infijo") for fila in infijos[:faltan])
+
+    return [
+        {
+            "nombre": fila["nombre"],
+            "calorias_100gr": fila["calorias_100gr"],
+            "calorias_porcion": fila["calorias_porcion"],
+            "coincidencia": coincidencia,
+        }
+        for fila, coincidencia in resultados
+    ]
+
+# --- Resumen diario materializado ---
+UPSERT_RESUMEN_DIARIO = """
+    INSERT INTO resumen_diario (usuario, fecha, total_cal, item_count, last_item, last_hora)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (usuario, fecha) DO UPDATE SET
+        total_cal = resumen_diario.total_cal + excluded.total_cal,
+        item_count = resumen_diario.item_count + excluded.item_count,
+        last_item = CASE WHEN excluded.last_hora >= resumen_diario.last_hora
+                         THEN excluded.last_item ELSE resumen_diario.last_item END,
+        last_hora = MAX(resumen_diario.last_hora, excluded.last_hora)
+"""
+
+def crear_resumen_diario(conn: sqlite3.Connection):
+    """
+    Crea la tabla con los totales por usuario y día. Si no existía, o es la versión
+    anterior sin usuario, la (re)crea y la llena a partir de los consumos ya registrados.
+    """
+    columnas = {fila["name"] for fila in conn.execute("PRAGMA table_info(resumen_diario)")}
+    if columnas and "usuario" not in columnas:
+        conn.execute("DROP TABLE resumen_diario")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS resumen_diario (
+        usuario TEXT NOT NULL,
         fecha TEXT NOT NULL,
-        hora TEXT NOT NULL,
-        cantidad REAL NOT NULL,
-        total_cal REAL NOT NULL
+        total_cal REAL NOT NULL,
+        item_count INTEGER NOT NULL,
+        last_item TEXT,
+        last_hora TEXT,
+        PRIMARY KEY (usuario, fecha)
+    ) WITHOUT ROWID
+    """)
+    if "usuario" not in columnas:
+        reconstruir_resumen_diario(conn)
+
+def sumar_a_resumen_diario(conn: sqlite3.Connection, usuario: str, filas):
+    """
+    Suma al resumen de cada día del usuario los consumos recién insertados, cada uno como
+    (nombre, fecha, hora, cantidad, total_cal). Debe llamarse dentro de la misma
+    transacción del INSERT para que el resumen nunca quede desfasado.
+    """
+    por_fecha = {}
+    for nombre, fecha, hora, _cantidad, total_cal in filas:
+        resumen = por_fecha.get(fecha)
+        if resumen is None:
+            por_fecha[fecha] = [total_cal, 1, nombre, hora]
+            continue
+        resumen[0] += total_cal
+        resumen[1] += 1
+        if hora >= resumen[3]:
+            resumen[2], resumen[3] = nombre, hora
+    conn.executemany(
+        UPSERT_RESUMEN_DIARIO,
+        [(usuario, fecha, total, cantidad, ultimo, hora)
+         for fecha, (total, cantidad, ultimo, hora) in por_fecha.items()]
+    )
+
+# Recalcula el resumen desde consumo_diario; {filtro} acota qué días (vacío = todos)
+INSERT_RESUMEN_DESDE_CONSUMOS = """
+    INSERT INTO resumen_diario (usuario, fecha, total_cal, item_count, last_item, last_hora)
+    SELECT c.usuario, c.fecha, SUM(c.total_cal), COUNT(*),
+           (SELECT u.nombre FROM consumo_diario u WHERE u.usuario = c.usuario AND u.fecha = c.fecha
+            ORDER BY u.hora DESC, u.id DESC LIMIT 1),
+           MAX(c.hora)
+    FROM consumo_diario c
+    {filtro}
+    GROUP BY c.usuario, c.fecha
+"""
+
+def reconstruir_resumen_diario(conn: sqlite3.Connection) -> int:
+    """Recalcula todo el resumen diario desde consumo_diario. Devuelve cuántos días (de todos los usuarios) quedaron."""
+    conn.execute("DELETE FROM resumen_diario")
+    conn.execute(INSERT_RESUMEN_DESDE_CONSUMOS.format(filtro=""))
+    dias = conn.execute("SELECT usuario, fecha FROM resumen_diario").fetchall()
+    registrar_cambio(conn, (sello_dia(usuario, fecha) for usuario, fecha in dias))
+    return len(dias)
+
+def reconstruir_resumen_dias(conn: sqlite3.Connection, usuario: str, fechas: List[str]) -> int:
+    """Recalcula solo los días indicados de un usuario (p. ej. tras una importación). Devuelve cuántos días se tocaron."""
+    for inicio in range(0, len(fechas), SQLITE_MAX_PARAMETROS):
+        tramo = fechas[inicio:inicio + SQLITE_MAX_PARAMETROS]
+        marcadores = ",".join("?" * len(tramo))
+        conn.execute(f"DELETE FROM resumen_diario WHERE usuario = ? AND fecha IN ({marcadores})", [usuario, *tramo])
+        conn.execute(
+            INSERT_RESUMEN_DESDE_CONSUMOS.format(filtro=f"WHERE c.usuario = ? AND c.fecha IN ({marcadores})"),
+            [usuario, *tramo]
+        )
+    registrar_cambio(conn, (sello_dia(usuario, fecha) for fecha in fechas))
+    return len(fechas)
+
+# --- Sellos de cambio (ETag / If-None-Match) ---
+# Cada escritura toma el siguiente número de una secuencia global y lo guarda como
+# sello de lo que cambió: 'catalogo' o 'dia:<usuario>/YYYY-MM-DD'. Como la secuencia solo
+# crece, el mayor sello de un rango de días cambia si cambia cualquiera de ellos.
+SELLO_SECUENCIA = "__secuencia__"
+SELLO_EPOCA = "__epoca__"  # Distingue ETags de una base de datos recreada desde cero
+SELLO_CATALOGO = "catalogo"
+
+def crear_sellos_cambio(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sellos_cambio (
+        clave TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
     )
     """)
-    conn.commit()
-    conn.close()
-
-# ... (Las funciones buscar_alimento_local y buscar_calorias_edamam no cambian) ...
-def buscar_alimento_local(nombre: str) -> Optional[dict]:
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM alimentos_personalizados WHERE LOWER(nombre) = ?", (nombre.lower(),))
+    conn.execute("INSERT OR IGNORE INTO sellos_cambio (clave, version) VALUES (?, 0)", (SELLO_SECUENCIA,))
+    conn.execute("INSERT OR IGNORE INTO sellos_cambio (clave, version) VALUES (?, ?)", (SELLO_EPOCA, int(time.time())))
+
+def sello_dia(usuario: str, fecha: str) -> str:
+    return f"dia:{usuario}/{fecha}"
+
+def registrar_cambio(conn: sqlite3.Connection, claves):
+    """Marca como modificadas las claves dadas. Debe llamarse dentro de la transacción de la escritura."""
+    claves = set(claves)
+    if not claves:
+        return
+    conn.execute("UPDATE sellos_cambio SET version = version + 1 WHERE clave = ?", (SELLO_SECUENCIA,))
+    version = conn.execute("SELECT version FROM sellos_cambio WHERE clave = ?", (SELLO_SECUENCIA,)).fetchone()[0]
+    conn.executemany(
+        "INSERT INTO sellos_cambio (clave, version) VALUES (?, ?) ON CONFLICT (clave) DO UPDATE SET version = excluded.version",
+        [(clave, version) for clave in claves]
+    )
+
+def leer_sello(conn: sqlite3.Connection, clave: str) -> int:
+    fila = conn.execute("SELECT version FROM sellos_cambio WHERE clave = ?", (clave,)).fetchone()
+    return fila[0] if fila else 0
+
+def leer_sello_rango_dias(conn: sqlite3.Connection, usuario: str, fecha_desde: str, fecha_hasta: str) -> int:
+    fila = conn.execute(
+        "SELECT MAX(version) FROM sellos_cambio WHERE clave BETWEEN ? AND ?",
+        (sello_dia(usuario, fecha_desde), sello_dia(usuario, fecha_hasta))
+    ).fetchone()
+    return fila[0] or 0
+
+def construir_etag(conn: sqlite3.Connection, recurso: str, version: int, variante: str = "") -> str:
+    """ETag de un recurso: época de la base de datos + sello + (opcional) hash de la variante pedida."""
+    etag = f"{recurso}-{leer_sello(conn, SELLO_EPOCA)}-{version}"
+    if variante:
+        etag += "-" + hashlib.sha1(variante.encode("utf-8")).hexdigest()[:12]
+    return f'"{etag}"'
+
+def etag_coincide(request: Request, etag: str) -> bool:
+    """True si el cliente ya tiene esta versión (If-None-Match), comparando en forma débil."""
+    encabezado = request.headers.get("if-none-match")
+    if not encabezado:
+        return False
+    if encabezado.strip() == "*":
+        return True
+    candidatos = {valor.strip().removeprefix("W/") for valor in encabezado.split(",")}
+    return etag in candidatos
+
+def no_modificado(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+# --- Eventos de cambio (Server-Sent Events) ---
+class CanalEventos:
+    """
+    Reparte a los clientes conectados a /eventos avisos compactos de lo que cambió:
+
+    - 'consumo': {"ids": [...], "fechas": [...]} consumos nuevos del usuario.
+    - 'dias': {"fechas": [...]} días del usuario recalculados (p. ej. tras una importación).
+    - 'catalogo': {"nombre": ...} alta en el catálogo de alimentos (para todos).
+    - 'resincronizar': {} el cliente perdió eventos y debe recargar lo que muestra.
+
+    Las escrituras corren en el threadpool y publican con `publicar`, que pasa el evento
+    al event loop. Cada conexión tiene su propia cola acotada: si un cliente lento la
+    llena, se vacía y recibe 'resincronizar' en vez de frenar a los demás. Los últimos
+    eventos se guardan para reenviarlos a quien se reconecta con Last-Event-ID.
+    """
+    def __init__(self, recientes_max: int, cola_max: int):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._suscriptores: Dict[asyncio.Queue, str] = {}
+        self._recientes = deque(maxlen=recientes_max)
+        self._cola_max = cola_max
+        self._secuencia = 0
+        # Los ids de evento llevan el arranque del proceso: tras reiniciar, un Last-Event-ID viejo no es válido
+        self._arranque = int(time.time())
+        self._stats = {"publicados": 0, "resincronizaciones": 0}
+
+    def iniciar(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def publicar(self, tipo: str, datos: dict, usuario: Optional[str] = None):
+        """Publica un evento. Con `usuario` solo lo reciben las conexiones de ese usuario. Se puede llamar desde cualquier hilo."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._distribuir, tipo, datos, usuario)
+
+    def _distribuir(self, tipo: str, datos: dict, usuario: Optional[str]):
+        self._secuencia += 1
+        self._stats["publicados"] += 1
+        evento = (self._secuencia, tipo, datos, usuario)
+        self._recientes.append(evento)
+        for cola, dueno in self._suscriptores.items():
+            if usuario is None or dueno == usuario:
+                self._encolar(cola, evento)
+
+    def _encolar(self, cola: asyncio.Queue, evento: tuple):
+        try:
+            cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait((evento[0], "resincronizar", {}, None))
+            self._stats["resincronizaciones"] += 1
+
+    def suscribir(self, usuario: str, ultimo_id: Optional[str] = None) -> asyncio.Queue:
+        """Registra una conexión. Con `ultimo_id` (Last-Event-ID) le reenvía lo que se perdió, o 'resincronizar' si ya no está."""
+        cola = asyncio.Queue(self._cola_max)
+        self._suscriptores[cola] = usuario
+        if ultimo_id:
+            arranque, _, secuencia = ultimo_id.partition("-")
+            primero = self._recientes[0][0] if self._recientes else self._secuencia + 1
+            if arranque != str(self._arranque) or not secuencia.isdigit() or int(secuencia) < primero - 1:
+                self._encolar(cola, (self._secuencia, "resincronizar", {}, None))
+            else:
+                for evento in self._recientes:
+                    if evento[0] > int(secuencia) and evento[3] in (None, usuario):
+                        self._encolar(cola, evento)
+        return cola
+
+    def desuscribir(self, cola: asyncio.Queue):
+        self._suscriptores.pop(cola, None)
+
+    def formatear(self, evento: tuple) -> str:
+        secuencia, tipo, datos, _usuario = evento
+        return f"id: {self._arranque}-{secuencia}\nevent: {tipo}\ndata: {orjson.dumps(datos).decode()}\n\n"
+
+    def estadisticas(self) -> dict:
+        return dict(self._stats, conexiones=len(self._suscriptores), ultimo_id=f"{self._arranque}-{self._secuencia}")
+
+canal_eventos = CanalEventos(EVENTOS_RECIENTES, EVENTOS_COLA_MAX)
+
+def buscar_alimento_local(conn: sqlite3.Connection, nombre: str) -> Optional[dict]:
+    cursor = conn.execute(
+        "SELECT id, nombre, calorias_100gr, calorias_porcion FROM alimentos_personalizados WHERE nombre_norm = ?",
+        (normalizar_nombre(nombre),)
+    )
     alimento = cursor.fetchone()
-    conn.close()
     return dict(alimento) if alimento else None
 
-def buscar_calorias_edamam(nombre: str) -> Optional[dict]:
-    url = "https://api.edamam.com/api/food-database/v2/parser"
-    params = {"ingr": nombre, "app_id": EDAMAM_APP_ID, "app_key": EDAMAM_APP_KEY}
-    try:
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
+def buscar_alimentos_locales(conn: sqlite3.Connection, claves: List[str]) -> Dict[str, dict]:
+    """Busca varios alimentos del catálogo por nombre normalizado. Devuelve {clave: alimento}."""
+    encontrados = {}
+    for inicio in range(0, len(claves), SQLITE_MAX_PARAMETROS):
+        tramo = claves[inicio:inicio + SQLITE_MAX_PARAMETROS]
+        marcadores = ",".join("?" * len(tramo))
+        cursor = conn.execute(
+            f"SELECT nombre_norm, nombre, calorias_100gr, calorias_porcion FROM alimentos_personalizados WHERE nombre_norm IN ({marcadores})",
+            tramo
+        )
+        for fila in cursor:
+            encontrados[fila["nombre_norm"]] = {"nombre": fila["nombre"], "calorias_100gr": fila["calorias_100gr"], "calorias_porcion": fila["calorias_porcion"]}
+    return encontrados
+
+# --- Tabla de composición sin conexión ---
+# Se abre al iniciar la API; None si el archivo no existe (se pasa directo a Edamam)
+tabla_composicion: Optional[TablaComposicion] = None
+
+def buscar_en_composicion(clave: str) -> Optional[dict]:
+    """
+    Segunda fuente, entre el catálogo propio y Edamam. Es una búsqueda binaria sobre
+    el archivo mapeado en memoria (microsegundos), así que corre directo en el event loop.
+    """
+    if tabla_composicion is None or not clave:
+        return None
+    datos = tabla_composicion.buscar_clave(clave)
+    metrica_composicion.inc("acierto" if datos else "fallo")
+    return datos
+
+# --- Cliente asíncrono de Edamam ---
+# Fallos de la consulta en sí (no significan "alimento desconocido") y por eso no se cachean
+ERRORES_EDAMAM = (httpx.HTTPError, asyncio.TimeoutError, ValueError, KeyError, IndexError)
+
+class EdamamSaturado(Exception):
+    """
+    No hubo cupo libre para consultar Edamam dentro de la espera máxima. Es una
+    sobrecarga local, no un "no encontrado": no se cachea y se responde 503 con Retry-After.
+    """
+    def __init__(self, reintentar_en: int):
+        super().__init__(f"Cliente de Edamam saturado; reintentar en {reintentar_en} s")
+        self.reintentar_en = reintentar_en
+
+def tipo_error_edamam(error: Exception) -> str:
+    """Etiqueta 'tipo' de edamam_errors_total."""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code}"
+    if isinstance(error, httpx.HTTPError):
+        return "red"
+    return "respuesta_invalida"
+
+class ClienteEdamam:
+    """
+    Cliente HTTP asíncrono compartido por toda la API. Reutiliza conexiones
+    TLS (httpx.AsyncClient), limita las consultas simultáneas a Edamam y
+    agrupa (single-flight) las consultas concurrentes de un mismo alimento:
+    solo la primera sale a la red y todas reciben el mismo resultado.
+    """
+    def __init__(self, url: str, max_concurrentes: int, timeout: float, espera_max: float):
+        self.url = url
+        self.max_concurrentes = max_concurrentes
+        self.timeout = timeout
+        self.espera_max = espera_max
+        self._cliente: Optional[httpx.AsyncClient] = None
+        self._semaforo = asyncio.Semaphore(max_concurrentes)
+        self._en_vuelo: Dict[str, asyncio.Task] = {}
+        self._stats = {"consultas": 0, "errores": 0, "agrupadas": 0, "rechazadas_por_saturacion": 0}
+
+    def _obtener_cliente(self) -> httpx.AsyncClient:
+        if self._cliente is None:
+            self._cliente = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 3.0)),
+                limits=httpx.Limits(max_connections=self.max_concurrentes, max_keepalive_connections=self.max_concurrentes),
+            )
+        return self._cliente
+
+    async def cerrar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    async def pedir(self, nombre: str) -> Optional[dict]:
+        """
+        Consulta Edamam. Devuelve None si Edamam no conoce el alimento, lanza una de
+        ERRORES_EDAMAM si la consulta en sí falló (red, credenciales, JSON inválido) y
+        EdamamSaturado si no se liberó un cupo dentro de `espera_max`.
+        """
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), timeout=self.espera_max)
+        except asyncio.TimeoutError:
+            self._stats["rechazadas_por_saturacion"] += 1
+            metrica_edamam_errores.inc("saturacion")
+            # Un cupo se libera a más tardar cuando vence el timeout de la consulta que lo ocupa
+            raise EdamamSaturado(max(1, math.ceil(self.timeout))) from None
+        inicio = time.perf_counter()
+        try:
+            self._stats["consultas"] += 1
+            params = {"ingr": nombre, "app_id": EDAMAM_APP_ID, "app_key": EDAMAM_APP_KEY}
+            response = await asyncio.wait_for(self._obtener_cliente().get(self.url, params=params), timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except ERRORES_EDAMAM as e:
+            self._stats["errores"] += 1
+            metrica_edamam_duracion.observar(time.perf_counter() - inicio, "error")
+            metrica_edamam_errores.inc(tipo_error_edamam(e))
+            raise
+        finally:
+            self._semaforo.release()
+        metrica_edamam_duracion.observar(time.perf_counter() - inicio, "ok")
         if data.get("parsed"):
             food = data["parsed"][0]["food"]
             nutrients = food.get("nutrients", {})
             return { "nombre": food.get("label", nombre), "calorias_100gr": nutrients.get("ENERC_KCAL", 0), "calorias_porcion": None }
-    except requests.RequestException:
         return None
+
+    async def consultar(self, clave: str, nombre: str, al_terminar: Optional[Callable] = None) -> Optional[dict]:
+        """
+        Consulta agrupada por `clave`. La consulta corre en su propia tarea para que
+        cancelar un request (p. ej. el cliente se desconecta) no afecte a los demás que
+        esperan el mismo resultado. `al_terminar(datos)` se ejecuta una sola vez por consulta.
+        """
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.create_task(self._consultar_y_notificar(nombre, al_terminar))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda _t: self._en_vuelo.pop(clave, None))
+        else:
+            self._stats["agrupadas"] += 1
+        return await asyncio.shield(tarea)
+
+    async def _consultar_y_notificar(self, nombre: str, al_terminar: Optional[Callable]) -> Optional[dict]:
+        datos = await self.pedir(nombre)
+        if al_terminar is not None:
+            await al_terminar(datos)
+        return datos
+
+    def estadisticas(self) -> dict:
+        stats = dict(self._stats)
+        stats.update({
+            "en_vuelo": len(self._en_vuelo),
+            "max_concurrentes": self.max_concurrentes,
+            "cupos_libres": self._semaforo._value,
+        })
+        return stats
+
+cliente_edamam = ClienteEdamam(EDAMAM_URL, EDAMAM_MAX_CONCURRENTES, EDAMAM_TIMEOUT, EDAMAM_ESPERA_MAX)
+
+# --- Caché persistente de Edamam ---
+class CacheEdamam:
+    """
+    Guarda en alimentos_app.db las respuestas de Edamam por nombre normalizado,
+    tanto los aciertos como los "no encontrado" (caché negativa), cada uno con su TTL.
+    Pasado el TTL la entrada sigue sirviéndose durante `ventana_stale` segundos
+    mientras se refresca en segundo plano.
+    """
+    FRESCA = "fresca"
+    STALE = "stale"
+
+    def __init__(self, ttl_acierto: int, ttl_fallo: int, ventana_stale: int):
+        self.ttl_acierto = ttl_acierto
+        self.ttl_fallo = ttl_fallo
+        self.ventana_stale = ventana_stale
+        self._lock = threading.Lock()
+        self._refrescando = set()
+        self._stats = {
+            "aciertos": 0,
+            "aciertos_negativos": 0,
+            "stale_servidos": 0,
+            "fallos": 0,
+            "consultas_externas": 0,
+            "refrescos": 0,
+        }
+
+    def crear_tabla(self, conn: sqlite3.Connection):
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache_edamam (
+            clave TEXT PRIMARY KEY,
+            nombre TEXT,
+            calorias_100gr REAL,
+            calorias_porcion REAL,
+            encontrado INTEGER NOT NULL,
+            actualizado REAL NOT NULL
+        )
+        """)
+
+    def _ttl(self, encontrado: bool) -> int:
+        return self.ttl_acierto if encontrado else self.ttl_fallo
+
+    def leer(self, conn: sqlite3.Connection, clave: str) -> Optional[tuple]:
+        """
+        Devuelve (estado, datos) si hay una entrada utilizable, donde estado es
+        FRESCA o STALE y datos es None para un "no encontrado" cacheado.
+        Devuelve None si no hay entrada o ya venció incluso la ventana stale.
+        """
+        fila = conn.execute(
+            "SELECT nombre, calorias_100gr, calorias_porcion, encontrado, actualizado FROM cache_edamam WHERE clave = ?",
+            (clave,)
+        ).fetchone()
+        if fila is None:
+            return None
+        return self._interpretar(fila)
+
+    def leer_varios(self, conn: sqlite3.Connection, claves: List[str]) -> Dict[str, tuple]:
+        """Como `leer`, pero para varias claves en una sola consulta por tramo. Omite las claves sin entrada utilizable."""
+        entradas = {}
+        for inicio in range(0, len(claves), SQLITE_MAX_PARAMETROS):
+            tramo = claves[inicio:inicio + SQLITE_MAX_PARAMETROS]
+            marcadores = ",".join("?" * len(tramo))
+            cursor = conn.execute(
+                f"SELECT clave, nombre, calorias_100gr, calorias_porcion, encontrado, actualizado FROM cache_edamam WHERE clave IN ({marcadores})",
+                tramo
+            )
+            for fila in cursor:
+                entrada = self._interpretar(fila)
+                if entrada is not None:
+                    entradas[fila["clave"]] = entrada
+        return entradas
+
+    def _interpretar(self, fila: sqlite3.Row) -> Optional[tuple]:
+        edad = time.time() - fila["actualizado"]
+        ttl = self._ttl(bool(fila["encontrado"]))
+        if edad > ttl + self.ventana_stale:
+            return None
+        datos = None
+        if fila["encontrado"]:
+            datos = {"nombre": fila["nombre"], "calorias_100gr": fila["calorias_100gr"], "calorias_porcion": fila["calorias_porcion"]}
+        return (self.FRESCA if edad <= ttl else self.STALE, datos)
+
+    def guardar(self, conn: sqlite3.Connection, clave: str, datos: Optional[dict]):
+        """Escritura: se ejecuta a través de escritor_db."""
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_edamam (clave, nombre, calorias_100gr, calorias_porcion, encontrado, actualizado) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                clave,
+                datos["nombre"] if datos else None,
+                datos["calorias_100gr"] if datos else None,
+                datos["calorias_porcion"] if datos else None,
+                1 if datos else 0,
+                time.time(),
+            )
+        )
+
+    def purgar(self, conn: sqlite3.Connection, solo_vencidas: bool = False) -> int:
+        """Borra la caché completa o solo las entradas que ya no pueden servirse (a través de escritor_db)."""
+        if not solo_vencidas:
+            return conn.execute("DELETE FROM cache_edamam").rowcount
+        ahora = time.time()
+        return conn.execute(
+            "DELETE FROM cache_edamam WHERE (encontrado = 1 AND actualizado < ?) OR (encontrado = 0 AND actualizado < ?)",
+            (ahora - self.ttl_acierto - self.ventana_stale, ahora - self.ttl_fallo - self.ventana_stale)
+        ).rowcount
+
+    def contar(self, stat: str, n: int = 1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def reservar_refresco(self, clave: str) -> bool:
+        """Evita lanzar dos refrescos en segundo plano para la misma clave."""
+        with self._lock:
+            if clave in self._refrescando:
+                return False
+            self._refrescando.add(clave)
+            return True
+
+    def liberar_refresco(self, clave: str):
+        with self._lock:
+            self._refrescando.discard(clave)
+
+    def estadisticas(self, conn: sqlite3.Connection) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        servidas = stats["aciertos"] + stats["aciertos_negativos"] + stats["stale_servidos"]
+        total = servidas + stats["fallos"]
+        stats["tasa_aciertos"] = round(servidas / total, 4) if total else 0.0
+        fila = conn.execute("SELECT COUNT(*), COALESCE(SUM(encontrado), 0) FROM cache_edamam").fetchone()
+        stats["entradas"] = fila[0]
+        stats["entradas_negativas"] = fila[0] - fila[1]
+        stats.update({"ttl_acierto": self.ttl_acierto, "ttl_fallo": self.ttl_fallo, "ventana_stale": self.ventana_stale})
+        return stats
+
+cache_edamam = CacheEdamam(EDAMAM_CACHE_TTL_ACIERTO, EDAMAM_CACHE_TTL_FALLO, EDAMAM_CACHE_VENTANA_STALE)
+
+async def consultar_y_cachear_edamam(clave: str, nombre: str) -> Optional[dict]:
+    """Consulta Edamam (agrupando consultas repetidas) y guarda el resultado. Los errores no se cachean."""
+    async def _guardar(datos: Optional[dict]):
+        cache_edamam.contar("consultas_externas")
+        await escritor_db.ejecutar_async(cache_edamam.guardar, clave, datos)
+
+    return await cliente_edamam.consultar(clave, nombre, al_terminar=_guardar)
+
+async def refrescar_cache_edamam(clave: str, nombre: str):
+    """Tarea en segundo plano que renueva una entrada stale."""
+    try:
+        await consultar_y_cachear_edamam(clave, nombre)
+        cache_edamam.contar("refrescos")
+    except Exception as e:
+        print(f"No se pudo refrescar la caché de Edamam para '{nombre}': {e!r}")
+    finally:
+        cache_edamam.liberar_refresco(clave)
+
+def servir_desde_cache(clave: str, nombre: str, entrada: Optional[tuple], tareas: Optional[BackgroundTasks]) -> tuple:
+    """
+    Decide si una entrada de la caché puede responder. Devuelve (True, datos) si
+    sí (programando un refresco si está stale) o (False, None) si hay que ir a Edamam.
+    """
+    if entrada is None:
+        cache_edamam.contar("fallos")
+        return False, None
+    estado, datos = entrada
+    if estado == CacheEdamam.FRESCA:
+        cache_edamam.contar("aciertos" if datos else "aciertos_negativos")
+    else:
+        cache_edamam.contar("stale_servidos")
+        if tareas is not None and cache_edamam.reservar_refresco(clave):
+            tareas.add_task(refrescar_cache_edamam, clave, nombre)
+    return True, (dict(datos) if datos else None)
+
+async def buscar_calorias_edamam(nombre: str, tareas: Optional[BackgroundTasks] = None) -> Optional[dict]:
+    clave = normalizar_nombre(nombre)
+    entrada = await ejecutar_en_db(cache_edamam.leer, clave)
+    servida, datos = servir_desde_cache(clave, nombre, entrada, tareas)
+    if servida:
+        return datos
+    try:
+        datos = await consultar_y_cachear_edamam(clave, nombre)
+    except ERRORES_EDAMAM:
+        return None
+    return dict(datos) if datos else None
+
+def validar_consumo(consumo) -> Optional[str]:
+    """Devuelve un mensaje de error si el consumo no es válido, o None si se puede guardar."""
+    try:
+        datetime.strptime(consumo.fecha, "%Y-%m-%d")
+    except ValueError:
+        return f"Fecha inválida '{consumo.fecha}', se espera YYYY-MM-DD."
+    hora_valida = False
+    for formato in ("%H:%M", "%H:%M:%S"):
+        try:
+            datetime.strptime(consumo.hora, formato)
+            hora_valida = True
+            break
+        except ValueError:
+            continue
+    if not hora_valida:
+        return f"Hora inválida '{consumo.hora}', se espera HH:MM."
+    if not consumo.nombre.strip():
+        return "El nombre del alimento no puede estar vacío."
+    if consumo.cantidad <= 0:
+        return "La cantidad debe ser mayor que 0."
+    if consumo.total_cal < 0:
+        return "Las calorías no pueden ser negativas."
     return None
 
 # --- Modelos Pydantic (No cambian) ---
@@ -79,6 +1305,12 @@ class AlimentoCreado(BaseModel):
     calorias_100gr: Optional[float] = None
     calorias_porcion: Optional[float] = None
 
+class AlimentoBusqueda(BaseModel):
+    nombre: str
+    calorias_100gr: Optional[float] = None
+    calorias_porcion: Optional[float] = None
+    coincidencia: str
+
 class AlimentoRespuesta(BaseModel):
     nombre: str
     calorias_100gr: Optional[float] = None
@@ -95,112 +1327,794 @@ class ConsumoRegistrado(BaseModel):
 class RegistroRequest(BaseModel):
     consumo: ConsumoRegistrado
 
+class RegistroLoteRequest(BaseModel):
+    consumos: List[ConsumoRegistrado] = Field(..., min_length=1, max_length=MAX_CONSUMOS_POR_LOTE)
+
+class ConsultaLoteRequest(BaseModel):
+    nombres: List[str] = Field(..., min_length=1, max_length=MAX_ALIMENTOS_POR_CONSULTA)
+
+class AlimentoLoteRespuesta(BaseModel):
+    consulta: str
+    encontrado: bool
+    nombre: Optional[str] = None
+    calorias_100gr: Optional[float] = None
+    calorias_porcion: Optional[float] = None
+    fuente: Optional[str] = None
+
+class PrecalentarCacheRequest(BaseModel):
+    nombres: List[str]
+
 # --- Endpoints de la API ---
 
 @app.on_event("startup")
 async def startup_event():
+    global tabla_composicion
+    if not JWT_SECRET_KEY:
+        # Sin la clave compartida con la API de usuarios no hay forma de saber de quién son los consumos
+        raise RuntimeError("Falta la variable de entorno Key_JWT (la misma clave con la que firma la API de usuarios).")
     init_db()
+    escritor_db.iniciar()
+    tabla_composicion = TablaComposicion.abrir(TABLA_COMPOSICION_FILE)
+    if tabla_composicion is not None:
+        print(f"Tabla de composición cargada: {len(tabla_composicion)} alimentos ({TABLA_COMPOSICION_FILE}).")
+    canal_eventos.iniciar(asyncio.get_running_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await cliente_edamam.cerrar()
+    escritor_db.detener()
+    gestor_db.cerrar()
+    if tabla_composicion is not None:
+        tabla_composicion.cerrar()
+
+@app.exception_handler(EdamamSaturado)
+async def responder_edamam_saturado(request: Request, exc: EdamamSaturado):
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": "Hay demasiadas consultas a Edamam en curso. Reintente en unos segundos."},
+        headers={"Retry-After": str(exc.reintentar_en)},
+    )
 
 # ... (Endpoints /alimentos y /consultar-alimento no cambian) ...
+def insertar_alimento(conn: sqlite3.Connection, alimento: AlimentoCreado):
+    conn.execute("INSERT INTO alimentos_personalizados (nombre, calorias_100gr, calorias_porcion, nombre_norm) VALUES (?, ?, ?, ?)",
+                 (alimento.nombre, alimento.calorias_100gr, alimento.calorias_porcion, normalizar_nombre(alimento.nombre)))
+    registrar_cambio(conn, [SELLO_CATALOGO])
+
 @app.post("/alimentos", status_code=201)
 def agregar_alimento_personalizado(alimento: AlimentoCreado):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO alimentos_personalizados (nombre, calorias_100gr, calorias_porcion) VALUES (?, ?, ?)",
-                       (alimento.nombre, alimento.calorias_100gr, alimento.calorias_porcion))
-        conn.commit()
-        conn.close()
+        escritor_db.ejecutar(insertar_alimento, alimento)
+        canal_eventos.publicar("catalogo", {"nombre": alimento.nombre})
         return {"mensaje": f"Alimento '{alimento.nombre}' guardado con éxito."}
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=409, detail=f"El alimento '{alimento.nombre}' ya existe.")
 
 @app.get("/alimentos", response_model=List[AlimentoCreado])
-def obtener_alimentos_personalizados():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT nombre, calorias_100gr, calorias_porcion FROM alimentos_personalizados ORDER BY nombre")
+def obtener_alimentos_personalizados(request: Request, conn: sqlite3.Connection = Depends(get_db)):
+    # El sello se lee antes que los datos: si algo cambia entremedio, el ETag queda viejo y el cliente vuelve a pedir
+    etag = construir_etag(conn, "cat", leer_sello(conn, SELLO_CATALOGO))
+    if etag_coincide(request, etag):
+        return no_modificado(etag)
+    cursor = conn.execute("SELECT nombre, calorias_100gr, calorias_porcion FROM alimentos_personalizados ORDER BY nombre")
     alimentos = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in alimentos]
+    # Las filas vienen de nuestra propia tabla: se devuelven directo, sin revalidar cada una contra el modelo
+    return ORJSONResponse([dict(row) for row in alimentos], headers={"ETag": etag})
+
+@app.get("/alimentos/buscar", response_model=List[AlimentoBusqueda])
+def buscar_alimentos(q: str, limit: int = Query(20, ge=1, le=BUSQUEDA_LIMITE_MAX), conn: sqlite3.Connection = Depends(get_db)):
+    """
+    Busca alimentos del catálogo por prefijo o por texto contenido en el nombre,
+    sin distinguir tildes ni mayúsculas. Devuelve primero la coincidencia exacta,
+    luego los prefijos y al final los infijos, hasta `limit` resultados.
+    """
+    return ORJSONResponse(buscar_alimentos_por_texto(conn, q, limit))
 
 @app.post("/consultar-alimento", response_model=AlimentoRespuesta)
-def consultar_alimento(alimento: AlimentoCreado):
-    local_food = buscar_alimento_local(alimento.nombre)
+async def consultar_alimento(alimento: AlimentoCreado, tareas: BackgroundTasks):
+    local_food = await ejecutar_en_db(buscar_alimento_local, alimento.nombre)
     if local_food:
         local_food['fuente'] = 'local'
         return local_food
-    external_food = buscar_calorias_edamam(alimento.nombre)
+    tabla_food = buscar_en_composicion(normalizar_nombre(alimento.nombre))
+    if tabla_food:
+        tabla_food['fuente'] = 'composicion'
+        return tabla_food
+    external_food = await buscar_calorias_edamam(alimento.nombre, tareas)
     if external_food:
         external_food['fuente'] = 'externa'
         return external_food
     raise HTTPException(status_code=404, detail=f"No se encontró información para '{alimento.nombre}'.")
 
 
+@app.post("/consultar-alimentos/batch", response_model=List[AlimentoLoteRespuesta])
+async def consultar_alimentos_lote(req: ConsultaLoteRequest, tareas: BackgroundTasks):
+    """
+    Resuelve varios alimentos en una sola petición. Los del catálogo local se
+    buscan con una única consulta IN y los que faltan en la tabla de composición;
+    solo el resto va a la caché y, si no están ahí, a Edamam con concurrencia
+    acotada. Respeta el orden pedido. Si el cliente de Edamam está saturado responde
+    503 (los resultados que sí llegaron quedan en la caché para el reintento).
+    """
+    claves = [normalizar_nombre(nombre) for nombre in req.nombres]
+    # Primera aparición de cada clave, para no consultar dos veces el mismo alimento
+    nombres_por_clave = {}
+    for clave, nombre in zip(claves, req.nombres):
+        if clave:
+            nombres_por_clave.setdefault(clave, nombre)
+
+    locales = await ejecutar_en_db(buscar_alimentos_locales, list(nombres_por_clave))
+    de_tabla = {}
+    for clave in nombres_por_clave:
+        if clave not in locales:
+            datos = buscar_en_composicion(clave)
+            if datos:
+                de_tabla[clave] = datos
+    faltantes = [clave for clave in nombres_por_clave if clave not in locales and clave not in de_tabla]
+    cacheadas = await ejecutar_en_db(cache_edamam.leer_varios, faltantes) if faltantes else {}
+
+    externos: Dict[str, Optional[dict]] = {}
+    por_consultar = []
+    for clave in faltantes:
+        servida, datos = servir_desde_cache(clave, nombres_por_clave[clave], cacheadas.get(clave), tareas)
+        if servida:
+            externos[clave] = datos
+        else:
+            por_consultar.append(clave)
+
+    cupos = asyncio.Semaphore(cliente_edamam.max_concurrentes)
+
+    async def _consultar(clave: str):
+        async with cupos:
+            try:
+                externos[clave] = await consultar_y_cachear_edamam(clave, nombres_por_clave[clave])
+            except ERRORES_EDAMAM:
+                externos[clave] = None
+
+    await asyncio.gather(*(_consultar(clave) for clave in por_consultar))
+
+    respuesta = []
+    for clave, nombre in zip(claves, req.nombres):
+        if clave in locales:
+            respuesta.append({"consulta": nombre, "encontrado": True, "fuente": "local", **locales[clave]})
+        elif clave in de_tabla:
+            respuesta.append({"consulta": nombre, "encontrado": True, "fuente": "composicion", **de_tabla[clave]})
+        elif externos.get(clave):
+            respuesta.append({"consulta": nombre, "encontrado": True, "fuente": "externa", **externos[clave]})
+        else:
+            respuesta.append({"consulta": nombre, "encontrado": False})
+    return respuesta
+
 # --- ¡ENDPOINT MODIFICADO! ---
+def insertar_consumos(conn: sqlite3.Connection, usuario: str, filas: List[tuple]) -> List[int]:
+    """Guarda los consumos, actualiza el resumen diario y los sellos de sus días. Devuelve los ids."""
+    conn.executemany(
+        "INSERT INTO consumo_diario (nombre, fecha, hora, cantidad, total_cal, usuario) VALUES (?, ?, ?, ?, ?, ?)",
+        [fila + (usuario,) for fila in filas]
+    )
+    # Con AUTOINCREMENT y el bloqueo de escritura tomado, los ids del lote son consecutivos
+    ultimo_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    sumar_a_resumen_diario(conn, usuario, filas)
+    registrar_cambio(conn, (sello_dia(usuario, fila[1]) for fila in filas))
+    return list(range(ultimo_id - len(filas) + 1, ultimo_id + 1))
+
 @app.post("/registrar-consumo")
-def registrar_consumo(req: RegistroRequest):
-    """Registra un nuevo consumo en la base de datos persistente."""
+def registrar_consumo(req: RegistroRequest, usuario: str = Depends(usuario_actual)):
+    """Registra un nuevo consumo del usuario en la base de datos persistente."""
     consumo = req.consumo
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO consumo_diario (nombre, fecha, hora, cantidad, total_cal) VALUES (?, ?, ?, ?, ?)",
-        (consumo.nombre, consumo.fecha, consumo.hora, consumo.cantidad, consumo.total_cal)
-    )
-    conn.commit()
-    conn.close()
+    fila = (consumo.nombre, consumo.fecha, consumo.hora, consumo.cantidad, consumo.total_cal)
+    ids = escritor_db.ejecutar(insertar_consumos, usuario, [fila])
+    canal_eventos.publicar("consumo", {"ids": ids, "fechas": [consumo.fecha]}, usuario)
     return {"mensaje": "Consumo registrado exitosamente en la base de datos."}
 
+@app.post("/registrar-consumo/batch")
+def registrar_consumo_lote(req: RegistroLoteRequest, usuario: str = Depends(usuario_actual)):
+    """
+    Registra varios consumos (p. ej. una comida completa) en una sola transacción.
+    Los consumos inválidos se informan en su posición y no impiden guardar el resto.
+    """
+    resultados = []
+    filas = []
+    for indice, consumo in enumerate(req.consumos):
+        error = validar_consumo(consumo)
+        if error:
+            resultados.append({"indice": indice, "ok": False, "error": error})
+        else:
+            resultados.append({"indice": indice, "ok": True, "id": None})
+            filas.append((consumo.nombre, consumo.fecha, consumo.hora, consumo.cantidad, consumo.total_cal))
+
+    if filas:
+        ids = escritor_db.ejecutar(insertar_consumos, usuario, filas)
+        for resultado, id_consumo in zip((r for r in resultados if r["ok"]), ids):
+            resultado["id"] = id_consumo
+        canal_eventos.publicar("consumo", {"ids": ids, "fechas": sorted({fila[1] for fila in filas})}, usuario)
+
+    return {
+        "mensaje": f"Se registraron {len(filas)} de {len(req.consumos)} consumos.",
+        "registrados": len(filas),
+        "rechazados": len(req.consumos) - len(filas),
+        "resultados": resultados,
+    }
+
 # --- ¡ENDPOINT MODIFICADO! ---
 @app.get("/resumen-diario/{fecha_str}")
-def obtener_resumen_diario(fecha_str: str):
-    """Obtiene el resumen de un día específico desde la base de datos persistente."""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM consumo_diario WHERE fecha = ?", (fecha_str,))
-    consumos_del_dia = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-
-    if not consumos_del_dia:
+def obtener_resumen_diario(fecha_str: str, request: Request, response: Response, detalle: bool = True,
+                           usuario: str = Depends(usuario_actual), conn: sqlite3.Connection = Depends(get_db)):
+    """
+    Obtiene el resumen de un día específico desde la base de datos persistente.
+    Con `detalle=false` solo lee la fila de resumen_diario (total, cantidad y último
+    alimento) sin recorrer los consumos del día.
+    """
+    etag = construir_etag(conn, "dia", leer_sello(conn, sello_dia(usuario, fecha_str)), f"{usuario}|{fecha_str}|{detalle}")
+    if etag_coincide(request, etag):
+        return no_modificado(etag)
+    resumen = conn.execute(
+        "SELECT total_cal, item_count, last_item, last_hora FROM resumen_diario WHERE usuario = ? AND fecha = ?",
+        (usuario, fecha_str)
+    ).fetchone()
+    if resumen is None or resumen["item_count"] == 0:
         raise HTTPException(status_code=404, detail=f"No se encontraron registros para la fecha {fecha_str}")
-        
-    total_calorias = sum(c["total_cal"] for c in consumos_del_dia)
-    return {"fecha": fecha_str, "resumen_total": {"calorias": round(total_calorias, 2)}, "consumos": consumos_del_dia}
 
-@app.get("/historial")
-def obtener_historial_completo(fecha_desde: str, fecha_hasta: str):
+    response.headers["ETag"] = etag
+    respuesta = {
+        "fecha": fecha_str,
+        "resumen_total": {"calorias": round(resumen["total_cal"], 2), "items": resumen["item_count"]},
+        "ultimo": {"nombre": resumen["last_item"], "hora": resumen["last_hora"]},
+    }
+    if detalle:
+        cursor = conn.execute(
+            "SELECT id, nombre, fecha, hora, cantidad, total_cal FROM consumo_diario "
+            "WHERE usuario = ? AND fecha = ? ORDER BY hora, id",
+            (usuario, fecha_str)
+        )
+        respuesta["consumos"] = [dict(row) for row in cursor.fetchall()]
+    return respuesta
+
+@app.post("/admin/resumen-diario/reconstruir", dependencies=[Depends(requerir_admin)])
+def reconstruir_resumen_diario_endpoint():
+    """Recalcula resumen_diario desde cero (p. ej. tras editar consumo_diario a mano)."""
+    dias = escritor_db.ejecutar(reconstruir_resumen_diario)
+    canal_eventos.publicar("resincronizar", {})
+    return {"mensaje": f"Resumen diario reconstruido para {dias} días.", "dias": dias}
+
+def parsear_cursor_historial(after: str) -> tuple:
+    """Convierte el cursor 'fecha,hora,id' recibido en `after` a la tupla usada en la consulta."""
+    partes = after.split(",")
+    if len(partes) != 3:
+        raise HTTPException(status_code=400, detail="El parámetro 'after' debe tener el formato 'fecha,hora,id'.")
+    fecha, hora, id_str = partes
+    try:
+        return (fecha, hora, int(id_str))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El id del parámetro 'after' debe ser un número entero.")
+
+def consulta_historial(usuario: str, fecha_desde: str, fecha_hasta: str, after: Optional[tuple], limit: Optional[int]) -> tuple:
     """
-    Devuelve todos los registros de consumo entre dos fechas (formato YYYY-MM-DD).
+    Arma la consulta del historial en orden (fecha, hora, id) descendente. Con `after`
+    continúa justo después de esa fila (paginación por keyset): cada página es una
+    búsqueda en el índice (fecha, hora), sin OFFSET que recorra las páginas anteriores.
     """
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # La consulta busca en la tabla de consumo y filtra por el rango de fechas.
     query = """
-        SELECT nombre, fecha, hora, cantidad, total_cal 
-        FROM consumo_diario 
-        WHERE fecha BETWEEN ? AND ?
-        ORDER BY fecha DESC, hora DESC
+        SELECT id, nombre, fecha, hora, cantidad, total_cal
+        FROM consumo_diario
+        WHERE usuario = ? AND fecha BETWEEN ? AND ?
+    """
+    if after is not None:
+        # Acotar también el rango de fechas deja que el índice salte directo a la posición del cursor
+        fecha_hasta = min(fecha_hasta, after[0])
+    params = [usuario, fecha_desde, fecha_hasta]
+    if after is not None:
+        query += " AND (fecha, hora, id) < (?, ?, ?)"
+        params.extend(after)
+    query += " ORDER BY fecha DESC, hora DESC, id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+def generar_historial_ndjson(query: str, params: list) -> Iterator[str]:
+    """
+    Emite el historial como NDJSON a medida que se lee del cursor. Toma su propia
+    conexión del pool porque corre después de que el endpoint ya devolvió la respuesta.
     """
-    
-    cursor.execute(query, (fecha_desde, fecha_hasta))
+    with gestor_db.conexion() as conn:
+        cursor = conn.execute(query, params)
+        while True:
+            filas = cursor.fetchmany(HISTORIAL_FILAS_POR_LECTURA)
+            if not filas:
+                break
+            yield b"".join(orjson.dumps(dict(fila)) + b"\n" for fila in filas)
+
+@app.get("/historial")
+def obtener_historial_completo(
+    fecha_desde: str,
+    fecha_hasta: str,
+    request: Request,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=HISTORIAL_LIMITE_MAX),
+    formato: str = Query("json", pattern="^(json|ndjson)$"),
+    usuario: str = Depends(usuario_actual),
+    conn: sqlite3.Connection = Depends(get_db),
+):
+    """
+    Devuelve los registros de consumo del usuario entre dos fechas (formato YYYY-MM-DD),
+    del más reciente al más antiguo.
+
+    - Sin `limit` ni `after` devuelve el rango completo, como siempre.
+    - Con `limit` devuelve una página; si hay más, el encabezado `X-Siguiente` trae el
+      cursor 'fecha,hora,id' que se pasa como `after` para pedir la siguiente.
+    - Con `formato=ndjson` las filas se envían en streaming, una por línea; el cursor
+      para continuar es la fecha, hora e id de la última línea recibida.
+    """
+    cursor_after = parsear_cursor_historial(after) if after else None
+
+    etag = construir_etag(
+        conn, "hist", leer_sello_rango_dias(conn, usuario, fecha_desde, fecha_hasta),
+        f"{usuario}|{fecha_desde}|{fecha_hasta}|{after}|{limit}|{formato}"
+    )
+    if etag_coincide(request, etag):
+        return no_modificado(etag)
+
+    if formato == "ndjson":
+        query, params = consulta_historial(usuario, fecha_desde, fecha_hasta, cursor_after, limit)
+        return StreamingResponse(generar_historial_ndjson(query, params), media_type="application/x-ndjson",
+                                 headers={"ETag": etag})
+
+    headers = {"ETag": etag}
+
+    # Pedimos una fila extra para saber si existe una página siguiente
+    query, params = consulta_historial(usuario, fecha_desde, fecha_hasta, cursor_after, limit + 1 if limit else None)
+    cursor = conn.execute(query, params)
     registros = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    
-    if not registros:
-        # Es mejor devolver una lista vacía que un error 404 en este caso.
-        return []
-        
-    return registros
+
+    if limit is not None and len(registros) > limit:
+        registros = registros[:limit]
+        ultimo = registros[-1]
+        headers["X-Siguiente"] = f"{ultimo['fecha']},{ultimo['hora']},{ultimo['id']}"
+
+    # Sin registros es mejor devolver una lista vacía que un error 404.
+    # Las filas se serializan tal cual con orjson, sin pasar por jsonable_encoder.
+    return ORJSONResponse(registros, headers=headers)
+
+# --- Estadísticas por rango (gráficos) ---
+# Para cada granularidad: expresión SQL que lleva una fecha al inicio de su intervalo
+# y modificador de date() que pasa de un intervalo al siguiente. Las semanas empiezan en lunes.
+GRANULARIDADES_ESTADISTICAS = {
+    "day": ("date({col})", "+1 day"),
+    "week": ("date({col}, '-' || ((CAST(strftime('%w', {col}) AS INTEGER) + 6) % 7) || ' days')", "+7 days"),
+    "month": ("strftime('%Y-%m-01', {col})", "+1 month"),
+}
+# Métrica pedida -> columna de resumen_diario que se agrega
+METRICAS_ESTADISTICAS = {
+    "calorias": "total_cal",
+}
+
+def consulta_estadisticas(granularidad: str, metrica: str) -> str:
+    """
+    Arma la consulta de estadísticas sobre resumen_diario: la CTE recursiva genera todos
+    los intervalos del rango y el LEFT JOIN deja en cero los que no tienen registros.
+    Parámetros: (usuario, desde, hasta).
+    """
+    inicio_de, siguiente = GRANULARIDADES_ESTADISTICAS[granularidad]
+    columna = METRICAS_ESTADISTICAS[metrica]
+    return f"""
+        WITH RECURSIVE rango(usuario, desde, hasta) AS (SELECT ?, ?, ?),
+        intervalos(inicio) AS (
+            SELECT {inicio_de.format(col="desde")} FROM rango
+            UNION ALL
+            SELECT date(inicio, '{siguiente}') FROM intervalos
+            WHERE date(inicio, '{siguiente}') <= (SELECT hasta FROM rango)
+        ),
+        datos AS (
+            SELECT {inicio_de.format(col="fecha")} AS inicio,
+                   SUM({columna}) AS suma,
+                   AVG({columna}) AS promedio,
+                   COUNT(*) AS dias,
+                   SUM(item_count) AS consumos
+            FROM resumen_diario
+            WHERE usuario = (SELECT usuario FROM rango)
+              AND fecha BETWEEN (SELECT desde FROM rango) AND (SELECT hasta FROM rango)
+            GROUP BY 1
+        )
+        SELECT i.inicio,
+               date(i.inicio, '{siguiente}', '-1 day') AS fin,
+               COALESCE(d.suma, 0) AS suma,
+               COALESCE(d.promedio, 0) AS promedio,
+               COALESCE(d.dias, 0) AS dias,
+               COALESCE(d.consumos, 0) AS consumos
+        FROM intervalos i LEFT JOIN datos d ON d.inicio = i.inicio
+        ORDER BY i.inicio
+    """
+
+@app.get("/estadisticas")
+def obtener_estadisticas(
+    desde: str,
+    hasta: str,
+    request: Request,
+    response: Response,
+    granularidad: str = Query("day", pattern="^(day|week|month)$"),
+    metrica: str = Query("calorias", pattern="^(calorias)$"),
+    usuario: str = Depends(usuario_actual),
+    conn: sqlite3.Connection = Depends(get_db),
+):
+    """
+    Totales del usuario entre dos fechas (YYYY-MM-DD) por día, semana o mes, listos para graficar.
+
+    Se calculan en SQL sobre resumen_diario (una fila por usuario y día, en orden de clave), así
+    que un año completo es una sola consulta. Cada intervalo trae `suma`, `promedio` por
+    día con registros, `dias` con registros y `consumos`; los intervalos sin datos vienen en cero.
+    """
+    try:
+        fecha_desde, fecha_hasta = date.fromisoformat(desde), date.fromisoformat(hasta)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'desde' y 'hasta' deben tener el formato YYYY-MM-DD.")
+    if fecha_desde > fecha_hasta:
+        raise HTTPException(status_code=400, detail="'desde' no puede ser posterior a 'hasta'.")
+    if (fecha_hasta - fecha_desde).days > ESTADISTICAS_MAX_DIAS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {ESTADISTICAS_MAX_DIAS} días.")
+    desde, hasta = fecha_desde.isoformat(), fecha_hasta.isoformat()
+
+    etag = construir_etag(
+        conn, "stats", leer_sello_rango_dias(conn, usuario, desde, hasta),
+        f"{usuario}|{desde}|{hasta}|{granularidad}|{metrica}"
+    )
+    if etag_coincide(request, etag):
+        return no_modificado(etag)
+    response.headers["ETag"] = etag
+
+    cursor = conn.execute(consulta_estadisticas(granularidad, metrica), (usuario, desde, hasta))
+    intervalos = [
+        {
+            "inicio": fila["inicio"],
+            "fin": fila["fin"],
+            "suma": round(fila["suma"], 2),
+            "promedio": round(fila["promedio"], 2),
+            "dias": fila["dias"],
+            "consumos": fila["consumos"],
+        }
+        for fila in cursor.fetchall()
+    ]
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "granularidad": granularidad,
+        "metrica": metrica,
+        "total": round(sum(intervalo["suma"] for intervalo in intervalos), 2),
+        "intervalos": intervalos,
+    }
+
+# --- Importación masiva de consumos (CSV / NDJSON) ---
+COLUMNAS_IMPORTACION = ("nombre", "fecha", "hora", "cantidad", "total_cal")
+
+def formato_por_content_type(content_type: str) -> Optional[str]:
+    tipo = content_type.split(";")[0].strip().lower()
+    if tipo in ("text/csv", "application/csv"):
+        return "csv"
+    if tipo in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"):
+        return "ndjson"
+    return None
+
+class ImportacionConsumo:
+    """
+    Estado de una importación en curso. Recibe el cuerpo de la petición en trozos de
+    bytes, arma los registros a medida que se completan las líneas (sin juntar el
+    archivo en memoria), los valida y deja las filas válidas en `lote` hasta que el
+    endpoint las guarde. En CSV la primera fila es el encabezado y un campo entre
+    comillas puede ocupar varias líneas.
+    """
+    def __init__(self, id_importacion: str, usuario: str, formato: str):
+        self.usuario = usuario
+        self.formato = formato
+        self.decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+        self.resto = ""  # Línea incompleta al final del último trozo
+        self.numero_linea = 0
+        self.encabezado: Optional[List[str]] = None
+        self.pendiente: List[str] = []  # Líneas de un registro CSV con comillas abiertas
+        self.linea_pendiente = 0
+        self.lote: List[tuple] = []
+        self.fechas = set()
+        self.inicio = time.perf_counter()
+        self.progreso = {
+            "id": id_importacion,
+            "estado": "en_curso",
+            "formato": formato,
+            "procesadas": 0,
+            "importadas": 0,
+            "rechazadas": 0,
+            "lotes": 0,
+            "errores": [],
+            "errores_omitidos": 0,
+        }
+
+    def procesar_trozo(self, trozo: bytes, final: bool = False):
+        """Decodifica un trozo del cuerpo y procesa cada línea completa que contenga."""
+        try:
+            texto = self.resto + self.decodificador.decode(trozo, final)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail=f"El archivo no es UTF-8 válido (cerca de la línea {self.numero_linea + 1}).")
+        lineas = texto.split("\n")
+        self.resto = "" if final else lineas.pop()
+        if len(self.resto) > IMPORTACION_MAX_REGISTRO:
+            raise HTTPException(status_code=400, detail=f"La línea {self.numero_linea + 1} supera los {IMPORTACION_MAX_REGISTRO} caracteres.")
+        for linea in lineas:
+            self.numero_linea += 1
+            self._procesar_linea(linea.rstrip("\r"))
+        if final and self.pendiente:
+            self._rechazar(self.linea_pendiente, "Campo entre comillas sin cerrar al final del archivo.")
+            self.pendiente = []
+
+    def _procesar_linea(self, linea: str):
+        if self.formato == "ndjson":
+            if not linea.strip():
+                return
+            try:
+                registro = orjson.loads(linea)
+            except orjson.JSONDecodeError:
+                self._rechazar(self.numero_linea, "La línea no es un JSON válido.")
+                return
+            if not isinstance(registro, dict):
+                self._rechazar(self.numero_linea, "Cada línea debe ser un objeto JSON.")
+                return
+            self._agregar(self.numero_linea, registro)
+            return
+
+        if not self.pendiente:
+            if not linea.strip():
+                return
+            self.linea_pendiente = self.numero_linea
+        self.pendiente.append(linea)
+        texto = "\n".join(self.pendiente)
+        if texto.count('"') % 2:
+            # Comillas abiertas: el registro continúa en la línea siguiente
+            if len(texto) > IMPORTACION_MAX_REGISTRO:
+                self._rechazar(self.linea_pendiente, f"El registro supera los {IMPORTACION_MAX_REGISTRO} caracteres.")
+                self.pendiente = []
+            return
+        self.pendiente = []
+        campos = next(csv.reader([texto]))
+
+        if self.encabezado is None:
+            self.encabezado = [campo.strip().lower() for campo in campos]
+            faltantes = [columna for columna in COLUMNAS_IMPORTACION if columna not in self.encabezado]
+            if faltantes:
+                raise HTTPException(status_code=400, detail=f"Al encabezado CSV le faltan las columnas: {', '.join(faltantes)}.")
+            return
+        if len(campos) != len(self.encabezado):
+            self._rechazar(self.linea_pendiente, f"Se esperaban {len(self.encabezado)} columnas y hay {len(campos)}.")
+            return
+        self._agregar(self.linea_pendiente, dict(zip(self.encabezado, campos)))
+
+    def _agregar(self, linea: int, registro: dict):
+        self.progreso["procesadas"] += 1
+        try:
+            consumo = ConsumoRegistrado.model_validate(registro)
+        except ValidationError as e:
+            primer_error = e.errors()[0]
+            campo = ".".join(str(parte) for parte in primer_error["loc"]) or "registro"
+            self._rechazar(linea, f"{campo}: {primer_error['msg']}", contar=False)
+            return
+        error = validar_consumo(consumo)
+        if error:
+            self._rechazar(linea, error, contar=False)
+            return
+        self.lote.append((consumo.nombre, consumo.fecha, consumo.hora, consumo.cantidad, consumo.total_cal))
+
+    def _rechazar(self, linea: int, error: str, contar: bool = True):
+        if contar:
+            self.progreso["procesadas"] += 1
+        self.progreso["rechazadas"] += 1
+        if len(self.progreso["errores"]) < IMPORTACION_MAX_ERRORES:
+            self.progreso["errores"].append({"linea": linea, "error": error})
+        else:
+            self.progreso["errores_omitidos"] += 1
+
+    def tomar_lote(self, tamano: int) -> List[tuple]:
+        filas, self.lote = self.lote[:tamano], self.lote[tamano:]
+        return filas
+
+    def lote_guardado(self, filas: List[tuple]):
+        self.progreso["importadas"] += len(filas)
+        self.progreso["lotes"] += 1
+        self.fechas.update(fila[1] for fila in filas)
+
+    def resumen(self) -> dict:
+        return dict(self.progreso, errores=list(self.progreso["errores"]),
+                    duracion_s=round(time.perf_counter() - self.inicio, 3))
+
+# Importaciones recientes por (usuario, id) (las más viejas se descartan), para consultar su progreso.
+# El usuario es parte de la clave: un id ajeno no se puede leer, pisar ni bloquear.
+importaciones: "OrderedDict[tuple, ImportacionConsumo]" = OrderedDict()
+
+def insertar_lote_importado(conn: sqlite3.Connection, usuario: str, filas: List[tuple]):
+    """Guarda un lote (a través de escritor_db). El resumen diario se recalcula al final de la importación."""
+    conn.executemany(
+        "INSERT INTO consumo_diario (nombre, fecha, hora, cantidad, total_cal, usuario) VALUES (?, ?, ?, ?, ?, ?)",
+        [fila + (usuario,) for fila in filas]
+    )
+
+@app.post("/importar/consumo")
+async def importar_consumo(
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    tamano_lote: int = Query(IMPORTACION_TAMANO_LOTE, ge=1, le=IMPORTACION_TAMANO_LOTE_MAX),
+    id_importacion: Optional[str] = Query(None, min_length=1, max_length=64),
+    usuario: str = Depends(usuario_actual),
+):
+    """
+    Importa un historial de consumos enviado como cuerpo de la petición, en CSV (con
+    encabezado nombre,fecha,hora,cantidad,total_cal) o NDJSON (un objeto por línea).
+
+    - El formato se toma de `formato` o, si no viene, del Content-Type.
+    - El archivo se lee en streaming y se guarda en transacciones de `tamano_lote` filas;
+      si la importación se corta, los lotes ya confirmados quedan guardados.
+    - Las filas inválidas no detienen la importación: se informan con su número de línea.
+    - El resumen diario de los días afectados se recalcula una sola vez, al final.
+    - Con `id_importacion` (o el id devuelto) se puede seguir el progreso en
+      GET /importar/consumo/{id_importacion} mientras la subida está en curso.
+    """
+    formato = formato or formato_por_content_type(request.headers.get("content-type", ""))
+    if formato is None:
+        raise HTTPException(status_code=415, detail="Indique formato=csv|ndjson o un Content-Type text/csv o application/x-ndjson.")
+    id_importacion = id_importacion or uuid.uuid4().hex
+    clave = (usuario, id_importacion)
+    anterior = importaciones.get(clave)
+    if anterior is not None and anterior.progreso["estado"] == "en_curso":
+        raise HTTPException(status_code=409, detail=f"La importación '{id_importacion}' ya está en curso.")
+
+    importacion = ImportacionConsumo(id_importacion, usuario, formato)
+    importaciones[clave] = importacion
+    importaciones.move_to_end(clave)
+    while len(importaciones) > IMPORTACIONES_RECORDADAS:
+        importaciones.popitem(last=False)
+
+    async def guardar_lotes(todo: bool = False):
+        while len(importacion.lote) >= tamano_lote or (todo and importacion.lote):
+            filas = importacion.tomar_lote(tamano_lote)
+            await escritor_db.ejecutar_async(insertar_lote_importado, usuario, filas)
+            importacion.lote_guardado(filas)
+
+    try:
+        async for trozo in request.stream():
+            if trozo:
+                # Decodificar y validar es trabajo de CPU: se hace fuera del event loop
+                await run_in_threadpool(importacion.procesar_trozo, trozo)
+                await guardar_lotes()
+        importacion.procesar_trozo(b"", final=True)
+        await guardar_lotes(todo=True)
+        importacion.progreso["estado"] = "completada"
+    except HTTPException as e:
+        importacion.progreso.update(estado="fallida", detalle=e.detail)
+        raise
+    except ClientDisconnect:
+        importacion.progreso["estado"] = "interrumpida"
+        raise
+    finally:
+        if importacion.fechas:
+            # Los lotes confirmados quedan aunque la importación falle: sus días se recalculan igual
+            fechas = sorted(importacion.fechas)
+            try:
+                importacion.progreso["dias_actualizados"] = await escritor_db.ejecutar_async(reconstruir_resumen_dias, usuario, fechas)
+                canal_eventos.publicar("dias", {"fechas": fechas}, usuario)
+            except Exception as e:
+                print(f"No se pudo recalcular el resumen diario de la importación '{id_importacion}': {e!r}")
+                if importacion.progreso["estado"] == "completada":
+                    importacion.progreso["detalle"] = "Los consumos se guardaron, pero no se pudo recalcular el resumen diario."
+                    raise
+                # Si la importación ya había fallado, se propaga su error original y no este
+        if importacion.progreso["estado"] == "en_curso":
+            importacion.progreso["estado"] = "fallida"
+
+    return importacion.resumen()
+
+@app.get("/importar/consumo/{id_importacion}")
+def obtener_progreso_importacion(id_importacion: str, usuario: str = Depends(usuario_actual)):
+    """Progreso de una importación en curso o reciente del mismo usuario."""
+    importacion = importaciones.get((usuario, id_importacion))
+    if importacion is None:
+        raise HTTPException(status_code=404, detail=f"No se encontró la importación '{id_importacion}'.")
+    return importacion.resumen()
+
+@app.get("/eventos")
+async def flujo_eventos(request: Request, usuario: str = Depends(usuario_actual),
+                        last_event_id: Optional[str] = Header(None)):
+    """
+    Flujo Server-Sent Events con los cambios del usuario (consumos, días recalculados)
+    y del catálogo, para que los clientes actualicen solo lo que cambió en vez de
+    volver a pedir todo. Al reconectar, el encabezado Last-Event-ID recupera lo perdido.
+    """
+    cola = canal_eventos.suscribir(usuario, last_event_id)
+
+    async def generar():
+        try:
+            yield f"retry: {EVENTOS_REINTENTO_MS}\n\n"
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), EVENTOS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield canal_eventos.formatear(evento)
+        finally:
+            canal_eventos.desuscribir(cola)
+
+    return StreamingResponse(generar(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/admin/eventos", dependencies=[Depends(requerir_admin)])
+def obtener_estadisticas_eventos():
+    """Conexiones abiertas a /eventos y eventos publicados."""
+    return canal_eventos.estadisticas()
+
+@app.get("/admin/db-stats", dependencies=[Depends(requerir_admin)])
+def obtener_estadisticas_db():
+    """Estado del pool de conexiones, tiempos de espera por el bloqueo de escritura y commits agrupados."""
+    return dict(gestor_db.estadisticas(), escritor=escritor_db.estadisticas())
+
+@app.get("/admin/cache-edamam", dependencies=[Depends(requerir_admin)])
+def obtener_estadisticas_cache_edamam(conn: sqlite3.Connection = Depends(get_db)):
+    """Contadores de aciertos/fallos y tamaño de la caché de Edamam, más el estado del cliente HTTP."""
+    stats = cache_edamam.estadisticas(conn)
+    stats["cliente"] = cliente_edamam.estadisticas()
+    return stats
+
+@app.delete("/admin/cache-edamam", dependencies=[Depends(requerir_admin)])
+def purgar_cache_edamam(solo_vencidas: bool = False):
+    """Vacía la caché de Edamam, o solo las entradas vencidas si `solo_vencidas=true`."""
+    borradas = escritor_db.ejecutar(cache_edamam.purgar, solo_vencidas)
+    return {"mensaje": f"Se eliminaron {borradas} entradas de la caché.", "eliminadas": borradas}
+
+@app.post("/admin/cache-edamam/precalentar", dependencies=[Depends(requerir_admin)])
+async def precalentar_cache_edamam(req: PrecalentarCacheRequest):
+    """
+    Carga en la caché una lista de alimentos (p. ej. los más comunes) para que
+    las próximas consultas no tengan que ir a Edamam. Las consultas corren en
+    paralelo, acotadas por el límite de concurrencia del cliente de Edamam.
+    """
+    resultado = {"consultados": 0, "ya_en_cache": 0, "sin_resultado": 0, "errores": 0}
+    # No encolamos más consultas que cupos tiene el cliente, para no agotar su espera máxima
+    cupos = asyncio.Semaphore(cliente_edamam.max_concurrentes)
+
+    async def _precalentar(nombre: str):
+        clave = normalizar_nombre(nombre)
+        if not clave:
+            return
+        async with cupos:
+            await _precalentar_clave(clave, nombre)
+
+    async def _precalentar_clave(clave: str, nombre: str):
+        entrada = await ejecutar_en_db(cache_edamam.leer, clave)
+        if entrada is not None and entrada[0] == CacheEdamam.FRESCA:
+            resultado["ya_en_cache"] += 1
+            return
+        try:
+            datos = await consultar_y_cachear_edamam(clave, nombre)
+        except (*ERRORES_EDAMAM, EdamamSaturado):
+            resultado["errores"] += 1
+            return
+        resultado["consultados"] += 1
+        if datos is None:
+            resultado["sin_resultado"] += 1
+
+    await asyncio.gather(*(_precalentar(nombre) for nombre in dict.fromkeys(req.nombres)))
+    return resultado
+
+@app.get("/metrics", include_in_schema=False)
+def exponer_metricas():
+    """Métricas en formato de texto de Prometheus (latencias por ruta, consultas SQL, Edamam)."""
+    return Response(registro_metricas.exponer(), media_type=TIPO_CONTENIDO_METRICAS)
+
 @app.get("/")
 def root():
     return {"mensaje": "API Persistente de Alimentos está en línea y funcionando."}
 
 
 if __name__ == "__main__":
+    if sys.argv[1:] == ["reconstruir-resumen"]:
+        # Uso: python api_alimento.py reconstruir-resumen
+        init_db()
+        with gestor_db.conexion() as conn, gestor_db.transaccion(conn):
+            print(f"Resumen diario reconstruido para {reconstruir_resumen_diario(conn)} días.")
+        sys.exit(0)
+
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
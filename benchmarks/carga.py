@@ -0,0 +1,361 @@
+"""
+Prueba de carga reproducible de las dos APIs (alimentos y usuarios).
+
+Levanta en puertos libres, cada una en su propio proceso y con bases de datos en un
+directorio temporal:
+
+- api_alimento.py (catálogo, consumos, historial),
+- controller/API/user/api_server.py (registro y login),
+- un Edamam falso con latencia y tasa de error configurables.
+
+Luego siembra usuarios, catálogo y un año de historial, y ejecuta una mezcla de
+operaciones con N clientes concurrentes durante un tiempo fijo:
+
+    login            POST /login/
+    buscar           GET  /alimentos/buscar (autocompletado por prefijo)
+    consultar_hit    POST /consultar-alimento de un alimento del catálogo
+    consultar_miss   POST /consultar-alimento de un alimento nuevo (sale a Edamam)
+    registrar        POST /registrar-consumo
+    historial        GET  /historial del último año
+
+El resultado (p50/p95/p99 en ms, req/s y errores por operación y en total) se imprime
+como JSON, para comparar corridas y detectar regresiones.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/carga.py [--concurrencia 20] [--duracion 20] [--latencia-edamam-ms 80]
+                               [--error-edamam 0.02] [--mezcla buscar=5,historial=1,...]
+                               [--salida resultado.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEZCLA_POR_DEFECTO = "login=1,buscar=6,consultar_hit=4,consultar_miss=1,registrar=3,historial=1"
+CLAVE_JWT = "clave-prueba-de-carga"
+PASSWORD = "secreto123"
+ESPERA_ARRANQUE = 30  # Segundos máximos para que cada API responda
+
+
+# --- Edamam falso ---
+class ManejadorEdamam(BaseHTTPRequestHandler):
+    """Responde como el parser de Edamam tras `latencia` segundos; falla con 500 en una fracción `tasa_error`."""
+    latencia = 0.0
+    tasa_error = 0.0
+    consultas = 0
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        with self._lock:
+            ManejadorEdamam.consultas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if random.random() < self.tasa_error:
+            self._responder(500, {"error": "falla simulada"})
+            return
+        nombre = parse_qs(urlparse(self.path).query).get("ingr", [""])[0]
+        calorias = 50 + sum(map(ord, nombre)) % 400
+        self._responder(200, {"parsed": [{"food": {"label": nombre, "nutrients": {"ENERC_KCAL": calorias}}}]})
+
+    def _responder(self, codigo: int, datos: dict):
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_edamam_falso(latencia_ms: float, tasa_error: float) -> ThreadingHTTPServer:
+    ManejadorEdamam.latencia = latencia_ms / 1000
+    ManejadorEdamam.tasa_error = tasa_error
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ManejadorEdamam)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# --- Procesos de las APIs ---
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_api(modulo: str, puerto: int, directorio: str, entorno: dict) -> subprocess.Popen:
+    """Arranca `modulo:app` con uvicorn dentro de `directorio` (las bases relativas quedan ahí)."""
+    env = dict(os.environ, **entorno)
+    env["PYTHONPATH"] = RAIZ_PROYECTO + os.pathsep + env.get("PYTHONPATH", "")
+    log = open(os.path.join(directorio, f"{modulo.rsplit('.', 1)[-1]}.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{modulo}:app", "--host", "127.0.0.1", "--port", str(puerto),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=directorio, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def esperar_api(url: str, proceso: subprocess.Popen):
+    limite = time.monotonic() + ESPERA_ARRANQUE
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"La API en {url} terminó al arrancar (código {proceso.returncode}).")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"La API en {url} no respondió en {ESPERA_ARRANQUE} s.")
+
+
+# --- Datos iniciales ---
+def sembrar(url_usuarios: str, url_alimentos: str, usuarios: int, alimentos: int, consumos_por_dia: int) -> dict:
+    """Crea usuarios, catálogo y un año de historial por usuario. Devuelve los datos que usan las operaciones."""
+    nombres_usuario = [f"carga{i:03d}" for i in range(usuarios)]
+    tokens = {}
+    with httpx.Client(timeout=60) as cliente:
+        for nombre in nombres_usuario:
+            cliente.post(f"{url_usuarios}/register/", json={
+                "nombre_usuario": nombre, "password": PASSWORD, "genero": "Femenino", "peso": 65,
+                "altura": 165, "meta_calorias": 2000, "nivel_actividad": "Moderado",
+                "fecha_nacimiento": "1990-05-17",
+            }).raise_for_status()
+            respuesta = cliente.post(f"{url_usuarios}/login/", data={"username": nombre, "password": PASSWORD})
+            respuesta.raise_for_status()
+            tokens[nombre] = respuesta.json()["access_token"]
+
+        catalogo = [f"Alimento {i:04d} de carga" for i in range(alimentos)]
+        for nombre in catalogo:
+            cliente.post(f"{url_alimentos}/alimentos",
+                         json={"nombre": nombre, "calorias_100gr": 100 + len(nombre)}).raise_for_status()
+
+        hoy = date.today()
+        for nombre in nombres_usuario:
+            consumos = [
+                {"nombre": random.choice(catalogo), "fecha": (hoy - timedelta(days=dia)).isoformat(),
+                 "hora": f"{8 + 3 * i:02d}:{random.randint(0, 59):02d}", "cantidad": 150.0, "total_cal": 300.0}
+                for dia in range(365) for i in range(consumos_por_dia)
+            ]
+            for inicio in range(0, len(consumos), 1000):
+                cliente.post(f"{url_alimentos}/registrar-consumo/batch",
+                             json={"consumos": consumos[inicio:inicio + 1000]},
+                             headers={"Authorization": f"Bearer {tokens[nombre]}"}).raise_for_status()
+    return {"usuarios": nombres_usuario, "tokens": tokens, "catalogo": catalogo}
+
+
+# --- Operaciones ---
+def crear_operaciones(url_usuarios: str, url_alimentos: str, datos: dict) -> dict:
+    """Cada operación recibe el cliente HTTP y devuelve la respuesta."""
+    hoy = date.today()
+    hace_un_anio = (hoy - timedelta(days=365)).isoformat()
+
+    def autorizacion(usuario):
+        return {"Authorization": f"Bearer {datos['tokens'][usuario]}"}
+
+    async def login(cliente, usuario):
+        return await cliente.post(f"{url_usuarios}/login/", data={"username": usuario, "password": PASSWORD})
+
+    async def buscar(cliente, usuario):
+        nombre = random.choice(datos["catalogo"])
+        return await cliente.get(f"{url_alimentos}/alimentos/buscar",
+                                 params={"q": nombre[:random.randint(3, 12)], "limit": 20})
+
+    async def consultar_hit(cliente, usuario):
+        return await cliente.post(f"{url_alimentos}/consultar-alimento",
+                                  json={"nombre": random.choice(datos["catalogo"])})
+
+    async def consultar_miss(cliente, usuario):
+        # Nombre que no está en el catálogo ni en la caché: la consulta sale a Edamam
+        return await cliente.post(f"{url_alimentos}/consultar-alimento",
+                                  json={"nombre": f"nuevo {random.getrandbits(48):x}"})
+
+    async def registrar(cliente, usuario):
+        consumo = {"nombre": random.choice(datos["catalogo"]), "fecha": hoy.isoformat(),
+                   "hora": time.strftime("%H:%M"), "cantidad": 100.0, "total_cal": 200.0}
+        return await cliente.post(f"{url_alimentos}/registrar-consumo", json={"consumo": consumo},
+                                  headers=autorizacion(usuario))
+
+    async def historial(cliente, usuario):
+        return await cliente.get(f"{url_alimentos}/historial", headers=autorizacion(usuario),
+                                 params={"fecha_desde": hace_un_anio, "fecha_hasta": hoy.isoformat()})
+
+    return {"login": login, "buscar": buscar, "consultar_hit": consultar_hit,
+            "consultar_miss": consultar_miss, "registrar": registrar, "historial": historial}
+
+
+def parsear_mezcla(texto: str, disponibles) -> dict:
+    mezcla = {}
+    for parte in texto.split(","):
+        nombre, _, peso = parte.strip().partition("=")
+        if nombre not in disponibles:
+            raise SystemExit(f"Operación desconocida en --mezcla: '{nombre}'. Disponibles: {', '.join(disponibles)}")
+        mezcla[nombre] = float(peso or 1)
+    return {nombre: peso for nombre, peso in mezcla.items() if peso > 0}
+
+
+async def ejecutar_carga(operaciones: dict, mezcla: dict, usuarios: list, concurrencia: int,
+                         duracion: float, calentamiento: float) -> tuple:
+    """
+    Cada cliente elige una operación según los pesos de `mezcla` y la repite sin pausa.
+    Durante el calentamiento no se registra nada. Devuelve (muestras por operación, segundos medidos).
+    """
+    nombres = list(mezcla)
+    pesos = [mezcla[n] for n in nombres]
+    muestras = {nombre: {"latencias": [], "errores": 0, "codigos": {}} for nombre in nombres}
+    inicio_medicion = time.perf_counter() + calentamiento
+    fin = inicio_medicion + duracion
+    limites = httpx.Limits(max_connections=concurrencia * 2, max_keepalive_connections=concurrencia * 2)
+
+    async with httpx.AsyncClient(timeout=30, limits=limites) as cliente:
+        async def trabajador(indice: int):
+            usuario = usuarios[indice % len(usuarios)]
+            while True:
+                nombre = random.choices(nombres, pesos)[0]
+                inicio = time.perf_counter()
+                if inicio >= fin:
+                    return
+                try:
+                    respuesta = await operaciones[nombre](cliente, usuario)
+                    codigo = str(respuesta.status_code)
+                    error = respuesta.status_code >= 400
+                except httpx.HTTPError as e:
+                    codigo, error = type(e).__name__, True
+                terminado = time.perf_counter()
+                if inicio < inicio_medicion or terminado > fin:
+                    continue
+                muestra = muestras[nombre]
+                muestra["latencias"].append((terminado - inicio) * 1000)
+                muestra["codigos"][codigo] = muestra["codigos"].get(codigo, 0) + 1
+                if error:
+                    muestra["errores"] += 1
+
+        await asyncio.gather(*(trabajador(i) for i in range(concurrencia)))
+    return muestras, duracion
+
+
+# --- Informe ---
+def percentil(ordenadas: list, p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenadas:
+        return 0.0
+    indice = max(0, min(len(ordenadas) - 1, int(round(p / 100 * len(ordenadas) + 0.5)) - 1))
+    return round(ordenadas[indice], 2)
+
+
+def resumir(latencias: list, errores: int, segundos: float, codigos: dict = None) -> dict:
+    ordenadas = sorted(latencias)
+    resumen = {
+        "peticiones": len(ordenadas),
+        "errores": errores,
+        "req_s": round(len(ordenadas) / segundos, 1) if segundos else 0.0,
+        "p50_ms": percentil(ordenadas, 50),
+        "p95_ms": percentil(ordenadas, 95),
+        "p99_ms": percentil(ordenadas, 99),
+        "max_ms": round(ordenadas[-1], 2) if ordenadas else 0.0,
+    }
+    if codigos is not None:
+        resumen["codigos"] = dict(sorted(codigos.items()))
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, default=20, help="Clientes simultáneos")
+    parser.add_argument("--duracion", type=float, default=20, help="Segundos de medición")
+    parser.add_argument("--calentamiento", type=float, default=3, help="Segundos iniciales que no se miden")
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO, help="Pesos por operación: nombre=peso,...")
+    parser.add_argument("--latencia-edamam-ms", type=float, default=80)
+    parser.add_argument("--error-edamam", type=float, default=0.0, help="Fracción de consultas a Edamam que fallan (0-1)")
+    parser.add_argument("--usuarios", type=int, default=5)
+    parser.add_argument("--alimentos", type=int, default=2000, help="Tamaño del catálogo sembrado")
+    parser.add_argument("--consumos-por-dia", type=int, default=4, help="Consumos por día en el año de historial de cada usuario")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--salida", help="Además de imprimirlo, guarda el JSON en este archivo")
+    parser.add_argument("--conservar", action="store_true", help="No borrar el directorio temporal (bases y logs)")
+    args = parser.parse_args()
+    random.seed(args.semilla)
+
+    directorio = tempfile.mkdtemp(prefix="carga_apis_")
+    edamam = iniciar_edamam_falso(args.latencia_edamam_ms, args.error_edamam)
+    puerto_alimentos, puerto_usuarios = puerto_libre(), puerto_libre()
+    entorno = {
+        "Key_JWT": CLAVE_JWT,
+        "DATABASE_URL": f"sqlite:///{os.path.join(directorio, 'app.db')}",
+        "EDAMAM_URL": f"http://127.0.0.1:{edamam.server_address[1]}/api/food-database/v2/parser",
+        "EDAMAM_APP_ID": "carga",
+        "EDAMAM_APP_KEY": "carga",
+    }
+    procesos = [
+        iniciar_api("api_alimento", puerto_alimentos, directorio, entorno),
+        iniciar_api("controller.API.user.api_server", puerto_usuarios, directorio, entorno),
+    ]
+    url_alimentos = f"http://127.0.0.1:{puerto_alimentos}"
+    url_usuarios = f"http://127.0.0.1:{puerto_usuarios}"
+    try:
+        esperar_api(f"{url_alimentos}/", procesos[0])
+        esperar_api(f"{url_usuarios}/docs", procesos[1])
+
+        inicio = time.perf_counter()
+        datos = sembrar(url_usuarios, url_alimentos, args.usuarios, args.alimentos, args.consumos_por_dia)
+        siembra_s = time.perf_counter() - inicio
+
+        operaciones = crear_operaciones(url_usuarios, url_alimentos, datos)
+        mezcla = parsear_mezcla(args.mezcla, operaciones)
+        muestras, segundos = asyncio.run(ejecutar_carga(
+            operaciones, mezcla, datos["usuarios"], args.concurrencia, args.duracion, args.calentamiento))
+
+        todas = [latencia for muestra in muestras.values() for latencia in muestra["latencias"]]
+        resultado = {
+            "configuracion": {
+                "concurrencia": args.concurrencia, "duracion_s": args.duracion, "calentamiento_s": args.calentamiento,
+                "mezcla": mezcla, "latencia_edamam_ms": args.latencia_edamam_ms, "error_edamam": args.error_edamam,
+                "usuarios": args.usuarios, "alimentos": args.alimentos,
+                "consumos_historial": args.usuarios * 365 * args.consumos_por_dia, "semilla": args.semilla,
+            },
+            "siembra_s": round(siembra_s, 2),
+            "consultas_edamam": ManejadorEdamam.consultas,
+            "total": resumir(todas, sum(m["errores"] for m in muestras.values()), segundos),
+            "operaciones": {nombre: resumir(m["latencias"], m["errores"], segundos, m["codigos"])
+                            for nombre, m in muestras.items()},
+        }
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            try:
+                proceso.wait(10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+        edamam.shutdown()
+        if args.conservar:
+            print(f"Bases y logs en {directorio}", file=sys.stderr)
+        else:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
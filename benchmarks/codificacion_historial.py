@@ -0,0 +1,113 @@
+"""
+Benchmark de la codificación JSON y la compresión de /historial.
+
+Crea una base de datos temporal con un historial de N consumos (50.000 por defecto) y mide:
+
+1. Codificación: `JSONResponse(jsonable_encoder(filas))` (lo que hacía FastAPI antes)
+   contra `ORJSONResponse(filas)` (clase de respuesta actual), con tamaño plano y en gzip.
+2. Petición completa: GET /historial de todo el rango a través de la app, sin y con
+   `Accept-Encoding: gzip`, con los bytes que viajan por la red.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/codificacion_historial.py [--filas 50000] [--repeticiones 5]
+"""
+import argparse
+import gzip
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ_PROYECTO)
+
+
+def medir(funcion, repeticiones: int):
+    """Ejecuta `funcion` varias veces y devuelve (mediana en ms, último resultado)."""
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), resultado
+
+
+USUARIO = "benchmark"
+
+
+def poblar_historial(api, filas: int) -> tuple:
+    """Inserta `filas` consumos repartidos en los últimos días y devuelve el rango (desde, hasta)."""
+    hoy = date.today()
+    dias = max(1, filas // 20)
+    nombres = [f"Alimento de prueba {i}" for i in range(500)]
+    registros = []
+    for i in range(filas):
+        fecha = (hoy - timedelta(days=i % dias)).isoformat()
+        hora = f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}"
+        cantidad = round(random.uniform(10, 500), 1)
+        registros.append((random.choice(nombres), fecha, hora, cantidad, round(cantidad * random.uniform(0.2, 5), 2), USUARIO))
+
+    with api.gestor_db.conexion() as conn:
+        with api.gestor_db.transaccion(conn):
+            conn.executemany(
+                "INSERT INTO consumo_diario (nombre, fecha, hora, cantidad, total_cal, usuario) VALUES (?, ?, ?, ?, ?, ?)",
+                registros
+            )
+            api.reconstruir_resumen_diario(conn)
+    return (hoy - timedelta(days=dias - 1)).isoformat(), hoy.isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=50_000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    # La API usa un archivo relativo (alimentos_app.db): trabajamos dentro de un directorio temporal
+    directorio = tempfile.mkdtemp(prefix="bench_historial_")
+    os.chdir(directorio)
+    # La API exige un JWT firmado con Key_JWT para saber de quién es el historial
+    os.environ.setdefault("Key_JWT", "clave-benchmark-historial")
+
+    import api_alimento as api
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.testclient import TestClient
+
+    with TestClient(api.app) as cliente:
+        desde, hasta = poblar_historial(api, args.filas)
+        with api.gestor_db.conexion() as conn:
+            query, params = api.consulta_historial(USUARIO, desde, hasta, None, None)
+            filas = [dict(fila) for fila in conn.execute(query, params).fetchall()]
+
+        print(f"Historial de {len(filas)} filas ({desde} a {hasta}), mediana de {args.repeticiones} repeticiones\n")
+
+        print("Codificación")
+        ms_antes, cuerpo_antes = medir(lambda: JSONResponse(jsonable_encoder(filas)).body, args.repeticiones)
+        ms_despues, cuerpo_despues = medir(lambda: ORJSONResponse(filas).body, args.repeticiones)
+        for nombre, ms, cuerpo in (("json + jsonable_encoder", ms_antes, cuerpo_antes),
+                                   ("orjson", ms_despues, cuerpo_despues)):
+            comprimido = len(gzip.compress(cuerpo, compresslevel=api.GZIP_NIVEL))
+            print(f"  {nombre:<24} {ms:9.1f} ms   {len(cuerpo) / 1024:9.1f} KiB   gzip {comprimido / 1024:8.1f} KiB")
+        print(f"  aceleración: x{ms_antes / ms_despues:.1f}\n")
+
+        print(f"GET /historial (rango completo, gzip nivel {api.GZIP_NIVEL})")
+        params = {"fecha_desde": desde, "fecha_hasta": hasta}
+        token = api.jwt.encode({"sub": USUARIO}, api.JWT_SECRET_KEY, algorithm=api.JWT_ALGORITHM)
+        for nombre, encoding in (("sin compresión", "identity"), ("gzip", "gzip")):
+            ms, respuesta = medir(
+                lambda: cliente.get("/historial", params=params, headers={"Accept-Encoding": encoding,
+                                                                          "Authorization": f"Bearer {token}"}),
+                args.repeticiones
+            )
+            print(f"  {nombre:<24} {ms:9.1f} ms   {respuesta.num_bytes_downloaded / 1024:9.1f} KiB en la red")
+
+    api.gestor_db.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Rendimiento de la API de usuarios con muchos clientes simultáneos, antes y después de
+un cambio.
+
+Levanta dos versiones de controller/API/user/api_server.py, una a la vez y cada una
+con su propia base en un directorio temporal:
+
+- antes:   el archivo tal como está en la revisión `--base` de git (obligatoria),
+- despues: el archivo actual del árbol de trabajo.
+
+Para comparar contra el servidor síncrono, `--base` es el padre del commit que pasó
+la API al motor async; se obtiene con:
+
+    git log --format=%H~1 -1 --grep='async SQLAlchemy engine' -- controller/API/user/api_server.py
+
+En cada una registra usuarios y mide por separado, con N clientes concurrentes:
+
+    me      GET  /users/me/  (decodifica el JWT y lee el usuario: base de datos)
+    login   POST /login/     (verifica el hash de la contraseña: CPU)
+
+Las peticiones que no terminan dentro de la ventana de medición no se cuentan: una
+versión que se traba (p. ej. esperando conexiones del pool) aparece con 0 req/s.
+El generador de carga corre en la misma máquina; con pocos núcleos también compite
+por CPU con la API, así que conviene comparar versiones y no valores absolutos.
+
+Imprime req/s y p50/p95/p99 en ms de cada escenario y versión como JSON.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/usuarios_concurrencia.py --base <revisión> [--concurrencia 64] [--duracion 10]
+                                               [--salida resultado.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from carga import (  # noqa: E402
+    CLAVE_JWT, PASSWORD, RAIZ_PROYECTO, ejecutar_carga, esperar_api, iniciar_api, puerto_libre, resumir,
+)
+
+ARCHIVO_API = "controller/API/user/api_server.py"
+
+
+def preparar_version(nombre: str, revision: str, directorio: str) -> str:
+    """
+    Copia la versión a medir como módulo `api_usuarios_<nombre>` en su directorio. Sin
+    revisión se usa el archivo actual. Devuelve el nombre del módulo para uvicorn.
+    """
+    destino = os.path.join(directorio, nombre)
+    os.makedirs(destino)
+    modulo = f"api_usuarios_{nombre}"
+    ruta = os.path.join(destino, f"{modulo}.py")
+    if revision:
+        codigo = subprocess.run(["git", "show", f"{revision}:{ARCHIVO_API}"], cwd=RAIZ_PROYECTO,
+                                check=True, capture_output=True).stdout
+        with open(ruta, "wb") as archivo:
+            archivo.write(codigo)
+    else:
+        shutil.copyfile(os.path.join(RAIZ_PROYECTO, ARCHIVO_API), ruta)
+    return modulo
+
+
+def sembrar_usuarios(url: str, usuarios: int) -> dict:
+    """Registra los usuarios y devuelve un token de acceso por usuario."""
+    tokens = {}
+    with httpx.Client(timeout=60) as cliente:
+        for i in range(usuarios):
+            nombre = f"concurrencia{i:03d}"
+            cliente.post(f"{url}/register/", json={
+                "nombre_usuario": nombre, "password": PASSWORD, "genero": "Masculino", "peso": 75,
+                "altura": 178, "meta_calorias": 2300, "nivel_actividad": "Ligero",
+                "fecha_nacimiento": "1988-11-02",
+            }).raise_for_status()
+            respuesta = cliente.post(f"{url}/login/", data={"username": nombre, "password": PASSWORD})
+            respuesta.raise_for_status()
+            tokens[nombre] = respuesta.json()["access_token"]
+    return tokens
+
+
+def medir_version(modulo: str, directorio: str, args) -> dict:
+    puerto = puerto_libre()
+    entorno = {"Key_JWT": CLAVE_JWT, "DATABASE_URL": f"sqlite:///{os.path.join(directorio, 'app.db')}"}
+    proceso = iniciar_api(modulo, puerto, directorio, entorno)
+    url = f"http://127.0.0.1:{puerto}"
+    try:
+        esperar_api(f"{url}/docs", proceso)
+        tokens = sembrar_usuarios(url, args.usuarios)
+
+        async def login(cliente, usuario):
+            return await cliente.post(f"{url}/login/", data={"username": usuario, "password": PASSWORD})
+
+        async def me(cliente, usuario):
+            return await cliente.get(f"{url}/users/me/", headers={"Authorization": f"Bearer {tokens[usuario]}"})
+
+        resultado = {}
+        # /users/me/ primero: los login que quedaran pendientes en el servidor no lo afectan
+        for nombre, operacion in (("me", me), ("login", login)):
+            muestras, segundos = asyncio.run(ejecutar_carga(
+                {nombre: operacion}, {nombre: 1}, list(tokens), args.concurrencia, args.duracion, args.calentamiento))
+            muestra = muestras[nombre]
+            resultado[nombre] = resumir(muestra["latencias"], muestra["errores"], segundos, muestra["codigos"])
+        return resultado
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", required=True, help="Revisión de git de la versión 'antes' (ver arriba)")
+    parser.add_argument("--concurrencia", type=int, default=64, help="Clientes simultáneos")
+    parser.add_argument("--duracion", type=float, default=10, help="Segundos de medición por escenario")
+    parser.add_argument("--calentamiento", type=float, default=2, help="Segundos iniciales que no se miden")
+    parser.add_argument("--usuarios", type=int, default=20)
+    parser.add_argument("--salida", help="Además de imprimirlo, guarda el JSON en este archivo")
+    parser.add_argument("--conservar", action="store_true", help="No borrar el directorio temporal (bases y logs)")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="usuarios_concurrencia_")
+    try:
+        resultado = {
+            "configuracion": {"base": args.base, "concurrencia": args.concurrencia, "duracion_s": args.duracion,
+                              "calentamiento_s": args.calentamiento, "usuarios": args.usuarios},
+        }
+        for nombre, revision in (("antes", args.base), ("despues", None)):
+            modulo = preparar_version(nombre, revision, directorio)
+            resultado[nombre] = medir_version(modulo, os.path.join(directorio, nombre), args)
+    finally:
+        if args.conservar:
+            print(f"Bases y logs en {directorio}", file=sys.stderr)
+        else:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
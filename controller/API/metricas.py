@@ -0,0 +1,250 @@
+# controller/API/metricas.py
+"""
+Métricas de las APIs (alimentos y usuarios) en el formato de texto de Prometheus.
+
+No depende de prometheus_client: cada métrica es un diccionario de valores por
+combinación de etiquetas protegido por su propio lock. Registrar una observación
+cuesta un bisect y una suma; el texto solo se arma cuando alguien pide /metrics,
+así que si nadie las recolecta el costo por request es prácticamente nulo.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# Límites (le) de los histogramas
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS_DB = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+BUCKETS_TIEMPO_DB = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Ruta para los requests que no coinciden con ningún endpoint (404): no se usa la
+# URL real como etiqueta para que un escaneo no cree una serie por cada URL inventada
+RUTA_DESCONOCIDA = "<sin_ruta>"
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _formatear_numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    if isinstance(valor, int) or float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _etiquetas(nombres: Tuple[str, ...], valores: Tuple[str, ...], extra: str = "") -> str:
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+# --- Tipos de métrica ---
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        self._valores: Dict[Tuple[str, ...], object] = {}
+
+    def _encabezado(self) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+    def exponer(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Contador(_Metrica):
+    """Valor que solo crece (p. ej. errores de Edamam por tipo)."""
+    tipo = "counter"
+
+    def inc(self, *valores_etiquetas: str, cantidad: float = 1):
+        with self._lock:
+            self._valores[valores_etiquetas] = self._valores.get(valores_etiquetas, 0) + cantidad
+
+    def exponer(self) -> List[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        lineas = self._encabezado()
+        for etiquetas, valor in valores:
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_formatear_numero(valor)}")
+        return lineas
+
+
+class Indicador(_Metrica):
+    """
+    Valor que sube y baja (p. ej. requests en curso). Con `funcion` el valor no se
+    guarda: se calcula en el momento de exponer, sin costo entre recolecciones.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, funcion: Optional[Callable[[], float]] = None):
+        super().__init__(nombre, ayuda)
+        self._funcion = funcion
+        self._valor = 0
+
+    def inc(self, cantidad: float = 1):
+        with self._lock:
+            self._valor += cantidad
+
+    def dec(self, cantidad: float = 1):
+        with self._lock:
+            self._valor -= cantidad
+
+    def exponer(self) -> List[str]:
+        if self._funcion is not None:
+            valor = self._funcion()
+        else:
+            with self._lock:
+                valor = self._valor
+        return self._encabezado() + [f"{self.nombre} {_formatear_numero(valor)}"]
+
+
+class Histograma(_Metrica):
+    """Distribución de observaciones en buckets acumulativos (le), más su suma y cantidad."""
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), buckets: Iterable[float] = BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor: float, *valores_etiquetas: str):
+        # El bucket i cuenta las observaciones <= buckets[i]; el último es +Inf
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._valores.get(valores_etiquetas)
+            if serie is None:
+                serie = self._valores[valores_etiquetas] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self) -> List[str]:
+        with self._lock:
+            series = [(etiquetas, list(conteos), suma, cuenta) for etiquetas, (conteos, suma, cuenta) in self._valores.items()]
+        lineas = self._encabezado()
+        for etiquetas, conteos, suma, cuenta in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += conteo
+                le = f'le="{_formatear_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {_formatear_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {cuenta}")
+        return lineas
+
+
+class RegistroMetricas:
+    """Conjunto de métricas de una API. Cada app crea el suyo y lo expone en /metrics."""
+    def __init__(self):
+        self._metricas: List[_Metrica] = []
+
+    def _agregar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Contador:
+        return self._agregar(Contador(nombre, ayuda, etiquetas))
+
+    def indicador(self, nombre: str, ayuda: str, funcion: Optional[Callable[[], float]] = None) -> Indicador:
+        return self._agregar(Indicador(nombre, ayuda, funcion))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (),
+                   buckets: Iterable[float] = BUCKETS_LATENCIA) -> Histograma:
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def exponer(self) -> str:
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+# --- Consultas a la base de datos por request ---
+# Cada request lleva su propio acumulador [consultas, segundos]. Los endpoints síncronos
+# corren en el threadpool con una copia del contexto, que apunta a la misma lista.
+_consultas_db: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("consultas_db", default=None)
+
+
+def registrar_consulta_db(segundos: float):
+    """Suma una consulta al request en curso. Fuera de un request (arranque, tareas) no hace nada."""
+    medicion = _consultas_db.get()
+    if medicion is not None:
+        medicion[0] += 1
+        medicion[1] += segundos
+
+
+# --- Middleware HTTP ---
+class MetricasHTTP:
+    """Métricas por request que comparten ambas APIs."""
+    def __init__(self, registro: RegistroMetricas):
+        self.en_curso = registro.indicador(
+            "http_requests_in_flight", "Requests HTTP que se están atendiendo.")
+        self.duracion = registro.histograma(
+            "http_request_duration_seconds", "Tiempo hasta enviar la respuesta completa, por ruta y código.",
+            ("method", "route", "status"))
+        self.consultas_db = registro.histograma(
+            "db_queries_per_request", "Consultas SQL ejecutadas por request.",
+            ("route",), BUCKETS_CONSULTAS_DB)
+        self.tiempo_db = registro.histograma(
+            "db_query_seconds_per_request", "Tiempo total en consultas SQL por request.",
+            ("route",), BUCKETS_TIEMPO_DB)
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI (no BaseHTTPMiddleware: así el endpoint corre en el mismo contexto y
+    las consultas a la base se atribuyen a su request). La ruta es la plantilla del
+    endpoint ("/resumen-diario/{fecha_str}"), no la URL, para acotar las series.
+    La duración se toma al enviar el último trozo del cuerpo, sin contar las
+    BackgroundTasks que corren después.
+    """
+    def __init__(self, app, metricas: MetricasHTTP):
+        self.app = app
+        self.metricas = metricas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metricas = self.metricas
+        inicio = time.perf_counter()
+        medicion = [0, 0.0]
+        token = _consultas_db.set(medicion)
+        estado = {"codigo": 500, "registrado": False}
+
+        def registrar():
+            estado["registrado"] = True
+            ruta = getattr(scope.get("route"), "path", RUTA_DESCONOCIDA)
+            metricas.duracion.observar(time.perf_counter() - inicio, scope["method"], ruta, str(estado["codigo"]))
+            metricas.consultas_db.observar(medicion[0], ruta)
+            metricas.tiempo_db.observar(medicion[1], ruta)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+            elif mensaje["type"] == "http.response.body" and not mensaje.get("more_body", False):
+                await send(mensaje)
+                if not estado["registrado"]:
+                    registrar()
+                return
+            await send(mensaje)
+
+        metricas.en_curso.inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # Error sin respuesta o cliente desconectado a mitad del cuerpo
+            if not estado["registrado"]:
+                registrar()
+            metricas.en_curso.dec()
+            _consultas_db.reset(token)
@@ -1,26 +1,68 @@
+import asyncio
+import hashlib
+import math
 import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
-from typing import Optional
+from typing import Any, Optional
 import uvicorn
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, BackgroundTasks, Depends, Header, HTTPException, Request, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from pydantic import BaseModel, Field, field_validator, computed_field
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime
+from sqlalchemy import delete, event, inspect, select, text, update, Column, Integer, String, Float, Date, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+from controller.API.metricas import (
+    TIPO_CONTENIDO as TIPO_CONTENIDO_METRICAS, MetricasHTTP, MiddlewareMetricas,
+    RegistroMetricas, registrar_consulta_db,
+)
 
 # --- 1. Configuración (Inspirado en tu ApiConfig) ---
 
+def _url_async(url: str) -> str:
+    """Usa el driver asíncrono aiosqlite aunque la URL venga como sqlite:/// (p. ej. en DATABASE_URL)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
 class Settings:
-    # URL de la base de datos (usamos SQLite por simplicidad)
-    SQLALCHEMY_DATABASE_URI: str = os.environ.get('DATABASE_URL') or 'sqlite:///./app.db'
+    # URL de la base de datos (usamos SQLite por simplicidad, con el driver asíncrono aiosqlite)
+    SQLALCHEMY_DATABASE_URI: str = _url_async(os.environ.get('DATABASE_URL') or 'sqlite:///./app.db')
+    DB_BUSY_TIMEOUT_MS: int = 5000
     
     # Configuración de JWT
     JWT_SECRET_KEY: str = os.environ.get('Key_JWT') or 'dev-secret-key-change-in-production'
     JWT_ALGORITHM: str = "HS256"
     JWT_ACCESS_TOKEN_EXPIRES_MINUTES: int = 60 # Equivalente a 1 hora
+    # Vida de cada refresh token; cada renovación entrega uno nuevo con el plazo completo
+    JWT_REFRESH_TOKEN_EXPIRES_DAYS: int = int(os.environ.get('JWT_REFRESH_TOKEN_EXPIRES_DAYS', '30'))
+
+    # Respuestas más pequeñas que esto (en bytes) se envían sin comprimir
+    GZIP_MINIMUM_SIZE: int = int(os.environ.get('GZIP_MINIMUM_SIZE', '1024'))
+    GZIP_COMPRESS_LEVEL: int = 5 # Nivel 9 (el predeterminado) es varias veces más lento por muy poca ganancia
+
+    # Hilos dedicados a calcular hashes de contraseñas (CPU intensivo); el resto espera su turno
+    PASSWORD_HASH_WORKERS: int = int(os.environ.get('PASSWORD_HASH_WORKERS') or min(4, os.cpu_count() or 1))
+    # Hashes en curso + en espera a partir de los cuales login/registro responden 503 con Retry-After
+    PASSWORD_HASH_COLA_MAX: int = int(os.environ.get('PASSWORD_HASH_COLA_MAX', '32'))
+    # Método y costo de werkzeug para los hashes nuevos. Si cambia, los hashes con otro
+    # costo se recalculan en el siguiente login correcto de cada usuario
+    PASSWORD_HASH_METODO: str = os.environ.get('PASSWORD_HASH_METODO', 'scrypt:32768:8:1')
+
+    # Cachés en memoria de /users/me/: tokens ya verificados (hasta que vencen) y perfiles
+    TOKEN_CACHE_MAX: int = int(os.environ.get('TOKEN_CACHE_MAX', '10000'))
+    PERFIL_CACHE_MAX: int = int(os.environ.get('PERFIL_CACHE_MAX', '5000'))
+    PERFIL_CACHE_TTL: int = int(os.environ.get('PERFIL_CACHE_TTL', '300')) # Segundos; acota lo que dura un cambio hecho por fuera de la API
 
 settings = Settings()
 
@@ -41,9 +83,13 @@ class Usuario(Base):
     nivel_actividad = Column(String(15), nullable=False)
     fecha_nacimiento = Column(Date, nullable=False)
     registro = Column(DateTime, default=datetime.utcnow)
+    # Se incrementa en cada UPDATE del ORM; PATCH /users/me/ lo compara con If-Match
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, METODO_HASH)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -54,28 +100,193 @@ class Usuario(Base):
         edad_calculada = today.year - self.fecha_nacimiento.year - ((today.month, today.day) < (self.fecha_nacimiento.month, self.fecha_nacimiento.day))
         return edad_calculada
 
+class RefreshToken(Base):
+    """
+    Refresh tokens emitidos. Solo se guarda el SHA-256 del token: quien lea la base no
+    puede usarlos. Los que salen de un mismo login comparten `familia`; cada uno se
+    canjea una sola vez (rotación) y revocar la familia cierra esa sesión.
+    """
+    __tablename__ = 'refresh_tokens'
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    nombre_usuario = Column(String(80), index=True, nullable=False)
+    familia = Column(String(32), index=True, nullable=False)
+    creado = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expira = Column(DateTime, nullable=False)
+    usado = Column(DateTime)     # Cuándo se canjeó por el siguiente de la familia
+    revocado = Column(DateTime)  # Cuándo se cerró la sesión (logout o reutilización detectada)
+
 
 # --- Configuración de la Base de Datos ---
 
-engine = create_engine(
+engine = create_async_engine(
     settings.SQLALCHEMY_DATABASE_URI,
-    connect_args={"check_same_thread": False} # Necesario para SQLite
+    connect_args={"timeout": settings.DB_BUSY_TIMEOUT_MS / 1000},
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Crear tablas en la base de datos
-Base.metadata.create_all(bind=engine)
+# expire_on_commit=False: los objetos siguen legibles después del commit sin volver a consultar
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _configurar_sqlite(dbapi_connection, connection_record):
+        """WAL: las lecturas (login, /users/me/) no esperan a las escrituras (registro)."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.DB_BUSY_TIMEOUT_MS)}")
+        cursor.close()
+
+# Tiempo de cada sentencia SQL, para las métricas por request de /metrics
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _inicio_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info["inicio_consulta"] = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _fin_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop("inicio_consulta", None)
+    if inicio is not None:
+        registrar_consulta_db(time.perf_counter() - inicio)
+
+def _agregar_columnas_nuevas(conn):
+    """create_all no modifica tablas existentes: agrega a mano las columnas de versiones posteriores."""
+    columnas = {columna["name"] for columna in inspect(conn).get_columns("usuarios")}
+    if "version" not in columnas:
+        conn.execute(text("ALTER TABLE usuarios ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+async def crear_tablas():
+    """Crea las tablas que falten. Se ejecuta al iniciar la API."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_agregar_columnas_nuevas)
 
 # Dependencia para obtener la sesión de la BD
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# --- Hash de contraseñas ---
+# werkzeug (scrypt/pbkdf2) tarda decenas de ms de CPU por hash: se calcula en un pool de
+# hilos acotado para no bloquear el event loop ni ocupar el threadpool de FastAPI
+
+def normalizar_metodo_hash(metodo: str) -> str:
+    """Método con todos sus parámetros, tal como queda al inicio del hash ('scrypt' -> 'scrypt:32768:8:1')."""
+    nombre, *args = metodo.split(":")
+    if nombre == "scrypt" and not args:
+        return "scrypt:32768:8:1"
+    if nombre == "pbkdf2" and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return metodo
+
+METODO_HASH = normalizar_metodo_hash(settings.PASSWORD_HASH_METODO)
+
+def requiere_rehash(password_hash: str) -> bool:
+    """True si el hash guardado se generó con otro método o costo que el configurado."""
+    return password_hash.split("$", 1)[0] != METODO_HASH
+
+class PoolHashSaturado(Exception):
+    """Hay demasiados hashes en cola: la petición se rechaza en vez de esperar."""
+    def __init__(self, reintentar_en: int):
+        super().__init__(f"Pool de hashes saturado; reintentar en {reintentar_en} s")
+        self.reintentar_en = reintentar_en
+
+class PoolHash:
+    """
+    Pool de hilos acotado para los hashes de contraseñas, con un máximo de trabajos
+    pendientes (en curso + en espera). Pasado el máximo, `ejecutar` falla enseguida con
+    PoolHashSaturado en vez de encolar: una ráfaga de logins no deja esperando al resto.
+    """
+    def __init__(self, hilos: int, cola_max: int):
+        self.hilos = max(1, hilos)
+        self.cola_max = cola_max
+        self._executor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="hash-password")
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._tiempo_medio = 0.1  # Segundos por hash (media móvil), para estimar el Retry-After
+
+    def pendientes(self) -> int:
+        return self._pendientes
+
+    def espera_estimada(self) -> int:
+        """Segundos aproximados hasta que se vacíe la cola actual (mínimo 1)."""
+        with self._lock:
+            return max(1, math.ceil(self._pendientes * self._tiempo_medio / self.hilos))
+
+    async def ejecutar(self, operacion: str, funcion, *args):
+        with self._lock:
+            if self._pendientes >= self.cola_max:
+                saturado = True
+            else:
+                saturado = False
+                self._pendientes += 1
+        if saturado:
+            metrica_hash_rechazos.inc(operacion)
+            raise PoolHashSaturado(self.espera_estimada())
+        encolado = time.perf_counter()
+        try:
+            futuro = self._executor.submit(self._medir, operacion, encolado, funcion, *args)
+        except BaseException:
+            self._liberar()
+            raise
+        # El cupo se libera cuando el trabajo termina o, si se cancela mientras espera en la
+        # cola (p. ej. el cliente se desconectó), cuando se cancela: _medir nunca llega a correr
+        futuro.add_done_callback(lambda _futuro: self._liberar())
+        return await asyncio.wrap_future(futuro)
+
+    def _liberar(self):
+        with self._lock:
+            self._pendientes -= 1
+
+    def _medir(self, operacion: str, encolado: float, funcion, *args):
+        inicio = time.perf_counter()
+        metrica_hash_espera.observar(inicio - encolado, operacion)
+        try:
+            return funcion(*args)
+        finally:
+            duracion = time.perf_counter() - inicio
+            metrica_hash_duracion.observar(duracion, operacion)
+            with self._lock:
+                self._tiempo_medio = 0.8 * self._tiempo_medio + 0.2 * duracion
+
+    def cerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+pool_hash = PoolHash(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_COLA_MAX)
+
+async def buscar_usuario(db: AsyncSession, nombre_usuario: str) -> Optional[Usuario]:
+    resultado = await db.execute(select(Usuario).where(Usuario.nombre_usuario == nombre_usuario))
+    return resultado.scalar_one_or_none()
+
+async def hashear_password(password: str) -> str:
+    return await pool_hash.ejecutar("hashear", generate_password_hash, password, METODO_HASH)
+
+async def verificar_password(password_hash: str, password: str) -> bool:
+    return await pool_hash.ejecutar("verificar", check_password_hash, password_hash, password)
+
+async def actualizar_hash(nombre_usuario: str, hash_anterior: str, password: str):
+    """
+    Recalcula con el método vigente el hash de un usuario que acaba de iniciar sesión.
+    Corre después de responder; si el pool está saturado se deja para el próximo login.
+    """
+    try:
+        nuevo_hash = await hashear_password(password)
+    except PoolHashSaturado:
+        return
+    async with SessionLocal() as db:
+        # Solo si nadie cambió la contraseña mientras tanto
+        resultado = await db.execute(
+            update(Usuario)
+            .where(Usuario.nombre_usuario == nombre_usuario, Usuario.password_hash == hash_anterior)
+            .values(password_hash=nuevo_hash)
+        )
+        await db.commit()
+    if resultado.rowcount:
+        invalidar_perfil(nombre_usuario)
 
 # --- 3. Esquemas Pydantic (Tu validacion.py adaptado) ---
 
+NIVELES_ACTIVIDAD = ['Sedentario', 'Ligero', 'Moderado', 'Intenso']
+
 class UsuarioBase(BaseModel):
     nombre_usuario: str = Field(..., min_length=3, max_length=80)
     genero: str
@@ -95,7 +306,7 @@ class UsuarioBase(BaseModel):
     @field_validator('nivel_actividad')
     @classmethod
     def nivel_actividad_valido(cls, v):
-        if v not in ['Sedentario', 'Ligero', 'Moderado', 'Intenso']:
+        if v not in NIVELES_ACTIVIDAD:
             raise ValueError("El nivel de actividad no es válido")
         return v
         
@@ -111,6 +322,20 @@ class UsuarioBase(BaseModel):
 class UsuarioCreate(UsuarioBase):
     password: str = Field(..., min_length=6)
 
+class UsuarioUpdate(BaseModel):
+    """Campos del perfil que se pueden modificar; los que no vienen quedan como están."""
+    peso: Optional[float] = Field(None, gt=30, le=300)
+    altura: Optional[int] = Field(None, gt=100, le=250)
+    meta_calorias: Optional[int] = Field(None, gt=1000, le=5000)
+    nivel_actividad: Optional[str] = None
+
+    @field_validator('nivel_actividad')
+    @classmethod
+    def nivel_actividad_valido(cls, v):
+        if v is not None and v not in NIVELES_ACTIVIDAD:
+            raise ValueError("El nivel de actividad no es válido")
+        return v
+
 class UsuarioLogin(BaseModel):
     nombre_usuario: str
     password: str
@@ -126,6 +351,7 @@ class UsuarioPublic(BaseModel):
     nivel_actividad: str
     fecha_nacimiento: date
     registro: datetime
+    version: int
     
     # NUEVO: Campo calculado para la edad usando computed_field
     @computed_field
@@ -141,6 +367,11 @@ class UsuarioPublic(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None # Segundos de vida del access_token
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(..., min_length=1, max_length=256)
 
 # --- 4. Lógica de Autenticación y JWT ---
 
@@ -156,29 +387,210 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
     return encoded_jwt
 
+# --- Refresh tokens ---
+def hash_refresh_token(token: str) -> str:
+    # Tiene 256 bits aleatorios: basta un SHA-256, sin el costo de un hash de contraseña
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def emitir_refresh_token(db: AsyncSession, nombre_usuario: str, familia: Optional[str] = None) -> str:
+    """Agrega a la sesión un refresh token nuevo (el commit lo hace quien llama) y lo devuelve en claro."""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        token_hash=hash_refresh_token(token),
+        nombre_usuario=nombre_usuario,
+        familia=familia or secrets.token_hex(16),
+        expira=datetime.utcnow() + timedelta(days=settings.JWT_REFRESH_TOKEN_EXPIRES_DAYS),
+    ))
+    return token
+
+async def revocar_familia(db: AsyncSession, familia: str):
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.familia == familia, RefreshToken.revocado.is_(None))
+        .values(revocado=datetime.utcnow())
+    )
+
+async def purgar_refresh_tokens_vencidos():
+    """Borra los refresh tokens vencidos: ya no sirven ni para detectar reutilización."""
+    async with SessionLocal() as db:
+        await db.execute(delete(RefreshToken).where(RefreshToken.expira < datetime.utcnow()))
+        await db.commit()
+
+def respuesta_token(nombre_usuario: str, refresh_token: str) -> dict:
+    access_token_expires = timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRES_MINUTES)
+    access_token = create_access_token(
+        data={"sub": nombre_usuario}, expires_delta=access_token_expires
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": int(access_token_expires.total_seconds()),
+    }
+
+# --- Caché de tokens y perfiles ---
+class CacheLRU:
+    """
+    Diccionario en memoria con un máximo de entradas (descarta la usada hace más tiempo)
+    y un vencimiento por entrada. Cuenta aciertos y fallos para exponer la tasa en /metrics.
+
+    Cada `descartar` sube una generación: `guardar` recibe la generación leída antes de ir
+    a la base y no guarda nada si hubo una invalidación en el medio, para que una lectura
+    lenta no vuelva a dejar en la caché datos que otra petición acaba de cambiar.
+    """
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[1] <= time.time():
+                del self._entradas[clave]
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def generacion(self) -> int:
+        with self._lock:
+            return self._generacion
+
+    def guardar(self, clave: str, valor: Any, vence: float, generacion: Optional[int] = None):
+        if self.maximo <= 0:
+            return
+        with self._lock:
+            if generacion is not None and generacion != self._generacion:
+                return
+            self._entradas[clave] = (valor, vence)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+
+    def descartar(self, clave: str):
+        with self._lock:
+            self._generacion += 1
+            self._entradas.pop(clave, None)
+
+    def tasa_aciertos(self) -> float:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return self.aciertos / total if total else 0.0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entradas)
+
+# Token -> nombre de usuario (`sub`), hasta el `exp` del token: evita verificar la firma
+# en cada petición. El resultado de decodificar un token no cambia, así que no se invalida.
+cache_tokens = CacheLRU(settings.TOKEN_CACHE_MAX)
+# Nombre de usuario -> UsuarioPublic, para /users/me/ sin consultar la base
+cache_perfiles = CacheLRU(settings.PERFIL_CACHE_MAX)
+
+def invalidar_perfil(nombre_usuario: str):
+    """Toda escritura sobre un usuario (perfil o contraseña) debe llamar a esta función."""
+    cache_perfiles.descartar(nombre_usuario)
+
+def usuario_del_token(token: str) -> str:
+    """Nombre del usuario del token, verificando firma y vencimiento solo la primera vez."""
+    nombre_usuario = cache_tokens.obtener(token)
+    if nombre_usuario is not None:
+        return nombre_usuario
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="No se pudieron validar las credenciales",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    nombre_usuario = payload.get("sub")
+    if nombre_usuario is None:
+        raise credentials_exception
+    if payload.get("exp") is not None:
+        cache_tokens.guardar(token, nombre_usuario, float(payload["exp"]))
+    return nombre_usuario
+
 # --- 5. Creación de la Aplicación y Endpoints ---
 
 app = FastAPI(
     title="API de Registro y Nutrición",
     description="Una API para gestionar el registro y login de usuarios.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE, compresslevel=settings.GZIP_COMPRESS_LEVEL)
+
+# Métricas en /metrics (formato Prometheus); el middleware queda por fuera de GZip
+registro_metricas = RegistroMetricas()
+app.add_middleware(MiddlewareMetricas, metricas=MetricasHTTP(registro_metricas))
+registro_metricas.indicador(
+    "token_cache_hit_ratio", "Fracción de tokens resueltos sin verificar la firma.",
+    cache_tokens.tasa_aciertos)
+registro_metricas.indicador(
+    "token_cache_entries", "Tokens verificados en la caché.", lambda: len(cache_tokens))
+registro_metricas.indicador(
+    "profile_cache_hit_ratio", "Fracción de lecturas de /users/me/ servidas sin consultar la base.",
+    cache_perfiles.tasa_aciertos)
+registro_metricas.indicador(
+    "profile_cache_entries", "Perfiles de usuario en la caché.", lambda: len(cache_perfiles))
+registro_metricas.indicador(
+    "password_hash_queue_depth", "Hashes de contraseña en curso o esperando un hilo del pool.",
+    pool_hash.pendientes)
+metrica_hash_duracion = registro_metricas.histograma(
+    "password_hash_seconds", "Tiempo de CPU de cada hash de contraseña, por operación.", ("operacion",))
+metrica_hash_espera = registro_metricas.histograma(
+    "password_hash_wait_seconds", "Espera en la cola del pool antes de calcular el hash, por operación.", ("operacion",))
+metrica_hash_rechazos = registro_metricas.contador(
+    "password_hash_rejected_total", "Peticiones rechazadas con 503 porque el pool de hashes estaba lleno.", ("operacion",))
+
+@app.exception_handler(PoolHashSaturado)
+async def responder_pool_saturado(request: Request, exc: PoolHashSaturado):
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "El servidor está atendiendo demasiados inicios de sesión. Reintente en unos segundos."},
+        headers={"Retry-After": str(exc.reintentar_en)},
+    )
+
+@app.get("/metrics", include_in_schema=False)
+def exponer_metricas():
+    """Latencia por ruta y código, requests en curso y consultas SQL por request."""
+    return Response(registro_metricas.exponer(), media_type=TIPO_CONTENIDO_METRICAS)
+
+@app.on_event("startup")
+async def iniciar():
+    await crear_tablas()
+    await purgar_refresh_tokens_vencidos()
+
+@app.on_event("shutdown")
+async def cerrar():
+    await engine.dispose()
+    pool_hash.cerrar()
 
 @app.post("/register/", response_model=UsuarioPublic, status_code=status.HTTP_201_CREATED, tags=["Auth"])
-def register_user(usuario: UsuarioCreate, db: Session = Depends(get_db)):
+async def register_user(usuario: UsuarioCreate, db: AsyncSession = Depends(get_db)):
     """
     Registra un nuevo usuario en la base de datos.
     - Valida que el nombre de usuario no exista.
-    - Hashea la contraseña antes de guardarla.
+    - Hashea la contraseña antes de guardarla (503 con Retry-After si el pool de hashes está lleno).
     """
-    db_user = db.query(Usuario).filter(Usuario.nombre_usuario == usuario.nombre_usuario).first()
+    db_user = await buscar_usuario(db, usuario.nombre_usuario)
+    await db.close()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El nombre de usuario ya está registrado."
         )
     
-    hashed_password = generate_password_hash(usuario.password)
+    hashed_password = await hashear_password(usuario.password)
     nuevo_usuario = Usuario(
         nombre_usuario=usuario.nombre_usuario,
         password_hash=hashed_password,
@@ -191,57 +603,173 @@ def register_user(usuario: UsuarioCreate, db: Session = Depends(get_db)):
     )
     
     db.add(nuevo_usuario)
-    db.commit()
-    db.refresh(nuevo_usuario)
+    await db.commit()
     
     return nuevo_usuario
 
 
 @app.post("/login/", response_model=Token, tags=["Auth"])
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(background_tasks: BackgroundTasks, form_data: OAuth2PasswordRequestForm = Depends(),
+                                 db: AsyncSession = Depends(get_db)):
     """
-    Autentica a un usuario y retorna un token JWT.
+    Autentica a un usuario y retorna un token JWT, más un refresh token para renovarlo
+    en /token/refresh sin volver a enviar la contraseña.
     Utiliza `OAuth2PasswordRequestForm` para que puedas usar el formulario de "Authorize"
     en la documentación de Swagger UI.
     - **username**: corresponde a `nombre_usuario`.
     - **password**: corresponde a la contraseña.
+
+    Si el hash guardado usa otro método o costo que PASSWORD_HASH_METODO, se recalcula
+    después de responder. Con el pool de hashes lleno responde 503 con Retry-After.
     """
-    user = db.query(Usuario).filter(Usuario.nombre_usuario == form_data.username).first()
+    user = await buscar_usuario(db, form_data.username)
+    # Devolver la conexión al pool antes de verificar el hash: no hace falta mientras se calcula
+    await db.close()
     
-    if not user or not user.check_password(form_data.password):
+    if not user or not await verificar_password(user.password_hash, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Nombre de usuario o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    access_token_expires = timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRES_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.nombre_usuario}, expires_delta=access_token_expires
-    )
+    if requiere_rehash(user.password_hash):
+        background_tasks.add_task(actualizar_hash, user.nombre_usuario, user.password_hash, form_data.password)
+        
+    refresh_token = emitir_refresh_token(db, user.nombre_usuario)
+    await db.commit()
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return respuesta_token(user.nombre_usuario, refresh_token)
 
 
-@app.get("/users/me/", response_model=UsuarioPublic, tags=["Users"])
-def read_users_me(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+@app.post("/token/refresh", response_model=Token, tags=["Auth"])
+async def refresh_access_token(datos: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
     """
-    Endpoint protegido que devuelve los datos del usuario autenticado.
+    Canjea un refresh token por un access token nuevo y el siguiente refresh token, sin
+    volver a verificar la contraseña. Cada refresh token sirve una sola vez: si llega uno
+    ya canjeado (posible robo) se revoca toda la sesión y hay que iniciar sesión de nuevo.
     """
-    credentials_exception = HTTPException(
+    invalido = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No se pudieron validar las credenciales",
+        detail="La sesión expiró o fue cerrada. Inicie sesión de nuevo.",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-        
-    user = db.query(Usuario).filter(Usuario.nombre_usuario == username).first()
+    resultado = await db.execute(
+        select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(datos.refresh_token))
+    )
+    registro = resultado.scalar_one_or_none()
+    ahora = datetime.utcnow()
+    if registro is None or registro.revocado is not None or registro.expira <= ahora:
+        raise invalido
+
+    # Canje atómico: de dos peticiones con el mismo token, solo una lo marca como usado
+    canje = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == registro.id, RefreshToken.usado.is_(None))
+        .values(usado=ahora)
+    )
+    if canje.rowcount == 0:
+        await revocar_familia(db, registro.familia)
+        await db.commit()
+        raise invalido
+
+    refresh_token = emitir_refresh_token(db, registro.nombre_usuario, registro.familia)
+    await db.commit()
+    return respuesta_token(registro.nombre_usuario, refresh_token)
+
+
+@app.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT, tags=["Auth"])
+async def revoke_refresh_token(datos: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Cierra la sesión: invalida el refresh token y todos los de su familia. Responde 204
+    aunque el token no exista, para no revelar cuáles son válidos.
+    """
+    resultado = await db.execute(
+        select(RefreshToken.familia).where(RefreshToken.token_hash == hash_refresh_token(datos.refresh_token))
+    )
+    familia = resultado.scalar_one_or_none()
+    if familia is not None:
+        await revocar_familia(db, familia)
+        await db.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def etag_perfil(version: int) -> str:
+    return f'"{version}"'
+
+def coincide_if_match(if_match: str, version: int) -> bool:
+    """If-Match admite '*', varias versiones separadas por comas y etiquetas débiles (W/"3")."""
+    for valor in if_match.split(","):
+        valor = valor.strip()
+        if valor == "*":
+            return True
+        if valor.startswith("W/"):
+            valor = valor[2:]
+        if valor.strip('"') == str(version):
+            return True
+    return False
+
+@app.get("/users/me/", response_model=UsuarioPublic, tags=["Users"])
+async def read_users_me(response: Response, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    """
+    Endpoint protegido que devuelve los datos del usuario autenticado.
+    Las lecturas repetidas se sirven de memoria, sin verificar el token ni consultar la base.
+    El header ETag lleva la versión del perfil, para enviarla como If-Match en PATCH.
+    """
+    username = usuario_del_token(token)
+    perfil = cache_perfiles.obtener(username)
+    if perfil is None:
+        generacion = cache_perfiles.generacion()
+        user = await buscar_usuario(db, username)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No se pudieron validar las credenciales",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        perfil = UsuarioPublic.model_validate(user)
+        cache_perfiles.guardar(username, perfil, time.time() + settings.PERFIL_CACHE_TTL, generacion)
+    response.headers["ETag"] = etag_perfil(perfil.version)
+    return perfil
+
+
+@app.patch("/users/me/", response_model=UsuarioPublic, tags=["Users"])
+async def update_users_me(cambios: UsuarioUpdate, response: Response, db: AsyncSession = Depends(get_db),
+                          token: str = Depends(oauth2_scheme), if_match: Optional[str] = Header(None)):
+    """
+    Modifica solo los campos enviados (peso, altura, meta_calorias, nivel_actividad) y
+    devuelve el perfil actualizado, sin necesidad de otro GET.
+    - **If-Match**: versión leída antes (ETag de GET o PATCH). Si el perfil cambió desde
+      entonces responde 412 con la versión actual en ETag. Sin el header, el cambio se aplica siempre.
+    """
+    username = usuario_del_token(token)
+    user = await buscar_usuario(db, username)
     if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No se pudieron validar las credenciales",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    conflicto = HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="El perfil fue modificado desde la última lectura. Vuelva a cargarlo e intente de nuevo.",
+    )
+    if if_match is not None and not coincide_if_match(if_match, user.version):
+        conflicto.headers = {"ETag": etag_perfil(user.version)}
+        raise conflicto
+
+    for campo, valor in cambios.model_dump(exclude_unset=True, exclude_none=True).items():
+        setattr(user, campo, valor)
+    try:
+        # El UPDATE incluye "WHERE version = <leída>": si otra petición ganó, no afecta filas
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        invalidar_perfil(username)
+        raise conflicto
+
+    invalidar_perfil(username)
+    perfil = UsuarioPublic.model_validate(user)
+    cache_perfiles.guardar(username, perfil, time.time() + settings.PERFIL_CACHE_TTL, cache_perfiles.generacion())
+    response.headers["ETag"] = etag_perfil(perfil.version)
+    return perfil
@@ -25,23 +25,52 @@ import json
 # MODIFICACIÓN: Se define la URL base donde corre tu API FastAPI
 API_BASE_URL = "http://127.0.0.1:8000"
 
+class PerfilDesactualizado(Exception):
+    """El perfil cambió en el servidor desde la última lectura (respuesta 412 a un PATCH)."""
+
 # --- NUEVA CLASE UserService PARA CONECTARSE A LA API ---
 class UserService:
     """
     Servicio para interactuar con la API de usuarios.
-    Maneja la obtención de datos del usuario autenticado.
+    Maneja la obtención y la actualización de datos del usuario autenticado.
     """
-    def __init__(self, usuario, token):
+    def __init__(self, usuario, token, auth_service=None):
         """
         Inicializa el servicio con el nombre de usuario y el token de autenticación.
         Args:
             usuario (str): El nombre del usuario.
             token (str): El token JWT para la autenticación.
+            auth_service (ApiService, opcional): Sesión de la que se toma el token vigente en cada petición.
         """
         self.usuario = usuario
         self.token = token
-        # Preparamos el header de autorización que se usará en todas las peticiones
-        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.auth_service = auth_service
+        # Versión (ETag) del perfil leído por última vez; se envía como If-Match al actualizar
+        self.version = None
+
+    @property
+    def headers(self):
+        """Header de autorización, con el token de la sesión si la hay (puede renovarse)."""
+        if self.auth_service is not None and self.auth_service.token:
+            return self.auth_service.get_auth_headers()
+        if self.token:
+            return {"Authorization": f"Bearer {self.token}"}
+        return None
+
+    @staticmethod
+    def _a_tupla(user_data):
+        """
+        Datos en el orden que espera la UI.
+        Nota: La API usa 'altura' y la UI espera 'estatura'. Hacemos el mapeo aquí.
+        """
+        return (
+            user_data.get('fecha_nacimiento'), # En lugar de 'edad'
+            user_data.get('genero'),
+            user_data.get('peso'),
+            user_data.get('nivel_actividad'),
+            user_data.get('meta_calorias'),
+            user_data.get('altura')
+        )
 
     def cargar_datos_usuario(self):
         """
@@ -52,7 +81,7 @@ class UserService:
         Raises:
             Exception: Si ocurre un error de conexión, autenticación o de servidor.
         """
-        if not self.token:
+        if not self.headers:
             raise Exception("No se ha proporcionado un token de autenticación.")
             
         try:
@@ -64,17 +93,10 @@ class UserService:
             
             # Convertimos la respuesta JSON en un diccionario de Python
             user_data = response.json()
+            self.version = response.headers.get("ETag")
             
             # Devolvemos los datos en el formato de tupla que la UI espera.
-            # Nota: La API usa 'altura' y la UI espera 'estatura'. Hacemos el mapeo aquí.
-            return (
-            user_data.get('fecha_nacimiento'), # En lugar de 'edad'
-            user_data.get('genero'),
-            user_data.get('peso'),
-            user_data.get('nivel_actividad'),
-            user_data.get('meta_calorias'),
-            user_data.get('altura') 
-        )
+            return self._a_tupla(user_data)
         except requests.exceptions.HTTPError as http_err:
             if response.status_code == 401:
                 raise Exception("Token inválido o expirado. Por favor, inicie sesión de nuevo.")
@@ -85,6 +107,57 @@ class UserService:
         except Exception as e:
             raise Exception(f"Ocurrió un error inesperado al cargar los datos: {e}")
 
+    def actualizar_datos(self, nuevos_datos):
+        """
+        Envía a PATCH /users/me/ solo los campos del formulario, con la versión leída como
+        If-Match. La API devuelve el perfil ya actualizado, así que no hace falta otro GET.
+        Args:
+            nuevos_datos (dict): 'estatura', 'meta_cal', 'nivel_actividad' y/o 'peso' (como los da el formulario).
+        Returns:
+            tuple: Los datos actualizados, en el mismo orden que cargar_datos_usuario().
+        Raises:
+            PerfilDesactualizado: Si el perfil se modificó en otro lado desde la última lectura.
+            Exception: Si los datos no son válidos o hay un error de conexión o de servidor.
+        """
+        if not self.headers:
+            raise Exception("No se ha proporcionado un token de autenticación.")
+
+        cambios = {}
+        try:
+            if nuevos_datos.get("estatura") not in (None, ""):
+                cambios["altura"] = int(float(str(nuevos_datos["estatura"]).replace(",", ".")))
+            if nuevos_datos.get("meta_cal") not in (None, ""):
+                cambios["meta_calorias"] = int(float(str(nuevos_datos["meta_cal"]).replace(",", ".")))
+            if nuevos_datos.get("peso") not in (None, ""):
+                cambios["peso"] = float(str(nuevos_datos["peso"]).replace(",", "."))
+        except ValueError:
+            raise Exception("La estatura, el objetivo y el peso deben ser números.")
+        if nuevos_datos.get("nivel_actividad"):
+            cambios["nivel_actividad"] = nuevos_datos["nivel_actividad"]
+
+        headers = dict(self.headers)
+        if self.version:
+            headers["If-Match"] = self.version
+        try:
+            response = requests.patch(f"{API_BASE_URL}/users/me/", json=cambios, headers=headers, timeout=10)
+        except requests.exceptions.RequestException as req_err:
+            raise Exception(f"Error de conexión con el servidor: {req_err}")
+
+        if response.status_code == 200:
+            self.version = response.headers.get("ETag")
+            return self._a_tupla(response.json())
+        if response.status_code == 412:
+            self.version = response.headers.get("ETag")
+            raise PerfilDesactualizado("Tus datos se modificaron desde otra ventana o dispositivo. "
+                                       "Se recargaron; revisa los cambios e inténtalo de nuevo.")
+        if response.status_code == 401:
+            raise Exception("Token inválido o expirado. Por favor, inicie sesión de nuevo.")
+        try:
+            detalle = response.json().get("detail", response.text)
+        except ValueError:
+            detalle = response.text
+        raise Exception(f"Error ({response.status_code}): {detalle}")
+
 # --- Clases de la Interfaz (Widgets) ---
 
 class InfoButton(QPushButton):
@@ -275,7 +348,7 @@ class ConfigUI(QWidget, BaseWidget):
     datos_usuario_actualizados = pyqtSignal()
 
     # MODIFICACIÓN: El constructor ahora debe recibir el token de autenticación
-    def __init__(self, panel_principal, color, usuario=None, token=None):
+    def __init__(self, panel_principal, color, usuario=None, token=None, auth_service=None):
         QWidget.__init__(self, panel_principal)
         BaseWidget.__init__(self, parent=panel_principal, usuario=usuario)
         
@@ -284,7 +357,7 @@ class ConfigUI(QWidget, BaseWidget):
         self.usuario = usuario if usuario else self.get_current_user()
         
         # MODIFICACIÓN: Se instancia el nuevo UserService con el usuario y el token
-        self.user_service = UserService(self.usuario, token)
+        self.user_service = UserService(self.usuario, token, auth_service)
         
         self.recordatorio = Recordatorio(self.usuario)
         self.temp_dir = tempfile.mkdtemp()
@@ -292,9 +365,10 @@ class ConfigUI(QWidget, BaseWidget):
         self.init_ui()
         self.setup_styles()
         
-    def refrescar_vista(self):
+    def refrescar_vista(self, datos=None):
         """
         Slot público que recarga la información del usuario en el panel.
+        Con `datos` (la tupla que devuelve UserService) se muestran sin volver a pedirlos a la API.
         """
         print("RECIBIENDO SEÑAL: Refrescando vista de Configuración...")
         while self.info_layout.count():
@@ -302,7 +376,7 @@ class ConfigUI(QWidget, BaseWidget):
             if child.widget():
                 child.widget().deleteLater()
         
-        self.load_user_data(self.info_layout)
+        self.load_user_data(self.info_layout, datos)
         self.create_session_buttons(self.info_layout)
 
     def get_current_user(self):
@@ -455,11 +529,11 @@ class ConfigUI(QWidget, BaseWidget):
         outer_layout.addWidget(inner_frame)
         parent_layout.addWidget(outer_frame)
 
-    def load_user_data(self, layout):
-        """Carga y muestra los datos del usuario llamando a la API."""
+    def load_user_data(self, layout, datos=None):
+        """Muestra los datos del usuario; si no se reciben, los pide a la API."""
         try:
             # Esta llamada ahora va a la API a través de nuestra nueva clase UserService
-            fecha_nacimiento, genero, peso, nivel_actividad, meta_cal, estatura = self.user_service.cargar_datos_usuario()
+            fecha_nacimiento, genero, peso, nivel_actividad, meta_cal, estatura = datos or self.user_service.cargar_datos_usuario()
             
             self.nombre_label = ConfigLabel(f"Nombre: {self.usuario}", font_size=15)
             self.edad_label = ConfigLabel(f"Edad: {fecha_nacimiento}")
@@ -536,16 +610,16 @@ class ConfigUI(QWidget, BaseWidget):
         if dialog.exec() == QDialog.DialogCode.Accepted:
             nuevos_datos = dialog.get_data()
             try:
-                exito_al_guardar = self.user_service.actualizar_datos(nuevos_datos)
+                # La respuesta del PATCH ya trae el perfil actualizado: se muestra sin otro GET
+                datos_actualizados = self.user_service.actualizar_datos(nuevos_datos)
+                QMessageBox.information(self, "Éxito", "La información ha sido actualizada.")
                 
-                if exito_al_guardar:
-                    QMessageBox.information(self, "Éxito", "La información ha sido actualizada.")
-                    
-                    self.refrescar_vista()
-                    self.datos_usuario_actualizados.emit()
-                else:
-                    self.mostrar_error("Error de Guardado", "No se pudieron guardar los cambios en la base de datos.")
+                self.refrescar_vista(datos_actualizados)
+                self.datos_usuario_actualizados.emit()
                 
+            except PerfilDesactualizado as e:
+                self.mostrar_error(str(e))
+                self.refrescar_vista()
             except Exception as e:
                 self.mostrar_error(f"Error al procesar los datos: {e}")
                 
@@ -4,7 +4,7 @@ from PyQt6.QtGui import QFont
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QMessageBox, 
                              QFrame, QLabel, QPushButton, QTableView, QHeaderView,
                              QDateEdit)
-from PyQt6.QtCore import Qt, pyqtSignal, QAbstractTableModel, QDate
+from PyQt6.QtCore import Qt, pyqtSignal, QAbstractTableModel, QDate, QModelIndex, QThread
 from .historialfacade import HistorialFacade
 
 class HistorialTableModel(QAbstractTableModel):
@@ -22,6 +22,41 @@ class HistorialTableModel(QAbstractTableModel):
     def rowCount(self, index):
         return len(self._data)
 
+    def agregar_filas(self, filas):
+        """Agrega filas al final de la tabla (para ir mostrando el historial a medida que llega)."""
+        if not filas:
+            return
+        inicio = len(self._data)
+        self.beginInsertRows(QModelIndex(), inicio, inicio + len(filas) - 1)
+        self._data.extend(filas)
+        self.endInsertRows()
+
+    def reemplazar_dia(self, fecha, filas):
+        """
+        Reemplaza las filas de un día (fecha tal como se muestra, dd-mm-YYYY) por `filas`,
+        manteniendo el orden de la tabla (más reciente primero). Si el día no estaba, lo inserta
+        en su lugar.
+        """
+        indices = [i for i, fila in enumerate(self._data) if fila[1] == fecha]
+        if indices:
+            inicio, fin = indices[0], indices[-1]
+            self.beginRemoveRows(QModelIndex(), inicio, fin)
+            del self._data[inicio:fin + 1]
+            self.endRemoveRows()
+        else:
+            clave = self._clave_fecha(fecha)
+            inicio = next((i for i, fila in enumerate(self._data) if self._clave_fecha(fila[1]) < clave), len(self._data))
+        if filas:
+            self.beginInsertRows(QModelIndex(), inicio, inicio + len(filas) - 1)
+            self._data[inicio:inicio] = filas
+            self.endInsertRows()
+
+    @staticmethod
+    def _clave_fecha(fecha):
+        """'dd-mm-YYYY' -> 'YYYY-mm-dd' para poder comparar fechas como texto."""
+        partes = str(fecha).split("-")
+        return "-".join(reversed(partes)) if len(partes) == 3 else ""
+
     def columnCount(self, index):
         return len(self.headers)
 
@@ -119,17 +154,50 @@ class HistorialView(QWidget):
     def set_data_in_table(self, data):
         model = HistorialTableModel(data)
         self.tabla.setModel(model)
+        return model
 
 
+class CargaHistorial(QThread):
+    """
+    Descarga un rango del historial en streaming fuera del hilo de la interfaz. Cada
+    bloque sale por `bloque_recibido`, que Qt entrega en el hilo de la vista, así la
+    tabla se va llenando sin trabar la ventana. requestInterruption() la corta en el
+    próximo bloque.
+    """
+    bloque_recibido = pyqtSignal(list)  # registros de la API (diccionarios)
+
+    def __init__(self, facade, fecha_desde, fecha_hasta, parent=None):
+        super().__init__(parent)
+        self.facade = facade
+        self.fecha_desde = fecha_desde
+        self.fecha_hasta = fecha_hasta
+
+    def run(self):
+        bloques = self.facade.iterar_registros_por_rango(self.fecha_desde, self.fecha_hasta,
+                                                         modo=HistorialFacade.MODO_STREAM)
+        try:
+            for bloque in bloques:
+                if self.isInterruptionRequested():
+                    return
+                self.bloque_recibido.emit(bloque)
+        finally:
+            bloques.close()  # Cierra la respuesta HTTP si se cortó a mitad
+
 # ... (las clases HistorialTableModel y HistorialView se mantienen igual) ...
 
 # --- Clase Principal (Controlador del Historial) ---
 class Historial(QWidget):
-    def __init__(self, panel_principal, color, usuario="test_user"):
+    def __init__(self, panel_principal, color, usuario="test_user", auth_service=None):
         super().__init__()
         self.usuario = usuario
         # Se inicializa el Facade que habla con la API
-        self.facade = HistorialFacade(self.usuario)
+        self.facade = HistorialFacade(self.usuario, auth_service=auth_service)
+        # Mientras se descarga un rango, los días avisados por la API se guardan y se aplican al terminar
+        self._cargando = False
+        self._carga = None
+        self._dias_pendientes = set()
+        # Se pidió otro rango durante la descarga: se carga al terminar la actual
+        self._recarga_pendiente = False
         self.init_ui()
         # Se carga la vista con datos iniciales de la API
         self.refrescar_vista()
@@ -165,21 +233,75 @@ class Historial(QWidget):
         
     def aplicar_filtros(self):
         """Obtiene los datos de la API según el rango de fechas y actualiza la tabla."""
+        if self._cargando:
+            # Una sola descarga a la vez: la actual se corta y al terminar se pide el rango elegido ahora
+            self._recarga_pendiente = True
+            self._carga.requestInterruption()
+            return
+
         fecha_desde = self.historial_view.date_from.date().toString("yyyy-MM-dd")
         fecha_hasta = self.historial_view.date_to.date().toString("yyyy-MM-dd")
         
         print(f"Pidiendo historial a la API entre {fecha_desde} y {fecha_hasta}...")
         
-        # Usamos el facade para obtener datos de la API
-        datos_api = self.facade.obtener_registros_por_rango(fecha_desde, fecha_hasta)
-        
-        if datos_api is None:
-            QMessageBox.critical(self, "Error de API", "No se pudo obtener respuesta del servidor.")
+        # La tabla se muestra vacía y se va llenando con cada bloque que llega en streaming,
+        # así un rango de un año no espera a descargar (ni a tener en memoria) todo para pintar.
+        self.historial_view.set_data_in_table([])
+
+        self._cargando = True
+        self._carga = CargaHistorial(self.facade, fecha_desde, fecha_hasta, self)
+        self._carga.bloque_recibido.connect(self._agregar_bloque)
+        self._carga.finished.connect(self._carga_terminada)
+        self._carga.start()
+
+    def _agregar_bloque(self, bloque):
+        """Agrega a la tabla un bloque recibido por la descarga en curso."""
+        modelo = self.historial_view.tabla.model()
+        if modelo is not None:
+            # Convertimos los datos para que la tabla los entienda
+            modelo.agregar_filas(self._formatear_datos_para_tabla(bloque))
+
+    def _carga_terminada(self):
+        self._carga.deleteLater()
+        self._carga = None
+        self._cargando = False
+        if self._recarga_pendiente:
+            # La recarga trae el rango completo: los días avisados mientras tanto ya quedan incluidos
+            self._recarga_pendiente = False
+            self._dias_pendientes.clear()
+            self.aplicar_filtros()
             return
+        if self._dias_pendientes:
+            pendientes, self._dias_pendientes = self._dias_pendientes, set()
+            self.actualizar_dias(list(pendientes))
+
+    def detener_carga(self):
+        """Corta la descarga en curso, si la hay, y espera a que su hilo termine (al cerrar sesión o la app)."""
+        if self._carga is not None:
+            self._recarga_pendiente = False
+            self._carga.requestInterruption()
+            self._carga.wait(2000)
 
-        # Convertimos los datos para que la tabla los entienda
-        datos_para_tabla = self._formatear_datos_para_tabla(datos_api)
-        self.historial_view.set_data_in_table(datos_para_tabla)
+    def actualizar_dias(self, fechas):
+        """
+        Slot para los avisos de cambio de la API (fechas 'YYYY-MM-DD'): vuelve a pedir
+        solo esos días y reemplaza sus filas en la tabla, sin recargar todo el rango.
+        """
+        if self._cargando:
+            self._dias_pendientes.update(fechas)
+            return
+        modelo = self.historial_view.tabla.model()
+        if modelo is None:
+            self.aplicar_filtros()
+            return
+        fecha_desde = self.historial_view.date_from.date().toString("yyyy-MM-dd")
+        fecha_hasta = self.historial_view.date_to.date().toString("yyyy-MM-dd")
+        for fecha in sorted(set(fechas)):
+            if not (fecha_desde <= fecha <= fecha_hasta):
+                continue
+            registros = self.facade.obtener_registros_por_rango(fecha, fecha)
+            fecha_mostrada = datetime.datetime.strptime(fecha, '%Y-%m-%d').strftime('%d-%m-%Y')
+            modelo.reemplazar_dia(fecha_mostrada, self._formatear_datos_para_tabla(registros))
 
     def _formatear_datos_para_tabla(self, datos_api: list) -> list:
         """Convierte la lista de diccionarios de la API a una lista de tuplas para la tabla."""
@@ -1,39 +1,79 @@
+import json
 import requests
-from typing import List, Dict, Any
+from typing import Callable, Iterator, List, Dict, Any, Optional
 
 class HistorialFacade:
     """
     Facade que obtiene los datos del historial directamente desde la API.
     Actúa como un cliente HTTP para el backend.
     """
-    def __init__(self, usuario: str, base_url: str = "http://127.0.0.1:8000"):
-        # El usuario se mantiene por si en el futuro se implementa un login
+    MODO_PAGINADO = "paginado"
+    MODO_STREAM = "stream"
+
+    def __init__(self, usuario: str, base_url: str = "http://127.0.0.1:8000", auth_service=None):
+        # La API devuelve solo los consumos del usuario del token de la sesión (ApiService)
         self.usuario = usuario
         self.base_url = base_url
+        self.auth_service = auth_service
+        # Última respuesta completa por rango, para pedirla con If-None-Match: (desde, hasta) -> (etag, registros)
+        self._ultima_respuesta = {}
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Header de autorización con el token vigente (ApiService lo renueva antes de que venza)."""
+        return (self.auth_service.get_auth_headers() if self.auth_service else None) or {}
 
-    def obtener_registros_por_rango(self, fecha_desde: str, fecha_hasta: str) -> List[Dict[str, Any]]:
+    def obtener_registros_por_rango(self, fecha_desde: str, fecha_hasta: str,
+                                    modo: Optional[str] = None, tamano_pagina: int = 500,
+                                    al_recibir: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> List[Dict[str, Any]]:
         """
         Obtiene todos los registros de consumo para un rango de fechas desde la API.
 
         Args:
             fecha_desde (str): Fecha de inicio en formato 'YYYY-MM-DD'.
             fecha_hasta (str): Fecha de fin en formato 'YYYY-MM-DD'.
+            modo (str): None para una sola petición con todo el rango, MODO_PAGINADO para
+                pedir páginas de `tamano_pagina` filas, o MODO_STREAM para leer NDJSON en streaming.
+            al_recibir: Callback opcional que recibe cada bloque de registros apenas llega,
+                para que la vista pueda mostrarlos sin esperar al rango completo.
 
         Returns:
             Una lista de diccionarios, donde cada diccionario es un registro de consumo.
-            Devuelve una lista vacía si hay un error o no hay datos.
+            Devuelve una lista vacía si hay un error o no hay datos (o lo recibido hasta el error).
         """
+        if modo is not None:
+            registros = []
+            for bloque in self.iterar_registros_por_rango(fecha_desde, fecha_hasta, modo, tamano_pagina):
+                registros.extend(bloque)
+                if al_recibir:
+                    al_recibir(bloque)
+            return registros
+
         endpoint = f"{self.base_url}/historial"
         params = {
             "fecha_desde": fecha_desde,
             "fecha_hasta": fecha_hasta
         }
-        
+
+        guardada = self._ultima_respuesta.get((fecha_desde, fecha_hasta))
+        headers = dict(self.headers)
+        if guardada:
+            headers["If-None-Match"] = guardada[0]
+
         try:
-            response = requests.get(endpoint, params=params, timeout=5)
-            # Lanza un error para respuestas 4xx o 5xx
-            response.raise_for_status()
-            return response.json()
+            response = requests.get(endpoint, params=params, headers=headers, timeout=5)
+            if response.status_code == 304 and guardada:
+                # Nada cambió en el rango: reutilizamos lo que ya teníamos
+                registros = guardada[1]
+            else:
+                # Lanza un error para respuestas 4xx o 5xx
+                response.raise_for_status()
+                registros = response.json()
+                if response.headers.get("ETag"):
+                    self._ultima_respuesta[(fecha_desde, fecha_hasta)] = (response.headers["ETag"], registros)
+            if al_recibir and registros:
+                al_recibir(registros)
+            return registros
         except requests.RequestException as e:
             print(f"Error de API al obtener historial: {e}")
             # Devolvemos una lista vacía para que la interfaz no se rompa.
@@ -42,6 +82,60 @@ class HistorialFacade:
             print("Error: La respuesta de la API no es un JSON válido.")
             return []
 
+    def iterar_registros_por_rango(self, fecha_desde: str, fecha_hasta: str,
+                                   modo: str = MODO_PAGINADO, tamano_pagina: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Recorre el historial por bloques, del más reciente al más antiguo, sin cargar
+        el rango completo de una vez. Si ocurre un error simplemente deja de producir bloques.
+        """
+        if modo == self.MODO_STREAM:
+            yield from self._iterar_stream(fecha_desde, fecha_hasta, tamano_pagina)
+        else:
+            yield from self._iterar_paginas(fecha_desde, fecha_hasta, tamano_pagina)
+
+    def _iterar_paginas(self, fecha_desde: str, fecha_hasta: str, tamano_pagina: int) -> Iterator[List[Dict[str, Any]]]:
+        """Paginación por keyset: cada página pide las filas posteriores al cursor de la anterior."""
+        params = {"fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta, "limit": tamano_pagina}
+        while True:
+            try:
+                response = requests.get(f"{self.base_url}/historial", params=params, headers=self.headers, timeout=5)
+                response.raise_for_status()
+                pagina = response.json()
+            except requests.RequestException as e:
+                print(f"Error de API al obtener historial: {e}")
+                return
+            except ValueError:
+                print("Error: La respuesta de la API no es un JSON válido.")
+                return
+            if pagina:
+                yield pagina
+            siguiente = response.headers.get("X-Siguiente")
+            if not siguiente:
+                return
+            params["after"] = siguiente
+
+    def _iterar_stream(self, fecha_desde: str, fecha_hasta: str, tamano_bloque: int) -> Iterator[List[Dict[str, Any]]]:
+        """Lee la respuesta NDJSON línea a línea y la agrupa en bloques de `tamano_bloque` registros."""
+        params = {"fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta, "formato": "ndjson"}
+        bloque = []
+        try:
+            with requests.get(f"{self.base_url}/historial", params=params, headers=self.headers,
+                              timeout=5, stream=True) as response:
+                response.raise_for_status()
+                for linea in response.iter_lines(decode_unicode=True):
+                    if not linea:
+                        continue
+                    bloque.append(json.loads(linea))
+                    if len(bloque) >= tamano_bloque:
+                        yield bloque
+                        bloque = []
+        except requests.RequestException as e:
+            print(f"Error de API al obtener historial: {e}")
+        except ValueError:
+            print("Error: La respuesta de la API no es un NDJSON válido.")
+        if bloque:
+            yield bloque
+
     def cleanup(self):
         """No hay conexiones de base de datos que cerrar en esta versión."""
-        pass
\ No newline at end of file
+        pass
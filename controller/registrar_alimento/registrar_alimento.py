@@ -14,7 +14,7 @@ class RegistroAlimentoPyQt6(QWidget):
     """Clase principal para el registro de alimentos"""
     consumo_diario_actualizado = pyqtSignal()
 
-    def __init__(self, usuario="test_user", parent=None):
+    def __init__(self, usuario="test_user", parent=None, auth_service=None):
         super().__init__(parent)
         self.usuario = usuario
         self.setWindowTitle("Registrar Alimento")
@@ -35,7 +35,7 @@ class RegistroAlimentoPyQt6(QWidget):
         
         # Inicializar repositorio
         #self.repository = SQLiteAlimentoRepository(self.usuario)
-        self.repository = ApiAlimentoRepository()
+        self.repository = ApiAlimentoRepository(auth_service=auth_service)
         
         # Inicializar managers
         self.ui_manager = UIManager()
@@ -33,8 +33,14 @@ class ApiAlimentoRepository(AlimentoRepositoryInterface):
             return False
 
     def buscar_similares(self, nombre: str) -> List[str]:
-        # La API actual no tiene un endpoint para buscar similares, devolvemos una lista vacía.
-        return []
+        """Alimentos del catálogo cuyo nombre contiene al buscado (sin contar la coincidencia exacta)."""
+        try:
+            response = requests.get(f"{self.base_url}/alimentos/buscar", params={"q": nombre, "limit": 10}, timeout=5)
+            if response.status_code != 200:
+                return []
+            return [a['nombre'] for a in response.json() if a.get('coincidencia') != 'exacta']
+        except requests.RequestException:
+            return []
 
     def obtener_alimento_por_nombre(self, nombre: str) -> Optional[Alimento]:
         # Podemos simular esto llamando a la API
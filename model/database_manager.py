@@ -2,6 +2,7 @@
 
 import sqlite3
 import os
+import requests
 from datetime import datetime, date
 
 # Necesitamos timedelta para "Última semana"
@@ -11,13 +12,26 @@ class ChartDataManager:
     """
     Se encarga de obtener y procesar los datos para los gráficos
     de la base de datos específica de un usuario.
+    Las calorías se piden ya agregadas a la API de alimentos (/estadisticas),
+    que es donde se registran los consumos.
     """
-    def __init__(self, username: str):
+    # Granularidad de los intervalos que se piden a la API según el período elegido
+    GRANULARIDAD_POR_PERIODO = {
+        "Última semana": "day",
+        "Último mes": "day",
+        "Últimos 3 meses": "week",
+        "Último año": "month",
+    }
+
+    def __init__(self, username: str, api_url: str = "http://127.0.0.1:8000", auth_service=None):
         if not username:
             raise ValueError("El nombre de usuario no puede estar vacío.")
         
         self.username = username
         self.db_path = os.path.join("users", self.username, "alimentos.db")
+        self.api_url = api_url
+        # Sesión (ApiService) con el token que identifica al usuario ante la API
+        self.auth_service = auth_service
 
     def _get_start_date(self, period: str) -> str:
         """
@@ -100,8 +114,36 @@ class ChartDataManager:
         
         return labels, data
 
+    def _get_api_statistics(self, metric: str, period: str) -> tuple[list, list]:
+        """
+        Pide a la API los totales del período ya agrupados por día, semana o mes.
+        La API devuelve también los intervalos sin registros (en cero), así que el
+        gráfico no tiene huecos.
+        """
+        granularity = self.GRANULARIDAD_POR_PERIODO.get(period, "day")
+        params = {
+            "desde": self._get_start_date(period),
+            "hasta": date.today().strftime("%Y-%m-%d"),
+            "granularidad": granularity,
+            "metrica": metric,
+        }
+        try:
+            response = requests.get(f"{self.api_url}/estadisticas", params=params,
+                                    headers=self.auth_service.get_auth_headers() if self.auth_service else None,
+                                    timeout=5)
+            response.raise_for_status()
+            intervals = response.json()["intervalos"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Error al obtener estadísticas de la API: {e}")
+            return [], []
+
+        label_format = "%m/%Y" if granularity == "month" else "%d/%m"
+        labels = [datetime.strptime(row["inicio"], "%Y-%m-%d").strftime(label_format) for row in intervals]
+        data = [row["suma"] for row in intervals]
+        return labels, data
+
     def get_calories_data(self, period: str) -> tuple[list, list]:
-        return self._get_aggregated_data("consumo_diario", "total_cal", "SUM", period)
+        return self._get_api_statistics("calorias", period)
 
     def get_water_data(self, period: str) -> tuple[list, list]:
         return self._get_aggregated_data("agua", "cant", "SUM", period)
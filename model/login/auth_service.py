@@ -1,15 +1,30 @@
 import requests
 import json
+import threading
+
+from model.util.migraciones import migrar_db_usuario
+
+# El access token se renueva este tiempo (en segundos) antes de vencer
+MARGEN_RENOVACION = 120
+# Si la renovación falla por la red, se reintenta cada tantos segundos
+ESPERA_REINTENTO_RENOVACION = 30
 
 class ApiService:
     """
     Gestiona toda la comunicación con la API de FastAPI.
     Almacena el estado de la sesión (token y usuario actual).
+
+    Tras el login, un temporizador en segundo plano canjea el refresh token por un access
+    token nuevo antes de que venza, así la contraseña se verifica una vez por sesión y
+    get_auth_headers() siempre devuelve un token vigente.
     """
     def __init__(self, base_url="http://127.0.0.1:8000"):
         self.base_url = base_url
         self.token = None
+        self.refresh_token = None
         self.current_user = None
+        self._temporizador = None
+        self._lock_renovacion = threading.Lock()
 
     def register(self, user_data: dict):
         """
@@ -52,9 +67,14 @@ class ApiService:
 
             if response.status_code == 200:
                 data = response.json()
-                self.token = data.get("access_token")
+                self._guardar_tokens(data)
                 # Almacenamos el nombre de usuario tras un login exitoso
                 self.current_user = username 
+                # Pone la base local (users/<usuario>/alimentos.db) en el esquema actual, una vez por sesión
+                try:
+                    migrar_db_usuario(username)
+                except Exception as e:
+                    print(f"ADVERTENCIA: no se pudo migrar la base local de '{username}': {e}")
                 return True, "Inicio de sesión exitoso."
                 
             try:
@@ -67,10 +87,74 @@ class ApiService:
             self.logout() # Limpia cualquier estado previo si falla la conexión
             return False, f"Error de conexión: No se pudo conectar a la API. {e}"
 
+    def _guardar_tokens(self, data: dict):
+        """Guarda los tokens de una respuesta de /login/ o /token/refresh y programa la próxima renovación."""
+        self.token = data.get("access_token")
+        self.refresh_token = data.get("refresh_token")
+        if data.get("expires_in"):
+            self._programar_renovacion(max(5, data["expires_in"] - MARGEN_RENOVACION))
+
+    def _programar_renovacion(self, espera):
+        """Ejecuta renovar_token() en segundo plano dentro de `espera` segundos."""
+        self._cancelar_renovacion()
+        if not self.refresh_token:
+            return
+        temporizador = threading.Timer(espera, self.renovar_token)
+        temporizador.daemon = True
+        temporizador.start()
+        self._temporizador = temporizador
+
+    def _cancelar_renovacion(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+
+    def renovar_token(self):
+        """
+        Canjea el refresh token por un access token nuevo (y el siguiente refresh token).
+        Se llama sola antes de que venza el access token; también puede llamarse al recibir un 401.
+        Returns:
+            bool: True si la sesión sigue activa con un token nuevo.
+        """
+        with self._lock_renovacion:
+            refresh_token = self.refresh_token
+            if not refresh_token:
+                return False
+            try:
+                response = requests.post(f"{self.base_url}/token/refresh",
+                                         json={"refresh_token": refresh_token}, timeout=10)
+            except requests.exceptions.RequestException as e:
+                print(f"No se pudo renovar la sesión, se reintentará: {e}")
+                self._programar_renovacion(ESPERA_REINTENTO_RENOVACION)
+                return False
+
+            if self.refresh_token != refresh_token:
+                return False  # Se cerró la sesión mientras se esperaba la respuesta
+            if response.status_code == 200:
+                self._guardar_tokens(response.json())
+                return True
+            if response.status_code == 401:
+                # Refresh token vencido o revocado: hará falta iniciar sesión de nuevo
+                print("La sesión expiró. Es necesario iniciar sesión de nuevo.")
+                self.token = None
+                self.refresh_token = None
+                return False
+            print(f"Error al renovar la sesión ({response.status_code}), se reintentará: {response.text}")
+            self._programar_renovacion(ESPERA_REINTENTO_RENOVACION)
+            return False
+
     def logout(self):
-        """Limpia el estado de la sesión del usuario."""
+        """Limpia el estado de la sesión del usuario y la cierra también en el servidor."""
+        self._cancelar_renovacion()
+        refresh_token = self.refresh_token
         self.token = None
+        self.refresh_token = None
         self.current_user = None
+        if refresh_token:
+            try:
+                requests.post(f"{self.base_url}/token/revoke", json={"refresh_token": refresh_token}, timeout=5)
+            except requests.exceptions.RequestException as e:
+                print(f"No se pudo cerrar la sesión en el servidor: {e}")
         print("Sesión local cerrada.")
 
     def obtener_usuario_actual(self):
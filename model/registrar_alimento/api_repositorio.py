@@ -9,8 +9,12 @@ class ApiAlimentoRepository(AlimentoRepository):
     Implementación del repositorio que se comunica con la API FastAPI
     en lugar de la base de datos SQLite local.
     """
-    def __init__(self, base_url="http://127.0.0.1:8000"):
+    def __init__(self, base_url="http://127.0.0.1:8000", auth_service=None):
         self.base_url = base_url
+        # La API guarda y consulta los consumos del usuario del token (ApiService lo renueva solo)
+        self.auth_service = auth_service
+        # Última respuesta de cada GET condicional: (url, params) -> (etag, json)
+        self._respuestas_cacheadas = {}
         # Verificar si la API está en línea al iniciar
         try:
             response = requests.get(f"{self.base_url}/", timeout=2)
@@ -29,18 +33,44 @@ class ApiAlimentoRepository(AlimentoRepository):
             # raise ConnectionError("No se pudo conectar a la API.") from e
 
 
+    @property
+    def headers(self):
+        """Header de autorización con el token vigente de la sesión."""
+        return (self.auth_service.get_auth_headers() if self.auth_service else None) or {}
+
+    def _get_condicional(self, url, params=None, timeout=5):
+        """
+        GET que envía el ETag de la última respuesta (If-None-Match). Si la API
+        contesta 304 se reutiliza el cuerpo guardado. Devuelve (status_code, json);
+        para respuestas que no son 200/304 el json es None.
+        """
+        clave = (url, tuple(sorted((params or {}).items())))
+        guardada = self._respuestas_cacheadas.get(clave)
+        headers = dict(self.headers)
+        if guardada:
+            headers["If-None-Match"] = guardada[0]
+        response = requests.get(url, params=params, headers=headers, timeout=timeout)
+        if response.status_code == 304 and guardada:
+            return 200, guardada[1]
+        if response.status_code != 200:
+            self._respuestas_cacheadas.pop(clave, None)
+            return response.status_code, None
+        data = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self._respuestas_cacheadas[clave] = (etag, data)
+        return 200, data
+
     def get_ultimo_insertado(self):
         fecha_hoy = datetime.now().strftime('%Y-%m-%d')
         try:
-            response = requests.get(f"{self.base_url}/resumen-diario/{fecha_hoy}")
-            if response.status_code == 404:
-                return "¡Agrega un alimento!"
-            response.raise_for_status()
-            data = response.json()
-            if data.get("consumos"):
-                # Ordenar por hora para obtener el último real
-                consumos_ordenados = sorted(data["consumos"], key=lambda x: x['hora'], reverse=True)
-                return consumos_ordenados[0]['nombre']
+            # detalle=false: la API responde desde el resumen del día, sin enviar cada consumo
+            status, data = self._get_condicional(f"{self.base_url}/resumen-diario/{fecha_hoy}", params={"detalle": "false"})
+            if status != 200:
+                return "¡Agrega un alimento!" if status == 404 else "Error al conectar"
+            ultimo = data.get("ultimo") or {}
+            if ultimo.get("nombre"):
+                return ultimo["nombre"]
             return "¡Agrega un alimento!"
         except requests.RequestException:
             return "Error al conectar"
@@ -72,23 +102,38 @@ class ApiAlimentoRepository(AlimentoRepository):
         ¡Vuelve a la vida! Carga la lista de alimentos personalizados desde la API.
         """
         try:
-            response = requests.get(f"{self.base_url}/alimentos", timeout=5)
-            if response.status_code == 200:
-                alimentos = response.json()
+            status, alimentos = self._get_condicional(f"{self.base_url}/alimentos", timeout=5)
+            if status == 200:
                 return [alimento['nombre'] for alimento in alimentos]
             return []
         except requests.RequestException:
             print("ADVERTENCIA: No se pudo cargar la lista de alimentos desde la API.")
             return []
         
+    def buscar_alimentos(self, texto: str, limite: int = 20) -> List[str]:
+        """
+        Autocompletado: pide a la API solo los alimentos que coinciden con el texto
+        (exactos, luego prefijos, luego infijos) en vez de descargar el catálogo completo.
+        """
+        try:
+            response = requests.get(
+                f"{self.base_url}/alimentos/buscar",
+                params={"q": texto, "limit": limite},
+                timeout=5
+            )
+            if response.status_code == 200:
+                return [alimento['nombre'] for alimento in response.json()]
+            return []
+        except requests.RequestException:
+            print("ADVERTENCIA: No se pudo buscar alimentos en la API.")
+            return []
+
     def calcular_calorias_totales(self):
         fecha_hoy = datetime.now().strftime('%Y-%m-%d')
         try:
-            response = requests.get(f"{self.base_url}/resumen-diario/{fecha_hoy}")
-            if response.status_code == 404:
+            status, data = self._get_condicional(f"{self.base_url}/resumen-diario/{fecha_hoy}", params={"detalle": "false"})
+            if status != 200:
                 return 0.0
-            response.raise_for_status()
-            data = response.json()
             return data.get('resumen_total', {}).get('calorias', 0.0)
         except requests.RequestException:
             return 0.0
@@ -115,7 +160,7 @@ class ApiAlimentoRepository(AlimentoRepository):
             payload = {"consumo": consumo_data}
 
             # Apuntar al nuevo endpoint /registrar-consumo
-            response = requests.post(f"{self.base_url}/registrar-consumo", json=payload)
+            response = requests.post(f"{self.base_url}/registrar-consumo", json=payload, headers=self.headers)
             response.raise_for_status()
 
         except requests.RequestException as e:
@@ -128,7 +173,40 @@ class ApiAlimentoRepository(AlimentoRepository):
             # Capturar otros errores como el de formato de fecha
             raise Exception(f"Error al preparar los datos para la API: {e}")
 
+    def insert_alimentos(self, registros):
+        """
+        Inserta varios consumos en una sola petición (y una sola transacción en la API).
+        Cada registro es una tupla (nombre, fecha, hora, cantidad, calorias), con la
+        fecha en 'dd-mm-YYYY' igual que en `insert_alimento`.
+        Devuelve la lista de resultados por registro que entrega la API.
+        """
+        try:
+            consumos = []
+            for nombre, fecha, hora, cantidad, calorias in registros:
+                fecha_obj = datetime.strptime(fecha, '%d-%m-%Y').date()
+                consumos.append({
+                    "nombre": nombre,
+                    "fecha": fecha_obj.isoformat(),
+                    "hora": hora,
+                    "cantidad": float(cantidad),
+                    "total_cal": float(calorias)
+                })
+        except (ValueError, TypeError) as e:
+            raise Exception(f"Error al preparar los datos para la API: {e}")
+
+        if not consumos:
+            return []
 
+        try:
+            response = requests.post(f"{self.base_url}/registrar-consumo/batch", json={"consumos": consumos},
+                                     headers=self.headers)
+            response.raise_for_status()
+            return response.json().get("resultados", [])
+        except requests.RequestException as e:
+            error_msg = f"Error de API: {e}"
+            if e.response is not None:
+                error_msg += f"\nDetalle: {e.response.text}"
+            raise Exception(error_msg)
 
     def actualizar_calorias_totales(self):
         """
@@ -18,6 +18,9 @@ class BuscadorManager:
         if not typeado or typeado == '':
             self.alimentos_buscar = []
             self.match = []
+        elif hasattr(self.repository, 'buscar_alimentos'):
+            # La API filtra y ordena por relevancia; no hace falta descargar el catálogo
+            self.match = self.repository.buscar_alimentos(typeado)
         else:
             self.alimentos_buscar = self.repository.cargar_alimentos()
             self.match = [i for i in self.alimentos_buscar if typeado.lower() in i.lower()]
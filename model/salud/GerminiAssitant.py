@@ -7,6 +7,8 @@ import sqlite3
 import re
 import os
 
+from model.util.migraciones import aplicar_migraciones
+
 
 class GeminiAssistant(QObject):
     # Señales para comunicación asíncrona con la UI
@@ -426,17 +428,10 @@ Formato de respuesta: Máximo 120 palabras, directo al punto, SIEMPRE incluir da
             user_dir = f"./users/{self.usuario}"
             db_path = f"{user_dir}/alimentos.db"
             conn = sqlite3.connect(db_path)
+            # La tabla 'alimento' la crea y mantiene model/util/migraciones.py
+            aplicar_migraciones(conn)
             cursor = conn.cursor()
             
-            # Aseguramos que la tabla 'alimento' tenga la estructura original de tu PDF
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS alimento (
-                    nombre TEXT NOT NULL,
-                    calorias_100gr INTEGER,
-                    calorias_porcion INTEGER
-                )
-            """)
-            
             # (Opcional pero recomendado) Verificamos si el alimento ya existe para no duplicarlo
             cursor.execute("SELECT nombre FROM alimento WHERE lower(nombre) = lower(?)", (food_name,))
             if cursor.fetchone():
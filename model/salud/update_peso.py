@@ -3,16 +3,18 @@ from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QLabel,
 from PyQt6.QtCore import Qt, pyqtSignal
 from PyQt6.QtGui import QFont
 from datetime import datetime
+import requests
 from model.util.base import DBManager
 
 class Peso(QDialog):
     # Señal para notificar cuando se actualiza el peso
     peso_actualizado = pyqtSignal()
     
-    def __init__(self, parent=None, usuario="default_user", callback=None):
+    def __init__(self, parent=None, usuario="default_user", callback=None, auth_service=None):
         super().__init__(parent)
         self.usuario = usuario
         self.callback = callback
+        self.auth_service = auth_service  # Sesión de la API (ApiService) para actualizar el perfil
         
         self.setWindowTitle('Actualizar peso')
         self.setFixedSize(400, 270)
@@ -230,6 +232,7 @@ class Peso(QDialog):
                 params = (current_date, peso)
             
             DBManager.ejecutar_query(conn, query, params, commit=True)
+            self.actualizar_peso_perfil(peso)
 
             QMessageBox.information(self, "Éxito", "Peso actualizado correctamente")
             
@@ -251,6 +254,22 @@ class Peso(QDialog):
             if conn:
                 DBManager.cerrar_conexion(conn)
 
+    def actualizar_peso_perfil(self, peso):
+        """
+        Lleva el peso al perfil de la API con PATCH /users/me/ (un solo campo, sin If-Match:
+        el último peso registrado es el válido). Si falla, el registro local queda igual.
+        """
+        headers = self.auth_service.get_auth_headers() if self.auth_service else None
+        if not headers:
+            return
+        try:
+            response = requests.patch(f"{self.auth_service.base_url}/users/me/", json={"peso": peso},
+                                      headers=headers, timeout=10)
+            if response.status_code != 200:
+                print(f"No se pudo actualizar el peso del perfil. Status: {response.status_code}, Detalle: {response.text}")
+        except requests.exceptions.RequestException as e:
+            print(f"Error de conexión al actualizar el peso del perfil: {e}")
+
     def get_peso(self):
         """Obtiene el último peso registrado"""
         conn = None
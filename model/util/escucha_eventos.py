@@ -0,0 +1,129 @@
+# model/util/escucha_eventos.py
+import json
+import socket
+import time
+from datetime import date
+
+import requests
+from PyQt6.QtCore import QThread, pyqtSignal
+
+# El servidor manda un comentario cada ~15 s: si pasa más que esto sin datos, la conexión está caída
+TIMEOUT_LECTURA = 60
+ESPERA_RECONEXION_MAX = 30
+
+
+class EscuchaEventos(QThread):
+    """
+    Escucha en segundo plano el flujo /eventos (Server-Sent Events) de la API de
+    alimentos y lo convierte en señales de Qt, para que cada vista actualice solo
+    los días o la lista que cambiaron en vez de volver a pedir todo.
+
+    Las señales se emiten desde este hilo; Qt las entrega en el hilo de cada receptor.
+    Si la conexión se corta, se reconecta enviando el último id recibido para no
+    perder eventos; si la API ya no los tiene, emite `resincronizar`.
+    """
+    consumos_agregados = pyqtSignal(list, list)  # ids de consumo, fechas 'YYYY-MM-DD'
+    dias_modificados = pyqtSignal(list)          # fechas 'YYYY-MM-DD' cuyos consumos o totales cambiaron
+    hoy_modificado = pyqtSignal()                # atajo: entre esas fechas está la de hoy
+    catalogo_modificado = pyqtSignal(str)        # nombre del alimento agregado al catálogo
+    resincronizar = pyqtSignal()                 # se perdieron eventos: recargar lo que se muestra
+
+    def __init__(self, auth_service, base_url="http://127.0.0.1:8000", parent=None):
+        super().__init__(parent)
+        # Sesión (ApiService) de la que se toma el token vigente en cada (re)conexión
+        self.auth_service = auth_service
+        self.base_url = base_url
+        self._activo = True
+        self._respuesta = None
+        self._ultimo_id = None
+
+    def detener(self):
+        """Corta la conexión y espera a que el hilo termine."""
+        self._activo = False
+        respuesta = self._respuesta
+        if respuesta is not None:
+            # Cerrar el socket desbloquea la lectura en curso sin esperar al próximo evento
+            conexion = getattr(respuesta.raw, "connection", None)
+            sock = getattr(conexion, "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.wait(2000)
+
+    def run(self):
+        espera = 1
+        while self._activo:
+            headers = {"Accept": "text/event-stream", **(self.auth_service.get_auth_headers() or {})}
+            if self._ultimo_id:
+                headers["Last-Event-ID"] = self._ultimo_id
+            try:
+                with requests.get(f"{self.base_url}/eventos", headers=headers, stream=True,
+                                  timeout=(5, TIMEOUT_LECTURA)) as response:
+                    response.raise_for_status()
+                    self._respuesta = response
+                    espera = 1
+                    self._leer_eventos(response)
+            except requests.RequestException as e:
+                if self._activo:
+                    print(f"Flujo de eventos interrumpido, reintentando en {espera} s: {e}")
+            finally:
+                self._respuesta = None
+
+            # Espera antes de reconectar, en pasos cortos para responder rápido a detener()
+            limite = time.monotonic() + espera
+            while self._activo and time.monotonic() < limite:
+                self.msleep(100)
+            espera = min(espera * 2, ESPERA_RECONEXION_MAX)
+
+    def _leer_eventos(self, response):
+        """Interpreta el formato SSE: campos 'id', 'event' y 'data' hasta una línea vacía."""
+        tipo, id_evento, datos = "message", None, []
+        for linea in response.iter_lines(decode_unicode=True):
+            if not self._activo:
+                return
+            if linea is None:
+                continue
+            if linea == "":
+                if datos:
+                    self._despachar(tipo, "\n".join(datos))
+                    if id_evento:
+                        self._ultimo_id = id_evento
+                tipo, id_evento, datos = "message", None, []
+                continue
+            if linea.startswith(":"):
+                continue  # Comentario (mantener viva la conexión)
+            campo, _, valor = linea.partition(":")
+            if valor.startswith(" "):
+                valor = valor[1:]
+            if campo == "event":
+                tipo = valor
+            elif campo == "data":
+                datos.append(valor)
+            elif campo == "id":
+                id_evento = valor
+
+    def _despachar(self, tipo, texto):
+        try:
+            datos = json.loads(texto)
+        except ValueError:
+            print(f"Evento '{tipo}' con datos inválidos: {texto!r}")
+            return
+
+        if tipo == "consumo":
+            self.consumos_agregados.emit(datos.get("ids", []), datos.get("fechas", []))
+            self._emitir_dias(datos.get("fechas", []))
+        elif tipo == "dias":
+            self._emitir_dias(datos.get("fechas", []))
+        elif tipo == "catalogo":
+            self.catalogo_modificado.emit(datos.get("nombre", ""))
+        elif tipo == "resincronizar":
+            self.resincronizar.emit()
+
+    def _emitir_dias(self, fechas):
+        if not fechas:
+            return
+        self.dias_modificados.emit(list(fechas))
+        if date.today().isoformat() in fechas:
+            self.hoy_modificado.emit()
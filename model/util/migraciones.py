@@ -0,0 +1,233 @@
+# model/util/migraciones.py
+"""
+Migraciones del esquema de la base local de cada usuario (users/<usuario>/alimentos.db).
+
+La versión del esquema se guarda en `PRAGMA user_version`. Cada paso de MIGRACIONES
+lleva la base de la versión anterior a la suya dentro de una transacción, y es
+idempotente: se puede aplicar sobre bases creadas por versiones viejas de la app,
+que tienen definiciones distintas de las mismas tablas.
+
+Para cambiar el esquema se agrega un paso al final de la lista; nunca se edita uno
+ya publicado. Los pasos que reconstruyen tablas se marcan como destructivos y antes
+de aplicarlos se guarda una copia de la base junto al archivo original.
+"""
+import os
+import sqlite3
+from datetime import datetime
+
+DIRECTORIO_USUARIOS = "./users"
+
+# Columnas de `mensajes`: una por módulo con mensaje de bienvenida (1 = falta mostrarlo)
+MODULOS_MENSAJES = (
+    "registrar_alimento", "agregar_alimento", "graficos", "configuracion", "salud",
+    "admin_alimentos", "historial", "peso", "pulsaciones", "recordatorios", "agua",
+)
+
+
+def ruta_db_usuario(usuario: str) -> str:
+    return f"{DIRECTORIO_USUARIOS}/{usuario}/alimentos.db"
+
+
+def _columnas(conn: sqlite3.Connection, tabla: str) -> dict:
+    """Columnas de la tabla -> tipo declarado (vacío si la tabla no existe)."""
+    return {fila[1]: (fila[2] or "").upper() for fila in conn.execute(f"PRAGMA table_info({tabla})")}
+
+
+# --- Pasos ---
+def _m1_tablas_base(conn: sqlite3.Connection):
+    """Tablas locales que usa la app, unificando las definiciones que existían por separado."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS peso (
+            num INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha TEXT,
+            peso REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agua (
+            num INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha TEXT,
+            cant INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS datos (
+            nombre TEXT PRIMARY KEY,
+            recordatorio TEXT,
+            cantidad_dias TEXT,
+            ultimo_msj TEXT,
+            profile_pic_path TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recordatorios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            titulo TEXT,
+            fecha TEXT,
+            hora TEXT,
+            usuario TEXT,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS alimento (
+            id INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            calorias_100gr REAL,
+            calorias_porcion REAL
+        )
+    """)
+    # Consumos de antes de que los guardara la API; algunas vistas aún los leen
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS consumo_diario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            fecha TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            cantidad REAL NOT NULL,
+            total_cal REAL NOT NULL
+        )
+    """)
+
+
+def _m2_mensajes(conn: sqlite3.Connection):
+    """
+    `mensajes` con una sola fila (id = 1) y una columna por módulo. Las bases viejas
+    tenían la tabla sin `id` o con otras columnas, y la app le agregaba columnas en
+    tiempo de ejecución: se reconstruye conservando los valores y las columnas extra.
+    """
+    anteriores = _columnas(conn, "mensajes")
+    extra = [c for c in anteriores if c != "id" and c not in MODULOS_MENSAJES]
+    columnas = list(MODULOS_MENSAJES) + extra
+    definicion = ", ".join(f"{c} INTEGER NOT NULL DEFAULT 1" for c in columnas)
+    conn.execute("DROP TABLE IF EXISTS mensajes_nueva")
+    conn.execute(f"CREATE TABLE mensajes_nueva (id INTEGER PRIMARY KEY CHECK (id = 1), {definicion})")
+
+    fila = None
+    if anteriores:
+        orden = "ORDER BY id = 1 DESC, rowid" if "id" in anteriores else "ORDER BY rowid"
+        copiadas = [c for c in columnas if c in anteriores]
+        if copiadas:
+            fila = conn.execute(f"SELECT {', '.join(copiadas)} FROM mensajes {orden} LIMIT 1").fetchone()
+        conn.execute("DROP TABLE mensajes")
+    if fila is not None:
+        valores = {c: v for c, v in zip(copiadas, fila) if v is not None}
+        nombres = ", ".join(["id"] + list(valores))
+        marcas = ", ".join(["1"] + ["?"] * len(valores))
+        conn.execute(f"INSERT INTO mensajes_nueva ({nombres}) VALUES ({marcas})", tuple(valores.values()))
+    else:
+        conn.execute("INSERT INTO mensajes_nueva (id) VALUES (1)")
+    conn.execute("ALTER TABLE mensajes_nueva RENAME TO mensajes")
+
+
+def _m3_alimento_tipado(conn: sqlite3.Connection):
+    """
+    `alimento` con `id` (los repositorios lo consultan) y calorías REAL. Las bases
+    viejas la tenían sin id y con calorías INTEGER, que truncaba los decimales.
+    """
+    columnas = _columnas(conn, "alimento")
+    if ("id" in columnas and columnas.get("calorias_100gr") == "REAL"
+            and columnas.get("calorias_porcion") == "REAL"):
+        return
+    # Columnas que alguna versión haya agregado por su cuenta se conservan tal cual
+    extra = {c: tipo for c, tipo in columnas.items() if c not in ("id", "nombre", "calorias_100gr", "calorias_porcion")}
+    definicion_extra = "".join(f", {c} {tipo}" for c, tipo in extra.items())
+    conn.execute("DROP TABLE IF EXISTS alimento_nueva")
+    conn.execute(f"""
+        CREATE TABLE alimento_nueva (
+            id INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            calorias_100gr REAL,
+            calorias_porcion REAL{definicion_extra}
+        )
+    """)
+    copiadas = ", ".join(["nombre", "calorias_100gr", "calorias_porcion"] + list(extra))
+    conn.execute(f"INSERT INTO alimento_nueva ({copiadas}) SELECT {copiadas} FROM alimento ORDER BY rowid")
+    conn.execute("DROP TABLE alimento")
+    conn.execute("ALTER TABLE alimento_nueva RENAME TO alimento")
+
+
+def _m4_indices(conn: sqlite3.Connection):
+    """Índices para las búsquedas por fecha y por nombre que hacen las vistas en cada carga."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agua_fecha ON agua (fecha)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_peso_fecha ON peso (fecha)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_consumo_diario_fecha ON consumo_diario (fecha)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alimento_nombre ON alimento (nombre)")
+    # Las búsquedas sin distinguir mayúsculas comparan LOWER(nombre) = ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alimento_nombre_lower ON alimento (lower(nombre))")
+
+
+# (versión, descripción, destructiva, función). Las versiones son consecutivas desde 1.
+MIGRACIONES = [
+    (1, "tablas base", False, _m1_tablas_base),
+    (2, "mensajes con id y una columna por módulo", True, _m2_mensajes),
+    (3, "alimento con id y calorías REAL", True, _m3_alimento_tipado),
+    (4, "índices por fecha y nombre", False, _m4_indices),
+]
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+
+# --- Ejecución ---
+def version_esquema(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def respaldar(conn: sqlite3.Connection, version: int) -> str:
+    """Copia la base completa (con la API de backup de SQLite) junto al archivo original."""
+    ruta = conn.execute("PRAGMA database_list").fetchone()[2]
+    destino = f"{ruta}.v{version}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.bak"
+    copia = sqlite3.connect(destino)
+    try:
+        conn.backup(copia)
+    finally:
+        copia.close()
+    return destino
+
+
+def aplicar_migraciones(conn: sqlite3.Connection) -> int:
+    """
+    Lleva la base abierta en `conn` a VERSION_ACTUAL y devuelve la versión final.
+    Si ya está al día solo cuesta leer `PRAGMA user_version`.
+    """
+    version = version_esquema(conn)
+    if version == VERSION_ACTUAL:
+        return version
+    if version > VERSION_ACTUAL:
+        print(f"ADVERTENCIA: la base local tiene el esquema v{version}, más nuevo que el de esta versión "
+              f"de la app (v{VERSION_ACTUAL}). No se modifica.")
+        return version
+
+    pendientes = [paso for paso in MIGRACIONES if paso[0] > version]
+    tiene_tablas = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' LIMIT 1").fetchone()
+    if tiene_tablas and any(destructiva for _, _, destructiva, _ in pendientes):
+        print(f"Copia de seguridad de la base local antes de migrar: {respaldar(conn, version)}")
+
+    if conn.in_transaction:
+        conn.commit()
+    for numero, descripcion, _, funcion in pendientes:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Otro proceso pudo haber aplicado este paso mientras esperábamos el bloqueo
+            if version_esquema(conn) >= numero:
+                conn.commit()
+                continue
+            funcion(conn)
+            conn.execute(f"PRAGMA user_version = {int(numero)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"Error aplicando la migración v{numero} ({descripcion}) de la base local.")
+            raise
+        print(f"Base local migrada a v{numero}: {descripcion}")
+    return version_esquema(conn)
+
+
+def migrar_db_usuario(usuario: str) -> int:
+    """Crea (si hace falta) y migra users/<usuario>/alimentos.db. Se llama al iniciar sesión y al registrarse."""
+    ruta = ruta_db_usuario(usuario)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    conn = sqlite3.connect(ruta)
+    try:
+        return aplicar_migraciones(conn)
+    finally:
+        conn.close()
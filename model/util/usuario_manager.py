@@ -1,108 +1,21 @@
 # model/util/usuario_manager.py
 import sqlite3
 import os
-import requests
-import json
 from PyQt6.QtWidgets import QMessageBox
 
+from model.util.migraciones import MODULOS_MENSAJES, aplicar_migraciones
+
 class UsuarioManager:
-    """Clase para manejar la gestión de usuarios, interactuando con una API y BD local."""
+    """Clase para manejar el usuario actual y su BD local."""
     
     @staticmethod
-    def _get_api_url():
-        """Devuelve la URL base de la API. Centralizado para fácil modificación."""
-        return "http://127.0.0.1:8000"
-
-    @staticmethod
-    def _save_token(token):
-        """Guarda el token de sesión JWT en un archivo local."""
-        try:
-            with open('session_token.txt', 'w') as f:
-                f.write(token)
-        except Exception as e:
-            print(f"Error al guardar el token: {e}")
-
-    @staticmethod
-    def _get_token():
-        """Recupera el token de sesión JWT desde el archivo local."""
-        try:
-            if not os.path.exists('session_token.txt'):
-                return None
-            with open('session_token.txt', 'r') as f:
-                return f.read().strip()
-        except Exception as e:
-            print(f"Error al leer el token: {e}")
-            return None
-
-    @staticmethod
-    def login_user(username, password):
-        """
-        Autentica al usuario contra la API. Si es exitoso, guarda el token y el nombre de usuario.
-        Retorna los datos del usuario en caso de éxito, de lo contrario None.
-        """
-        api_url = f"{UsuarioManager._get_api_url()}/login/"
-        try:
-            response = requests.post(
-                api_url,
-                data={"username": username, "password": password}
-            )
-            if response.status_code == 200:
-                token_data = response.json()
-                token = token_data.get("access_token")
-                if token:
-                    UsuarioManager._save_token(token)
-                    UsuarioManager.establecer_usuario_actual(username)
-                    print(f"Login exitoso para el usuario: {username}")
-                    # Tras un login exitoso, obtenemos los datos del usuario
-                    return UsuarioManager.get_user_data_from_api()
-                else:
-                    print("Error de login: El token no se encontró en la respuesta.")
-                    return None
-            else:
-                print(f"Error de login. Status: {response.status_code}, Detalle: {response.text}")
-                return None
-        except requests.exceptions.RequestException as e:
-            print(f"Error de conexión con la API durante el login: {e}")
-            return None
-
-    @staticmethod
-    def get_user_data_from_api():
+    def logout_user():
         """
-        Obtiene los datos del usuario actualmente autenticado desde el endpoint /users/me/ de la API.
+        Olvida al usuario actual. La sesión de la API (tokens y su renovación) la maneja
+        ApiService en model/login/auth_service.py.
         """
-        token = UsuarioManager._get_token()
-        if not token:
-            print("No se pueden obtener los datos del usuario: No se encontró token de sesión.")
-            return None
-
-        api_url = f"{UsuarioManager._get_api_url()}/users/me/"
-        headers = {"Authorization": f"Bearer {token}"}
-
-        try:
-            response = requests.get(api_url, headers=headers)
-            if response.status_code == 200:
-                user_data = response.json()
-                print(f"Datos obtenidos exitosamente para el usuario: {user_data.get('nombre_usuario')}")
-                return user_data
-            elif response.status_code == 401:
-                print("Error al obtener datos: Token inválido o expirado.")
-                UsuarioManager.logout_user() # Limpiamos la sesión inválida
-                return None
-            else:
-                print(f"Error al obtener datos. Status: {response.status_code}, Detalle: {response.text}")
-                return None
-        except requests.exceptions.RequestException as e:
-            print(f"Error de conexión con la API al obtener datos del usuario: {e}")
-            return None
-
-    @staticmethod
-    def logout_user():
-        """Cierra la sesión del usuario eliminando los archivos locales de sesión."""
         if os.path.exists('usuario_actual.txt'):
             os.remove('usuario_actual.txt')
-        if os.path.exists('session_token.txt'):
-            os.remove('session_token.txt')
-        print("Sesión cerrada. Archivos de sesión eliminados.")
 
     @staticmethod
     def obtener_usuario_actual():
@@ -143,16 +56,14 @@ class UsuarioManager:
     
     @staticmethod
     def _crear_tablas_iniciales(conn, usuario):
-        """Crea las tablas iniciales en la BD local de un nuevo usuario."""
-        cursor = conn.cursor()
+        """
+        Asegura que la BD local esté en el esquema actual (model/util/migraciones.py).
+        Normalmente ya se migró al iniciar sesión y esto solo lee PRAGMA user_version.
+        """
         try:
-            cursor.execute('CREATE TABLE IF NOT EXISTS mensajes (id INTEGER PRIMARY KEY, salud INTEGER DEFAULT 1, peso INTEGER DEFAULT 1, pulsaciones INTEGER DEFAULT 1, recordatorios INTEGER DEFAULT 1, agua INTEGER DEFAULT 1)')
-            cursor.execute('CREATE TABLE IF NOT EXISTS peso (num INTEGER PRIMARY KEY AUTOINCREMENT, peso REAL NOT NULL, fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
-            cursor.execute('INSERT OR IGNORE INTO mensajes (id) VALUES (1)')
-            conn.commit()
-            print(f"Tablas locales iniciales creadas para el usuario: {usuario}")
+            aplicar_migraciones(conn)
         except Exception as e:
-            print(f"Error al crear tablas iniciales: {e}")
+            print(f"Error al migrar la BD local del usuario {usuario}: {e}")
 
     # --- El resto de las funciones (mostrar_mensaje_una_vez, resetear_mensajes) permanecen sin cambios ---
     @staticmethod
@@ -162,12 +73,11 @@ class UsuarioManager:
         conn = UsuarioManager.conectar_bd_usuario(usuario)
         if not conn: return
         try:
+            # Las columnas de `mensajes` las define la migración; un módulo nuevo necesita su propio paso
+            if nombre_ventana not in MODULOS_MENSAJES:
+                print(f"ADVERTENCIA: '{nombre_ventana}' no tiene columna en 'mensajes'; agréguela con una migración.")
+                return
             cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(mensajes)")
-            columnas = [col[1] for col in cursor.fetchall()]
-            if nombre_ventana not in columnas:
-                cursor.execute(f"ALTER TABLE mensajes ADD COLUMN {nombre_ventana} INTEGER DEFAULT 1")
-                conn.commit()
             cursor.execute(f"SELECT {nombre_ventana} FROM mensajes WHERE id = 1")
             resultado = cursor.fetchone()
             if resultado and resultado[0] == 1:
@@ -0,0 +1,269 @@
+"""
+Tabla de composición de alimentos sin conexión, de solo lectura y mapeada en memoria.
+
+Se construye una vez a partir de un CSV público (p. ej. la exportación de Open Food
+Facts, BEDCA o USDA FoodData Central) y la API la usa como segunda fuente en
+/consultar-alimento, entre el catálogo propio y Edamam. Abrirla es un `mmap` del
+archivo: no se lee nada hasta que se busca, y una búsqueda es una búsqueda binaria
+sobre el índice, sin crear objetos de Python por fila.
+
+Formato del archivo (little-endian):
+
+    cabecera  MAGICO, versión, filas, offset tabla, offset índice, offset textos, bytes de textos
+    tabla     una fila por alimento: (offset nombre, largo nombre, kcal por 100 g, kcal por porción)
+    índice    (offset clave, largo clave, fila), ordenado por la clave normalizada en UTF-8
+    textos    nombres originales y claves normalizadas, en UTF-8 y sin separadores
+
+Las calorías que faltan se guardan como NaN.
+
+Uso (desde la raíz del proyecto):
+    python tabla_composicion.py importar alimentos.csv [--salida composicion_alimentos.bin]
+           [--columna-nombre product_name] [--columna-kcal energy-kcal_100g] [--unidad kj]
+    python tabla_composicion.py buscar "manzana roja"
+"""
+import argparse
+import csv
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+import unicodedata
+from typing import Iterable, Iterator, Optional, Tuple
+
+MAGICO = b"CALTAB\x00\x00"
+VERSION_FORMATO = 1
+CABECERA = struct.Struct("<8sIIIIII")
+FILA = struct.Struct("<IHff")     # offset nombre, largo nombre, kcal/100 g, kcal/porción
+ENTRADA = struct.Struct("<IHI")   # offset clave, largo clave, fila
+LARGO_MAX_TEXTO = 0xFFFF
+KJ_POR_KCAL = 4.184
+
+RUTA_POR_DEFECTO = "composicion_alimentos.bin"
+
+# Encabezados que se prueban, en orden, si no se indica la columna
+COLUMNAS_NOMBRE = ("nombre", "name", "product_name", "product_name_es", "description", "alimento", "food_name")
+COLUMNAS_KCAL = ("calorias_100gr", "energy-kcal_100g", "energia_kcal", "kcal_100g", "energy_kcal", "calorias", "kcal")
+COLUMNAS_PORCION = ("calorias_porcion", "kcal_porcion", "energy-kcal_serving")
+
+
+def normalizar_nombre(nombre: str) -> str:
+    """Clave de búsqueda de un alimento: sin tildes, sin mayúsculas y con espacios simples."""
+    descompuesto = unicodedata.normalize("NFKD", nombre)
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_tildes.casefold().split())
+
+
+class TablaComposicion:
+    """
+    Lector de la tabla. Es seguro compartirlo entre hilos: solo lee del mapa.
+    Las filas se decodifican al accederlas; el resto del archivo queda en la caché
+    de páginas del sistema operativo.
+    """
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        with open(ruta, "rb") as archivo:
+            self._mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magico, version, self.filas, self._off_tabla, self._off_indice,
+             self._off_textos, largo_textos) = CABECERA.unpack_from(self._mapa, 0)
+            if magico != MAGICO or version != VERSION_FORMATO:
+                raise ValueError(f"{ruta} no es una tabla de composición (versión {VERSION_FORMATO}).")
+            if (self._off_tabla + self.filas * FILA.size > self._off_indice
+                    or self._off_indice + self.filas * ENTRADA.size > self._off_textos
+                    or self._off_textos + largo_textos > len(self._mapa)):
+                raise ValueError(f"{ruta} está truncado o dañado.")
+        except Exception:
+            self._mapa.close()
+            raise
+
+    @classmethod
+    def abrir(cls, ruta: str) -> Optional["TablaComposicion"]:
+        """Abre la tabla si el archivo existe; si no existe o no es válido devuelve None (la fuente queda desactivada)."""
+        if not os.path.exists(ruta):
+            return None
+        try:
+            return cls(ruta)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"ADVERTENCIA: no se pudo abrir la tabla de composición '{ruta}': {e}")
+            return None
+
+    def __len__(self) -> int:
+        return self.filas
+
+    def cerrar(self):
+        self._mapa.close()
+
+    def _clave(self, posicion: int) -> Tuple[bytes, int]:
+        offset, largo, fila = ENTRADA.unpack_from(self._mapa, self._off_indice + posicion * ENTRADA.size)
+        inicio = self._off_textos + offset
+        return self._mapa[inicio:inicio + largo], fila
+
+    def fila(self, numero: int) -> dict:
+        offset, largo, kcal_100, kcal_porcion = FILA.unpack_from(self._mapa, self._off_tabla + numero * FILA.size)
+        inicio = self._off_textos + offset
+        return {
+            "nombre": self._mapa[inicio:inicio + largo].decode("utf-8"),
+            "calorias_100gr": None if math.isnan(kcal_100) else round(kcal_100, 2),
+            "calorias_porcion": None if math.isnan(kcal_porcion) else round(kcal_porcion, 2),
+        }
+
+    def buscar_clave(self, clave: str) -> Optional[dict]:
+        """Busca por clave ya normalizada (ver `normalizar_nombre`)."""
+        buscada = clave.encode("utf-8")
+        bajo, alto = 0, self.filas
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._clave(medio)[0] < buscada:
+                bajo = medio + 1
+            else:
+                alto = medio
+        if bajo < self.filas:
+            encontrada, fila = self._clave(bajo)
+            if encontrada == buscada:
+                return self.fila(fila)
+        return None
+
+    def buscar(self, nombre: str) -> Optional[dict]:
+        return self.buscar_clave(normalizar_nombre(nombre))
+
+
+# --- Importación desde CSV ---
+def _numero(valor: Optional[str]) -> Optional[float]:
+    if valor is None:
+        return None
+    valor = valor.strip().replace(",", ".")
+    if not valor:
+        return None
+    try:
+        numero = float(valor)
+    except ValueError:
+        return None
+    return numero if math.isfinite(numero) and numero >= 0 else None
+
+
+def _elegir_columna(encabezados, indicada: Optional[str], candidatas, obligatoria: bool) -> Optional[str]:
+    if indicada:
+        if indicada not in encabezados:
+            raise SystemExit(f"La columna '{indicada}' no está en el CSV. Columnas: {', '.join(encabezados)}")
+        return indicada
+    for candidata in candidatas:
+        if candidata in encabezados:
+            return candidata
+    if obligatoria:
+        raise SystemExit(f"No se encontró ninguna de las columnas {', '.join(candidatas)}; indíquela con --columna-*.")
+    return None
+
+
+def leer_csv(ruta: str, columna_nombre: Optional[str] = None, columna_kcal: Optional[str] = None,
+             columna_porcion: Optional[str] = None, separador: Optional[str] = None,
+             codificacion: str = "utf-8-sig", unidad: str = "kcal") -> Iterator[Tuple[str, float, Optional[float]]]:
+    """Recorre el CSV y produce (nombre, kcal por 100 g, kcal por porción) de las filas válidas."""
+    factor = 1 / KJ_POR_KCAL if unidad == "kj" else 1.0
+    csv.field_size_limit(sys.maxsize)
+    with open(ruta, newline="", encoding=codificacion, errors="replace") as archivo:
+        if separador is None:
+            muestra = archivo.read(64 * 1024)
+            archivo.seek(0)
+            separador = csv.Sniffer().sniff(muestra, delimiters=",;\t").delimiter if muestra else ","
+        lector = csv.DictReader(archivo, delimiter=separador)
+        encabezados = lector.fieldnames or []
+        columna_nombre = _elegir_columna(encabezados, columna_nombre, COLUMNAS_NOMBRE, True)
+        columna_kcal = _elegir_columna(encabezados, columna_kcal, COLUMNAS_KCAL, True)
+        columna_porcion = _elegir_columna(encabezados, columna_porcion, COLUMNAS_PORCION, False)
+        for registro in lector:
+            nombre = " ".join((registro.get(columna_nombre) or "").split())
+            kcal = _numero(registro.get(columna_kcal))
+            if not nombre or kcal is None:
+                continue
+            porcion = _numero(registro.get(columna_porcion)) if columna_porcion else None
+            yield nombre, kcal * factor, (porcion * factor if porcion is not None else None)
+
+
+def construir_tabla(alimentos: Iterable[Tuple[str, float, Optional[float]]], salida: str) -> dict:
+    """
+    Escribe la tabla binaria. Si dos alimentos tienen la misma clave normalizada se
+    conserva el primero. El archivo se escribe aparte y se reemplaza al final, así una
+    API que lo tenga abierto nunca ve uno a medio escribir.
+    """
+    textos = bytearray()
+    filas = []
+    indice = []
+    claves_vistas = set()
+    leidos = 0
+    for nombre, kcal_100, kcal_porcion in alimentos:
+        leidos += 1
+        clave = normalizar_nombre(nombre)
+        nombre_bytes = nombre.encode("utf-8")
+        clave_bytes = clave.encode("utf-8")
+        if not clave or clave in claves_vistas or max(len(nombre_bytes), len(clave_bytes)) > LARGO_MAX_TEXTO:
+            continue
+        claves_vistas.add(clave)
+        offset_nombre = len(textos)
+        textos += nombre_bytes
+        # Si la clave coincide con el nombre (ya estaba normalizado) se reutiliza el mismo texto
+        if clave_bytes == nombre_bytes:
+            offset_clave = offset_nombre
+        else:
+            offset_clave = len(textos)
+            textos += clave_bytes
+        indice.append((clave_bytes, offset_clave, len(filas)))
+        filas.append((offset_nombre, len(nombre_bytes),
+                      kcal_100, math.nan if kcal_porcion is None else kcal_porcion))
+    indice.sort(key=lambda entrada: entrada[0])
+
+    off_tabla = CABECERA.size
+    off_indice = off_tabla + len(filas) * FILA.size
+    off_textos = off_indice + len(indice) * ENTRADA.size
+    temporal = f"{salida}.tmp"
+    with open(temporal, "wb") as archivo:
+        archivo.write(CABECERA.pack(MAGICO, VERSION_FORMATO, len(filas), off_tabla, off_indice, off_textos, len(textos)))
+        for fila in filas:
+            archivo.write(FILA.pack(*fila))
+        for clave_bytes, offset_clave, numero in indice:
+            archivo.write(ENTRADA.pack(offset_clave, len(clave_bytes), numero))
+        archivo.write(textos)
+    os.replace(temporal, salida)
+    return {"leidos": leidos, "guardados": len(filas), "bytes": off_textos + len(textos)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    importar = subcomandos.add_parser("importar", help="Construye la tabla binaria desde un CSV")
+    importar.add_argument("csv")
+    importar.add_argument("--salida", default=os.getenv("ALIMENTOS_TABLA_COMPOSICION", RUTA_POR_DEFECTO))
+    importar.add_argument("--columna-nombre")
+    importar.add_argument("--columna-kcal", help="Energía por 100 g")
+    importar.add_argument("--columna-porcion", help="Energía por porción (opcional)")
+    importar.add_argument("--unidad", choices=("kcal", "kj"), default="kcal", help="Unidad de las columnas de energía")
+    importar.add_argument("--separador", help="Por defecto se detecta (',', ';' o tabulador)")
+    importar.add_argument("--codificacion", default="utf-8-sig")
+
+    buscar = subcomandos.add_parser("buscar", help="Busca un alimento en una tabla ya construida")
+    buscar.add_argument("nombre")
+    buscar.add_argument("--tabla", default=os.getenv("ALIMENTOS_TABLA_COMPOSICION", RUTA_POR_DEFECTO))
+    args = parser.parse_args()
+
+    if args.comando == "importar":
+        inicio = time.perf_counter()
+        resultado = construir_tabla(
+            leer_csv(args.csv, args.columna_nombre, args.columna_kcal, args.columna_porcion,
+                     args.separador, args.codificacion, args.unidad),
+            args.salida,
+        )
+        print(f"{resultado['guardados']} alimentos guardados de {resultado['leidos']} filas válidas "
+              f"en {args.salida} ({resultado['bytes'] / 1024:.1f} KiB, {time.perf_counter() - inicio:.1f} s).")
+    else:
+        tabla = TablaComposicion(args.tabla)
+        inicio = time.perf_counter()
+        encontrado = tabla.buscar(args.nombre)
+        microsegundos = (time.perf_counter() - inicio) * 1e6
+        print(encontrado if encontrado else "No encontrado.", f"({microsegundos:.1f} µs, {len(tabla)} alimentos)")
+        tabla.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Fixtures compartidas: cada API corre con TestClient sobre bases en un directorio
+temporal, con la misma clave de firma de JWT, como en producción.
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ_PROYECTO)
+
+# Las dos APIs leen la configuración al importarse: se define antes de cualquier import
+DIRECTORIO_DATOS = tempfile.mkdtemp(prefix="tests_contador_")
+os.environ["Key_JWT"] = "clave-de-pruebas"
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRECTORIO_DATOS, 'app.db')}"
+# Costo bajo: los tests verifican el flujo, no la fuerza del hash
+os.environ["PASSWORD_HASH_METODO"] = "pbkdf2:sha256:1000"
+
+
+@pytest.fixture(scope="session")
+def _alimentos():
+    """api_alimento iniciado y su TestClient; la base (alimentos_app.db) es relativa al directorio actual."""
+    anterior = os.getcwd()
+    os.chdir(DIRECTORIO_DATOS)
+    try:
+        import api_alimento
+        from fastapi.testclient import TestClient
+        with TestClient(api_alimento.app) as cliente:
+            yield api_alimento, cliente
+    finally:
+        os.chdir(anterior)
+
+
+@pytest.fixture
+def api_alimentos(_alimentos):
+    return _alimentos[0]
+
+
+@pytest.fixture
+def cliente_alimentos(_alimentos):
+    return _alimentos[1]
+
+
+@pytest.fixture(scope="session")
+def _usuarios():
+    from controller.API.user import api_server
+    from fastapi.testclient import TestClient
+    with TestClient(api_server.app) as cliente:
+        yield api_server, cliente
+
+
+@pytest.fixture
+def api_usuarios(_usuarios):
+    return _usuarios[0]
+
+
+@pytest.fixture
+def cliente_usuarios(_usuarios):
+    return _usuarios[1]
+
+
+@pytest.fixture
+def autorizacion(api_alimentos):
+    """Encabezado Authorization con un JWT válido para el usuario indicado."""
+    def _autorizacion(usuario: str) -> dict:
+        token = api_alimentos.jwt.encode({"sub": usuario}, api_alimentos.JWT_SECRET_KEY,
+                                         algorithm=api_alimentos.JWT_ALGORITHM)
+        return {"Authorization": f"Bearer {token}"}
+    return _autorizacion
+
+
+@pytest.fixture
+def usuario():
+    """Nombre único por test: todos comparten la misma base."""
+    return f"usuario_{uuid.uuid4().hex[:10]}"
@@ -0,0 +1,59 @@
+"""Cada usuario ve solo sus consumos: historial, resumen diario, estadísticas y sus ETag."""
+import uuid
+
+import pytest
+
+FECHA = "2026-06-15"
+
+
+@pytest.fixture
+def ana(cliente_alimentos, autorizacion, usuario):
+    """Usuario con dos consumos el mismo día."""
+    encabezados = autorizacion(usuario)
+    consumos = [{"nombre": "Arroz", "fecha": FECHA, "hora": "13:00", "cantidad": 200, "total_cal": 260},
+                {"nombre": "Yogur", "fecha": FECHA, "hora": "17:00", "cantidad": 125, "total_cal": 90}]
+    cliente_alimentos.post("/registrar-consumo/batch", json={"consumos": consumos}, headers=encabezados)
+    return encabezados
+
+
+@pytest.fixture
+def bob(autorizacion):
+    return autorizacion(f"usuario_{uuid.uuid4().hex[:10]}")
+
+
+def test_sin_token_no_hay_datos(cliente_alimentos):
+    assert cliente_alimentos.get(f"/resumen-diario/{FECHA}").status_code == 401
+    assert cliente_alimentos.get("/historial", params={"fecha_desde": FECHA, "fecha_hasta": FECHA}).status_code == 401
+    assert cliente_alimentos.get(f"/resumen-diario/{FECHA}",
+                                 headers={"Authorization": "Bearer no-es-un-jwt"}).status_code == 401
+
+
+def test_otro_usuario_no_ve_los_consumos(cliente_alimentos, ana, bob):
+    rango = {"fecha_desde": FECHA, "fecha_hasta": FECHA}
+    assert len(cliente_alimentos.get("/historial", params=rango, headers=ana).json()) == 2
+    assert cliente_alimentos.get("/historial", params=rango, headers=bob).json() == []
+
+    assert cliente_alimentos.get(f"/resumen-diario/{FECHA}", headers=ana).json()["resumen_total"] == \
+        {"calorias": 350.0, "items": 2}
+    assert cliente_alimentos.get(f"/resumen-diario/{FECHA}", headers=bob).status_code == 404
+
+    params = {"desde": FECHA, "hasta": FECHA, "granularidad": "day"}
+    assert [i["suma"] for i in cliente_alimentos.get("/estadisticas", params=params, headers=ana).json()["intervalos"]] == [350.0]
+    assert [i["suma"] for i in cliente_alimentos.get("/estadisticas", params=params, headers=bob).json()["intervalos"]] == [0]
+
+
+def test_etag_no_se_comparte_entre_usuarios(cliente_alimentos, ana, bob):
+    rango = {"fecha_desde": FECHA, "fecha_hasta": FECHA}
+    for ruta, params in ((f"/resumen-diario/{FECHA}", {"detalle": "false"}), ("/historial", rango)):
+        etag = cliente_alimentos.get(ruta, params=params, headers=ana).headers["ETag"]
+        assert cliente_alimentos.get(ruta, params=params, headers={**ana, "If-None-Match": etag}).status_code == 304
+        respuesta_bob = cliente_alimentos.get(ruta, params=params, headers={**bob, "If-None-Match": etag})
+        assert respuesta_bob.status_code != 304
+
+
+def test_consumo_de_otro_usuario_no_invalida_etag(cliente_alimentos, ana, bob):
+    ruta = f"/resumen-diario/{FECHA}"
+    etag = cliente_alimentos.get(ruta, headers=ana).headers["ETag"]
+    cliente_alimentos.post("/registrar-consumo/batch", headers=bob, json={"consumos": [
+        {"nombre": "Pan", "fecha": FECHA, "hora": "09:00", "cantidad": 50, "total_cal": 130}]})
+    assert cliente_alimentos.get(ruta, headers={**ana, "If-None-Match": etag}).status_code == 304
@@ -0,0 +1,59 @@
+"""POST /registrar-consumo/batch: los consumos inválidos se informan sin impedir guardar el resto."""
+import pytest
+
+
+def consumo(nombre, fecha="2026-03-10", hora="08:00", cantidad=100, total_cal=150):
+    return {"nombre": nombre, "fecha": fecha, "hora": hora, "cantidad": cantidad, "total_cal": total_cal}
+
+
+def test_lote_con_fallas_parciales(cliente_alimentos, autorizacion, usuario):
+    consumos = [
+        consumo("Avena", hora="07:30", total_cal=300),
+        consumo("Mal fechado", fecha="10-03-2026"),
+        consumo("Manzana", hora="10:15", total_cal=80),
+        consumo("Mala hora", hora="25:99"),
+    ]
+    respuesta = cliente_alimentos.post("/registrar-consumo/batch", json={"consumos": consumos},
+                                       headers=autorizacion(usuario))
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    assert (cuerpo["registrados"], cuerpo["rechazados"]) == (2, 2)
+
+    resultados = cuerpo["resultados"]
+    assert [r["indice"] for r in resultados] == [0, 1, 2, 3]
+    assert [r["ok"] for r in resultados] == [True, False, True, False]
+    assert resultados[0]["id"] < resultados[2]["id"]
+    assert "Fecha inválida" in resultados[1]["error"]
+    assert resultados[3]["error"]
+
+    # Solo los válidos quedaron guardados, y el resumen del día los suma una vez
+    resumen = cliente_alimentos.get("/resumen-diario/2026-03-10", headers=autorizacion(usuario)).json()
+    assert resumen["resumen_total"] == {"calorias": 380.0, "items": 2}
+    assert [c["nombre"] for c in resumen["consumos"]] == ["Avena", "Manzana"]
+
+
+def test_lote_sin_validos_no_escribe(cliente_alimentos, autorizacion, usuario):
+    respuesta = cliente_alimentos.post("/registrar-consumo/batch", json={"consumos": [consumo("X", fecha="mal")]},
+                                       headers=autorizacion(usuario))
+    assert respuesta.json()["registrados"] == 0
+    assert cliente_alimentos.get("/resumen-diario/2026-03-10", headers=autorizacion(usuario)).status_code == 404
+
+
+def test_insert_alimentos_del_repositorio(cliente_alimentos, autorizacion, usuario, monkeypatch):
+    pytest.importorskip("PyQt6.QtWidgets")
+    from model.registrar_alimento import api_repositorio
+
+    class Sesion:
+        def get_auth_headers(self):
+            return autorizacion(usuario)
+
+    # El repositorio habla con la API por requests: se redirige al TestClient
+    monkeypatch.setattr(api_repositorio.requests, "post",
+                        lambda url, **kwargs: cliente_alimentos.post(url.replace("http://api", ""), **kwargs))
+    repositorio = object.__new__(api_repositorio.ApiAlimentoRepository)
+    repositorio.base_url = "http://api"
+    repositorio.auth_service = Sesion()
+
+    resultados = repositorio.insert_alimentos([("Pan", "11-03-2026", "09:00", 50, 130),
+                                               ("Queso", "11-03-2026", "99:00", 20, 80)])
+    assert [r["ok"] for r in resultados] == [True, False]
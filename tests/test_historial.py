@@ -0,0 +1,62 @@
+"""GET /historial: paginación por keyset con el cursor de X-Siguiente y streaming NDJSON."""
+import json
+
+RANGO = {"fecha_desde": "2026-04-01", "fecha_hasta": "2026-04-30"}
+
+
+def registrar(cliente, encabezados, filas):
+    consumos = [{"nombre": n, "fecha": f, "hora": h, "cantidad": 100, "total_cal": 50} for n, f, h in filas]
+    respuesta = cliente.post("/registrar-consumo/batch", json={"consumos": consumos}, headers=encabezados)
+    assert respuesta.json()["rechazados"] == 0
+
+
+def test_paginas_recorren_todo_sin_repetir(cliente_alimentos, autorizacion, usuario):
+    encabezados = autorizacion(usuario)
+    # Varias filas con la misma fecha y hora: el id desempata el orden
+    registrar(cliente_alimentos, encabezados, [
+        ("A", "2026-04-02", "08:00"), ("B", "2026-04-02", "08:00"), ("C", "2026-04-02", "08:00"),
+        ("D", "2026-04-03", "12:00"), ("E", "2026-04-03", "12:00"), ("F", "2026-04-05", "07:00"),
+        ("G", "2026-04-05", "21:00"), ("Fuera de rango", "2026-05-01", "09:00"),
+    ])
+    completo = cliente_alimentos.get("/historial", params=RANGO, headers=encabezados).json()
+    assert [r["nombre"] for r in completo] == ["G", "F", "E", "D", "C", "B", "A"]
+
+    paginas, after = [], None
+    while True:
+        params = dict(RANGO, limit=3, **({"after": after} if after else {}))
+        respuesta = cliente_alimentos.get("/historial", params=params, headers=encabezados)
+        paginas.append(respuesta.json())
+        after = respuesta.headers.get("X-Siguiente")
+        if after is None:
+            break
+
+    assert [len(p) for p in paginas] == [3, 3, 1]
+    assert [r for p in paginas for r in p] == completo
+    ultimo = paginas[0][-1]
+    assert cliente_alimentos.get("/historial", params=dict(RANGO, limit=3), headers=encabezados) \
+        .headers["X-Siguiente"] == f"{ultimo['fecha']},{ultimo['hora']},{ultimo['id']}"
+
+
+def test_pagina_exacta_no_anuncia_siguiente(cliente_alimentos, autorizacion, usuario):
+    encabezados = autorizacion(usuario)
+    registrar(cliente_alimentos, encabezados, [("A", "2026-04-10", "08:00"), ("B", "2026-04-10", "09:00")])
+    respuesta = cliente_alimentos.get("/historial", params=dict(RANGO, limit=2), headers=encabezados)
+    assert len(respuesta.json()) == 2
+    assert "X-Siguiente" not in respuesta.headers
+
+
+def test_ndjson_igual_a_json(cliente_alimentos, autorizacion, usuario):
+    encabezados = autorizacion(usuario)
+    registrar(cliente_alimentos, encabezados, [("A", "2026-04-11", "08:00"), ("B", "2026-04-12", "13:30")])
+    esperado = cliente_alimentos.get("/historial", params=RANGO, headers=encabezados).json()
+
+    respuesta = cliente_alimentos.get("/historial", params=dict(RANGO, formato="ndjson"), headers=encabezados)
+    assert respuesta.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(linea) for linea in respuesta.text.splitlines() if linea] == esperado
+
+
+def test_cursor_invalido(cliente_alimentos, autorizacion, usuario):
+    encabezados = autorizacion(usuario)
+    for after in ("2026-04-01,08:00", "2026-04-01,08:00,x"):
+        respuesta = cliente_alimentos.get("/historial", params=dict(RANGO, after=after, limit=3), headers=encabezados)
+        assert respuesta.status_code == 400
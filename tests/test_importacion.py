@@ -0,0 +1,93 @@
+"""POST /importar/consumo: importación en streaming con filas rechazadas y progreso por usuario."""
+import pytest
+
+ENCABEZADO = b"nombre,fecha,hora,cantidad,total_cal\n"
+
+
+def importar(cliente, encabezados, cuerpo, **params):
+    return cliente.post("/importar/consumo", params=dict({"formato": "csv"}, **params),
+                        content=cuerpo, headers=encabezados)
+
+
+def test_fila_rechazada_no_detiene_la_importacion(cliente_alimentos, autorizacion, usuario):
+    encabezados = autorizacion(usuario)
+    csv = ENCABEZADO + (
+        "Té verde,2026-07-01,08:00,250,2\n"
+        "Sin fecha,01/07/2026,09:00,100,50\n"
+        '"Pan, integral",2026-07-01,10:30,60,150\n'
+        "Huevo,2026-07-02,07:45,50,70\n"
+    ).encode()
+    respuesta = importar(cliente_alimentos, encabezados, csv, id_importacion="lote-1", tamano_lote=1)
+    assert respuesta.status_code == 200
+    resumen = respuesta.json()
+    assert resumen["estado"] == "completada"
+    assert (resumen["procesadas"], resumen["importadas"], resumen["rechazadas"]) == (4, 3, 1)
+    assert resumen["lotes"] == 3
+    assert [e["linea"] for e in resumen["errores"]] == [3]
+    assert resumen["dias_actualizados"] == 2
+
+    historial = cliente_alimentos.get("/historial", params={"fecha_desde": "2026-07-01", "fecha_hasta": "2026-07-02"},
+                                      headers=encabezados).json()
+    assert [r["nombre"] for r in historial] == ["Huevo", "Pan, integral", "Té verde"]
+    dia = cliente_alimentos.get("/resumen-diario/2026-07-01", params={"detalle": "false"}, headers=encabezados).json()
+    assert dia["resumen_total"] == {"calorias": 152.0, "items": 2}
+
+    progreso = cliente_alimentos.get("/importar/consumo/lote-1", headers=encabezados).json()
+    assert (progreso["estado"], progreso["importadas"]) == ("completada", 3)
+
+
+def test_lineas_cortadas_entre_trozos(api_alimentos):
+    importacion = api_alimentos.ImportacionConsumo("trozos", "ana", "csv")
+    csv = ENCABEZADO + (
+        'Ñoquis,2026-07-01,13:00,300,450\n'
+        '"Sopa\nde verduras",2026-07-01,21:00,250,90\n'
+        'Mal,2026-07-01,08:00,uno,10\n'
+    ).encode()
+    # Un byte por trozo: se cortan caracteres multibyte, líneas y el campo entre comillas
+    for i in range(len(csv)):
+        importacion.procesar_trozo(csv[i:i + 1])
+    importacion.procesar_trozo(b"", final=True)
+
+    assert [fila[0] for fila in importacion.lote] == ["Ñoquis", "Sopa\nde verduras"]
+    assert importacion.progreso["errores"][0]["linea"] == 5
+
+
+def test_progreso_ajeno_no_se_ve_ni_se_pisa(cliente_alimentos, autorizacion, usuario):
+    csv = ENCABEZADO + b"Kiwi,2026-07-03,11:00,80,50\n"
+    importar(cliente_alimentos, autorizacion(usuario), csv, id_importacion="compartido")
+
+    otro = autorizacion(f"otro_{usuario}")
+    assert cliente_alimentos.get("/importar/consumo/compartido", headers=otro).status_code == 404
+    assert importar(cliente_alimentos, otro, ENCABEZADO, id_importacion="compartido").json()["importadas"] == 0
+    assert cliente_alimentos.get("/importar/consumo/compartido",
+                                 headers=autorizacion(usuario)).json()["importadas"] == 1
+
+
+def test_encabezado_incompleto(cliente_alimentos, autorizacion, usuario):
+    respuesta = importar(cliente_alimentos, autorizacion(usuario), b"nombre,fecha\nA,2026-07-04\n")
+    assert respuesta.status_code == 400
+    assert "hora" in respuesta.json()["detail"]
+
+
+def test_falla_al_recalcular_no_oculta_el_error_original(cliente_alimentos, api_alimentos, autorizacion, usuario,
+                                                         monkeypatch):
+    def reconstruir_fallido(*args):
+        raise RuntimeError("resumen no disponible")
+    monkeypatch.setattr(api_alimentos, "reconstruir_resumen_dias", reconstruir_fallido)
+    encabezados = autorizacion(usuario)
+
+    # El lote completo se confirma y recién al final se detecta un carácter UTF-8 cortado
+    cuerpo = ENCABEZADO + b"Leche,2026-07-05,08:00,200,120\n\xc3"
+    respuesta = importar(cliente_alimentos, encabezados, cuerpo, id_importacion="cortada", tamano_lote=1)
+    assert respuesta.status_code == 400
+    assert "UTF-8" in respuesta.json()["detail"]
+    progreso = cliente_alimentos.get("/importar/consumo/cortada", headers=encabezados).json()
+    assert (progreso["estado"], progreso["importadas"]) == ("fallida", 1)
+
+    # Si la importación terminó bien, el error del recálculo sí se propaga y queda en el progreso
+    with pytest.raises(RuntimeError):
+        importar(cliente_alimentos, encabezados, ENCABEZADO + b"Pera,2026-07-06,12:00,150,85\n",
+                 id_importacion="completa")
+    progreso = cliente_alimentos.get("/importar/consumo/completa", headers=encabezados).json()
+    assert progreso["estado"] == "completada"
+    assert "resumen diario" in progreso["detalle"]
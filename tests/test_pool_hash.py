@@ -0,0 +1,54 @@
+"""PoolHash: cupo acotado de hashes pendientes, rechazo con 503 y liberación al cancelar."""
+import asyncio
+import threading
+
+import pytest
+
+
+def test_saturado_y_cancelacion_liberan_cupo(api_usuarios):
+    pool = api_usuarios.PoolHash(1, 3)
+    liberar = threading.Event()
+
+    async def escenario():
+        en_curso = asyncio.create_task(pool.ejecutar("test", liberar.wait, 5))
+        en_cola = [asyncio.create_task(pool.ejecutar("test", lambda: "listo")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert pool.pendientes() == 3
+
+        with pytest.raises(api_usuarios.PoolHashSaturado) as saturado:
+            await pool.ejecutar("test", lambda: "no entra")
+        assert saturado.value.reintentar_en >= 1
+
+        # Los trabajos en espera se cancelan (cliente desconectado) y devuelven su cupo
+        for tarea in en_cola:
+            tarea.cancel()
+        await asyncio.gather(*en_cola, return_exceptions=True)
+        assert pool.pendientes() == 1
+        nuevo = asyncio.create_task(pool.ejecutar("test", lambda: "entra"))
+        await asyncio.sleep(0.05)
+        assert pool.pendientes() == 2
+
+        liberar.set()
+        assert await en_curso is True
+        assert await nuevo == "entra"
+        assert pool.pendientes() == 0
+
+    try:
+        asyncio.run(escenario())
+    finally:
+        liberar.set()
+        pool.cerrar()
+
+
+def test_registro_con_pool_saturado_responde_503(api_usuarios, cliente_usuarios, monkeypatch):
+    pool = api_usuarios.PoolHash(1, 0)
+    monkeypatch.setattr(api_usuarios, "pool_hash", pool)
+    try:
+        respuesta = cliente_usuarios.post("/register/", json={
+            "nombre_usuario": "saturado", "password": "Secreta123", "genero": "Femenino", "peso": 60,
+            "altura": 165, "meta_calorias": 2000, "nivel_actividad": "Ligero", "fecha_nacimiento": "1990-05-20",
+        })
+    finally:
+        pool.cerrar()
+    assert respuesta.status_code == 503
+    assert int(respuesta.headers["Retry-After"]) >= 1
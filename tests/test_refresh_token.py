@@ -0,0 +1,51 @@
+"""Refresh tokens: cada canje rota el token y reusar uno ya canjeado cierra toda la sesión."""
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def sesion(cliente_usuarios):
+    """Registra un usuario nuevo e inicia sesión; devuelve la respuesta de /login/."""
+    nombre = f"usuario_{uuid.uuid4().hex[:10]}"
+    registro = cliente_usuarios.post("/register/", json={
+        "nombre_usuario": nombre, "password": "Secreta123", "genero": "Masculino", "peso": 75,
+        "altura": 178, "meta_calorias": 2300, "nivel_actividad": "Ligero", "fecha_nacimiento": "1988-11-02",
+    })
+    assert registro.status_code == 201
+    login = cliente_usuarios.post("/login/", data={"username": nombre, "password": "Secreta123"})
+    assert login.status_code == 200
+    return login.json()
+
+
+def renovar(cliente, refresh_token):
+    return cliente.post("/token/refresh", json={"refresh_token": refresh_token})
+
+
+def test_canje_rota_el_par_de_tokens(cliente_usuarios, sesion):
+    respuesta = renovar(cliente_usuarios, sesion["refresh_token"])
+    assert respuesta.status_code == 200
+    nuevo = respuesta.json()
+    assert nuevo["refresh_token"] != sesion["refresh_token"]
+    assert nuevo["expires_in"] > 0
+
+    perfil = cliente_usuarios.get("/users/me/", headers={"Authorization": f"Bearer {nuevo['access_token']}"})
+    assert perfil.status_code == 200
+    # El siguiente de la cadena también se puede canjear
+    assert renovar(cliente_usuarios, nuevo["refresh_token"]).status_code == 200
+
+
+def test_reuso_revoca_la_familia(cliente_usuarios, sesion):
+    nuevo = renovar(cliente_usuarios, sesion["refresh_token"]).json()
+
+    assert renovar(cliente_usuarios, sesion["refresh_token"]).status_code == 401
+    # Tras el reuso, tampoco sirve el token emitido en la rotación legítima
+    assert renovar(cliente_usuarios, nuevo["refresh_token"]).status_code == 401
+
+
+def test_revocar_cierra_la_sesion(cliente_usuarios, sesion):
+    assert cliente_usuarios.post("/token/revoke", json={"refresh_token": sesion["refresh_token"]}).status_code == 204
+    assert renovar(cliente_usuarios, sesion["refresh_token"]).status_code == 401
+    # Un token desconocido recibe la misma respuesta
+    assert cliente_usuarios.post("/token/revoke", json={"refresh_token": "desconocido"}).status_code == 204
+    assert renovar(cliente_usuarios, "desconocido").status_code == 401
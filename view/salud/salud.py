@@ -71,9 +71,10 @@ class Salud(QWidget, BaseWidget):
 
     datos_usuario_actualizados = pyqtSignal()
 
-    def __init__(self, parent=None, usuario=None): 
+    def __init__(self, parent=None, usuario=None, auth_service=None): 
         QWidget.__init__(self, parent)  # Llama al constructor explícito de QWidget
         BaseWidget.__init__(self, parent=parent, usuario=usuario)  # Y luego el de BaseWidget
+        self.auth_service = auth_service  # Sesión de la API, para actualizar el perfil desde Peso
 
         if not usuario:
             usuario = UsuarioManager.obtener_usuario_actual()
@@ -432,7 +433,8 @@ class Salud(QWidget, BaseWidget):
         
         try:
             # Crear y mostrar la ventana de actualización de peso
-            peso_dialog = Peso(parent=self, usuario=self.usuario, callback=update_and_refresh)
+            peso_dialog = Peso(parent=self, usuario=self.usuario, callback=update_and_refresh,
+                               auth_service=self.auth_service)
             
             # Código corregido en actualizar_peso()
             peso_dialog.peso_actualizado.connect(lambda: [
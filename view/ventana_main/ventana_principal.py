@@ -20,6 +20,7 @@ from view.login.login_form import LoginForm
 from view.login.iniciar_sesion_form import IniciarSesionForm
 from view.login.registro_form import RegistroForm
 from model.login.auth_service import ApiService
+from model.util.escucha_eventos import EscuchaEventos
 # Se elimina la importación de 'UserDatabase' y 'DBManager' que manejaban DB locales
 from view.agregar_alimento.agregar_alimento import Agregar_Alimento
 from controller.registrar_alimento.registrar_alimento import RegistroAlimentoPyQt6
@@ -187,13 +188,14 @@ class MainWindow(QMainWindow):
         self.stacked_widget.setStyleSheet("background-color: #3c3c3c;")
         
         self.welcome_screen = WelcomeScreen()
-        self.registrar_alimento = RegistroAlimentoPyQt6(usuario=self.current_user)
+        self.registrar_alimento = RegistroAlimentoPyQt6(usuario=self.current_user, auth_service=self.login_screen.auth_service)
         self.agregar_alimento = Agregar_Alimento(panel_principal=self.stacked_widget, color="#3c3c3c", usuario=self.current_user)
-        self.data_manager = ChartDataManager(username=self.current_user)
+        self.data_manager = ChartDataManager(username=self.current_user, auth_service=self.login_screen.auth_service)
         self.graficos_view = GraficoView(data_provider=self.data_manager)
-        self.historial = Historial(panel_principal=self.stacked_widget, color="#3c3c3c", usuario=self.current_user)
-        self.settings = ConfigUI(self, "#3c3c3c", self.current_user)
-        self.salud = Salud()
+        self.historial = Historial(panel_principal=self.stacked_widget, color="#3c3c3c", usuario=self.current_user,
+                                   auth_service=self.login_screen.auth_service)
+        self.settings = ConfigUI(self, "#3c3c3c", self.current_user, auth_service=self.login_screen.auth_service)
+        self.salud = Salud(auth_service=self.login_screen.auth_service)
         self.menu = Menu()
         
         self.stacked_widget.addWidget(self.welcome_screen)
@@ -217,9 +219,7 @@ class MainWindow(QMainWindow):
             self.agregar_alimento.catalogo_alimentos_actualizado.connect(self.registrar_alimento.refrescar_lista_alimentos)
             print("CONEXIÓN CREADA: Agregar Alimento -> Registrar Alimento (ComboBox)")
         if hasattr(self.registrar_alimento, 'consumo_diario_actualizado'):
-            if hasattr(self.historial, 'refrescar_vista'):
-                self.registrar_alimento.consumo_diario_actualizado.connect(self.historial.refrescar_vista)
-                print("CONEXIÓN CREADA: Registrar Alimento -> Historial")
+            # El Historial ya no recarga el año completo con cada registro: se entera por /eventos (abajo)
             if hasattr(self.salud, 'refrescar_vista'):
                 self.registrar_alimento.consumo_diario_actualizado.connect(self.salud.refrescar_vista)
                 print("CONEXIÓN CREADA: Registrar Alimento -> Salud")
@@ -229,6 +229,26 @@ class MainWindow(QMainWindow):
         if hasattr(self.salud, 'datos_usuario_actualizados') and hasattr(self.settings, 'refrescar_vista'):
             self.salud.datos_usuario_actualizados.connect(self.settings.refrescar_vista)
             print("CONEXIÓN CREADA: Salud -> Configuración")
+        self.conectar_eventos_api()
+
+    def conectar_eventos_api(self):
+        """
+        Escucha los cambios que publica la API de alimentos (/eventos) para que cada vista
+        actualice solo lo que cambió, también cuando el cambio viene de otro cliente.
+        """
+        self.detener_eventos_api()
+        self.eventos_api = EscuchaEventos(self.login_screen.auth_service)
+        self.eventos_api.dias_modificados.connect(self.historial.actualizar_dias)
+        self.eventos_api.resincronizar.connect(self.historial.refrescar_vista)
+        self.eventos_api.hoy_modificado.connect(self.registrar_alimento.update_initial_info)
+        self.eventos_api.catalogo_modificado.connect(lambda _nombre: self.registrar_alimento.refrescar_lista_alimentos())
+        self.eventos_api.start()
+        print("CONEXIÓN CREADA: API de alimentos (/eventos) -> Historial, Registrar Alimento")
+
+    def detener_eventos_api(self):
+        if getattr(self, 'eventos_api', None) is not None:
+            self.eventos_api.detener()
+            self.eventos_api = None
 
     def create_header(self):
         """Crear la barra superior"""
@@ -288,6 +308,9 @@ class MainWindow(QMainWindow):
         self.current_user = None
         if hasattr(self, 'timer'):
             self.timer.stop()
+        self.detener_eventos_api()
+        if hasattr(self, 'historial'):
+            self.historial.detener_carga()
         
         if hasattr(self.login_screen, 'auth_service'):
             # Se actualiza la llamada al nuevo método 'logout'
@@ -316,4 +339,7 @@ class MainWindow(QMainWindow):
         """Manejar el cierre de la aplicación"""
         if hasattr(self, 'timer'):
             self.timer.stop()
+        self.detener_eventos_api()
+        if hasattr(self, 'historial'):
+            self.historial.detener_carga()
         event.accept()
\ No newline at end of file